@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+压缩格式基准测试
+
+对 EPG 和一份生成的播放列表分别用各压缩格式/级别压缩，比较压缩后大小、
+压缩耗时和解压耗时，作为 package_artifacts 选择参数的依据。
+未安装 zopfli / zstandard 时跳过对应的行。
+
+用法: python scripts/bench_codecs.py [--epg FILE] [--playlist FILE] [--quick]
+"""
+
+import argparse
+import gzip
+import lzma
+import time
+
+from epg_stream import EPG_FILE
+from package_artifacts import zopfli_gzip, zstandard
+
+
+def candidates(quick=False):
+    """[(名称, 压缩函数, 解压函数)]；quick 时去掉耗时最长的几种"""
+    rows = [
+        ('gzip -6', lambda data: gzip.compress(data, 6, mtime=0), gzip.decompress),
+        ('gzip -9', lambda data: gzip.compress(data, 9, mtime=0), gzip.decompress),
+    ]
+    if zopfli_gzip is not None and not quick:
+        rows.append(('zopfli x1', lambda data: zopfli_gzip.compress(data, numiterations=1), gzip.decompress))
+    rows.append(('xz -6', lambda data: lzma.compress(data, preset=6), lzma.decompress))
+    if not quick:
+        rows.append(('xz -9e', lambda data: lzma.compress(data, preset=9 | lzma.PRESET_EXTREME),
+                     lzma.decompress))
+    if zstandard is not None:
+        for level in (3, 19):
+            rows.append((f'zstd -{level}', zstandard.ZstdCompressor(level=level).compress,
+                         zstandard.ZstdDecompressor().decompress))
+    return rows
+
+
+def measure(data, quick=False):
+    print(f"{'格式':<12}{'大小(字节)':>14}{'压缩比':>10}{'压缩(ms)':>12}{'解压(ms)':>12}")
+    for name, compress, decompress in candidates(quick):
+        start = time.perf_counter()
+        packed = compress(data)
+        compress_time = time.perf_counter() - start
+        start = time.perf_counter()
+        assert decompress(packed) == data, f"{name}: 解压结果不一致"
+        decompress_time = time.perf_counter() - start
+        print(f"{name:<12}{len(packed):>14}{len(packed) / len(data):>10.3f}"
+              f"{compress_time * 1000:>12.0f}{decompress_time * 1000:>12.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="压缩格式基准测试")
+    parser.add_argument('--epg', default=EPG_FILE, help="EPG 文件（.gz）")
+    parser.add_argument('--playlist', default='SDM-Unicast/SDM-Unicast-Jinan.m3u', help="播放列表")
+    parser.add_argument('--quick', action='store_true', help="跳过 zopfli 和 xz -9e")
+    args = parser.parse_args()
+
+    with gzip.open(args.epg, 'rb') as f:
+        epg = f.read()
+    with open(args.playlist, 'rb') as f:
+        playlist = f.read()
+    print(f"{args.epg} 解压后 {len(epg)} 字节")
+    measure(epg, args.quick)
+    print(f"\n{args.playlist} {len(playlist)} 字节")
+    measure(playlist, args.quick)
+
+
+if __name__ == "__main__":
+    main()
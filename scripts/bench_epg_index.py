@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+epg_index 基准测试
+
+比较三种方式回答"某频道某时刻在播什么"：
+  iterparse   每次查询都流式扫描整个 EPG（不建索引的做法）
+  构建索引    build_index 一次（与一遍纯 iterparse 的耗时对比）
+  mmap 索引   打开 ProgrammeIndex 后二分查找
+
+用法: python scripts/bench_epg_index.py [--epg FILE] [--queries N]
+"""
+
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from epg_index import ProgrammeIndex, build_index
+from epg_stream import CHANNEL, EPG_FILE, EPGReader, parse_time
+
+
+def plain_iterparse(epg_file):
+    """只读一遍 EPG 不做任何处理，作为构建耗时的基线"""
+    return sum(1 for _ in EPGReader(epg_file))
+
+
+def scan_at(epg_file, channel_id, when):
+    """不用索引：扫描 EPG 找 channel_id 在 when 播出的节目标题"""
+    for elem in EPGReader(epg_file):
+        if elem.tag == CHANNEL or elem.get('channel') != channel_id:
+            continue
+        start = parse_time(elem.get('start'))
+        stop = parse_time(elem.get('stop'))
+        if start is not None and stop is not None and start <= when < stop:
+            title = elem.find('title')
+            return (title.text or '').strip() if title is not None else ''
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="epg_index 基准测试")
+    parser.add_argument('--epg', default=EPG_FILE, help="EPG 文件")
+    parser.add_argument('--queries', type=int, default=10000, help="索引查询次数")
+    parser.add_argument('--scans', type=int, default=3, help="iterparse 扫描查询次数")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        index_file = os.path.join(directory, 'sggc.idx')
+
+        start = time.perf_counter()
+        elements = plain_iterparse(args.epg)
+        parse_time_spent = time.perf_counter() - start
+
+        start = time.perf_counter()
+        channels, programmes, size = build_index(args.epg, index_file)
+        build_time = time.perf_counter() - start
+
+        with ProgrammeIndex(index_file) as index:
+            rng = random.Random(0)
+            names = index.channels()
+            spans = {}
+            for name in names:
+                schedule = index.between(name, 0, 2 ** 62)
+                if schedule:
+                    spans[name] = (schedule[0].start, schedule[-1].stop)
+            names = sorted(spans)
+            queries = []
+            for _ in range(args.queries):
+                name = rng.choice(names)
+                queries.append((name, rng.randrange(*spans[name])))
+
+            start = time.perf_counter()
+            results = [index.at(name, when) for name, when in queries]
+            query_time = time.perf_counter() - start
+
+            start = time.perf_counter()
+            scanned = [scan_at(args.epg, name, when) for name, when in queries[:args.scans]]
+            scan_time = time.perf_counter() - start
+
+    for programme, title in zip(results, scanned):
+        assert (programme.title if programme else None) == title, "结果不一致"
+
+    print(f"EPG: {elements} 个元素；索引: {channels} 个频道, {programmes} 个节目, {size} 字节")
+    print(f"{'操作':<24}{'耗时(ms)':>14}")
+    print(f"{'纯 iterparse 一遍':<24}{parse_time_spent * 1000:>14.1f}")
+    print(f"{'构建索引':<24}{build_time * 1000:>14.1f}")
+    print(f"{'iterparse 扫描 / 次':<24}{scan_time / len(scanned) * 1000:>14.1f}")
+    print(f"{'mmap 索引查询 / 次':<24}{query_time / len(queries) * 1000:>14.4f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+m3u_parser 基准测试
+
+1. 在仓库内所有 .m3u 文件上，校验新解析器与旧解析器的结果一致
+2. 把所有播放列表拼接放大到数万个频道，比较耗时与内存峰值
+
+用法: python scripts/bench_m3u_parser.py [--repeat N] [--scale N]
+"""
+
+import argparse
+import glob
+import io
+import re
+import time
+import tracemalloc
+
+from m3u_parser import iter_m3u, tokenize_extinf
+
+# 每个频道的字段被读取的轮数（对应 17 个城市）
+CITY_ROUNDS = 17
+
+# ==================== 旧解析器（仅用于对比） ====================
+
+def legacy_processor_parse(content):
+    """process_unicast / process_multicast 中的旧 parse_m3u"""
+    channels = []
+    lines = content.split('\n')
+    current_channel = {}
+
+    def extract_channel_name(extinf_line):
+        match = re.search(r',([^,]+)$', extinf_line)
+        return match.group(1).strip() if match else ""
+
+    def extract_tvg_attribute(extinf_line, attribute_name):
+        match = re.search(f'{attribute_name}="([^"]*)"', extinf_line)
+        return match.group(1) if match else ""
+
+    for line in lines:
+        line = line.strip()
+        if not line or line.startswith('#EXTM3U'):
+            continue
+        if line.startswith('#EXTINF:'):
+            current_channel = {
+                'extinf': line,
+                'url': None,
+                'name': extract_channel_name(line),
+                'tvg_name': extract_tvg_attribute(line, 'tvg-name'),
+                'group_title': extract_tvg_attribute(line, 'group-title'),
+            }
+        elif not line.startswith('#') and current_channel:
+            current_channel['url'] = line
+            channels.append(current_channel)
+            current_channel = {}
+    return channels
+
+
+def legacy_generator_parse(content):
+    """generate_sdt_unicast / generate_sdm_unicast / generate_sdu_multicast 中的旧 parse_m3u"""
+    channels = []
+    pattern = r'#EXTINF:-1 (.*?),(.*?)\n(.*?)(?=\n#EXTINF|$)'
+    for match in re.findall(pattern, content, re.DOTALL):
+        extinf_attrs = match[0]
+        channel_name = match[1].strip()
+        stream_url = match[2].strip()
+        group_match = re.search(r'group-title="([^"]*)"', extinf_attrs)
+        channels.append({
+            "name": channel_name,
+            "url": stream_url,
+            "extinf": f"#EXTINF:-1 {extinf_attrs},{channel_name}",
+            "group": group_match.group(1) if group_match else "",
+        })
+    return channels
+
+
+def legacy_extract_fields(lines):
+    """旧做法：每次读取都单独跑 re.search（generate_sdu_multicast 每个城市都重新提取名称）"""
+    for line in lines:
+        for _ in range(CITY_ROUNDS):
+            re.search(r',(.+)$', line)
+            re.search('tvg-name="([^"]*)"', line)
+            re.search('group-title="([^"]*)"', line)
+
+# ==============================================================
+
+
+def tokenize_fields(lines):
+    """新做法：一次扫描得到全部属性和名称，之后的读取都走缓存的属性表"""
+    for line in lines:
+        attrs, name, _ = tokenize_extinf(line)
+        for _ in range(CITY_ROUNDS):
+            name
+            attrs.get('tvg-name')
+            attrs.get('group-title')
+
+
+def as_processor_record(ch):
+    return {
+        'extinf': ch.extinf,
+        'url': ch.url,
+        'name': ch.name,
+        'tvg_name': ch.tvg_name,
+        'group_title': ch.group_title,
+    }
+
+
+def as_generator_record(ch):
+    return {
+        "name": ch.name,
+        "url": ch.url,
+        "extinf": ch.canonical_extinf,
+        "group": ch.group_title,
+    }
+
+
+def normalize_legacy_generator(record):
+    """旧正则会把 URL 之后的注释行（如 "# 地方台开始"）一并吞进 url，只比较第一行"""
+    record = dict(record)
+    record["url"] = record["url"].split('\n', 1)[0].strip()
+    return record
+
+
+def verify(files):
+    """逐个文件比较新旧解析结果，返回不一致的文件列表"""
+    mismatches = []
+    for path in files:
+        with open(path, 'r', encoding='utf-8') as f:
+            content = f.read()
+        new_records = list(iter_m3u(content))
+
+        old = legacy_processor_parse(content)
+        new = [as_processor_record(ch) for ch in new_records]
+        if old != new:
+            mismatches.append((path, 'processor'))
+
+        old = [normalize_legacy_generator(r) for r in legacy_generator_parse(content)]
+        new = [as_generator_record(ch) for ch in new_records if ch.extinf.startswith('#EXTINF:-1 ')]
+        if old != new:
+            mismatches.append((path, 'generator'))
+    return mismatches
+
+
+def measure(func, content, repeat):
+    """返回 (最佳耗时秒, 内存峰值字节)"""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(content)
+        best = min(best, time.perf_counter() - start)
+    tracemalloc.start()
+    func(content)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return best, peak
+
+
+def touch(ch):
+    """访问旧解析器会预先提取的字段，保证对比的工作量相同"""
+    return ch.name, ch.tvg_name, ch.group_title
+
+
+def parse_to_list(content):
+    """新解析器：保留全部记录（对应 processor 需要排序的场景）"""
+    channels = list(iter_m3u(content))
+    for ch in channels:
+        touch(ch)
+    return channels
+
+
+def stream_count(data):
+    """新解析器：从字节流逐个读取，不保留记录"""
+    count = 0
+    for ch in iter_m3u(io.BytesIO(data)):
+        touch(ch)
+        count += 1
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description="m3u_parser 基准测试")
+    parser.add_argument('--repeat', type=int, default=3, help="每项重复次数，取最优")
+    parser.add_argument('--scale', type=int, default=3, help="拼接放大倍数")
+    args = parser.parse_args()
+
+    files = sorted(set(glob.glob('*.m3u') + glob.glob('*/*.m3u') + glob.glob('.github/expand/*.m3u')))
+    print(f"校验 {len(files)} 个播放列表...")
+    mismatches = verify(files)
+    if mismatches:
+        for path, kind in mismatches:
+            print(f"  不一致: {path} ({kind})")
+    else:
+        print("  全部一致")
+
+    parts = []
+    for path in files:
+        with open(path, 'r', encoding='utf-8') as f:
+            parts.append(f.read())
+    content = '\n'.join(parts * args.scale)
+    data = content.encode('utf-8')
+    total = stream_count(data)
+    print(f"\n放大后的播放列表: {len(data) / 1024 / 1024:.1f} MB, {total} 个频道\n")
+
+    rows = [
+        ("旧 processor 解析", lambda c: legacy_processor_parse(c), content),
+        ("旧 generator 正则解析", lambda c: legacy_generator_parse(c), content),
+        ("新解析器 (list)", parse_to_list, content),
+        ("新解析器 (流式)", stream_count, data),
+    ]
+    extinf_lines = [line.strip() for line in content.split('\n') if line.startswith('#EXTINF:')]
+    rows += [
+        (f"旧 EXTINF 正则 x{CITY_ROUNDS}", legacy_extract_fields, extinf_lines),
+        (f"新 tokenize_extinf x{CITY_ROUNDS}", tokenize_fields, extinf_lines),
+    ]
+    baseline = None
+    print(f"{'解析方式':<24}{'耗时(ms)':>12}{'内存峰值(MB)':>16}{'加速比':>10}")
+    for label, func, payload in rows:
+        elapsed, peak = measure(func, payload, args.repeat)
+        if baseline is None:
+            baseline = elapsed
+        print(f"{label:<24}{elapsed * 1000:>12.1f}{peak / 1024 / 1024:>16.2f}{baseline / elapsed:>10.2f}x")
+
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    exit(main())
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+rule_engine 基准测试
+
+处理脚本原来按规则逐条调用 find_channel_index / find_all_channel_indices，
+每次都把全部频道和全部模式比一遍，移动再用 pop/insert 挪动列表，
+播放列表越长每个频道的代价越高。RulePlan 把规则编译成精确名称字典和
+一个 Aho-Corasick 自动机，一次遍历完成全部规则，附加槽位使移动/复制为 O(1)。
+
+这里把仓库内的源播放列表放大若干倍，并把规则表重复若干份，比较两种实现
+每个频道的平均耗时。旧实现每个频道的代价与规则数成正比；RulePlan 基本只
+取决于频道名称的长度，规则越多差距越大。现有的 4 条规则下两者相差不大。
+只比较耗时，放大后的列表中目标频道重复出现，两种实现的输出顺序不保证相同。
+
+用法: python scripts/bench_rule_plan.py [--scales 1,4,16] [--rules 1,8,32] [--repeat N]
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import time
+
+from m3u_parser import iter_m3u_file
+from rule_engine import RulePlan
+
+RULES_FILE = "scripts/playlist_rules.json"
+
+PLAYLISTS = ["SDT-Unicast.m3u", "SDM-Unicast.m3u", "SDU-Multicast.m3u"]
+
+# ==================== 旧实现（仅用于对比） ====================
+
+def _matches(channel, patterns, kind):
+    if kind == 'exact':
+        return any(pattern == channel.name for pattern in patterns)
+    return any(pattern in channel.name for pattern in patterns)
+
+
+def find_channel_index(channels, patterns, kind):
+    for i, channel in enumerate(channels):
+        if _matches(channel, patterns, kind):
+            return i
+    return -1
+
+
+def find_all_channel_indices(channels, patterns, kind):
+    return [i for i, channel in enumerate(channels) if _matches(channel, patterns, kind)]
+
+
+def legacy_apply(plan, channels):
+    """process_unicast / process_multicast 中逐条规则线性查找、pop/insert 移动的写法"""
+    channels = list(channels)
+    for rule in plan.rules:
+        indices = find_all_channel_indices(channels, rule.source_patterns, rule.source_kind)
+        if rule.first:
+            indices = indices[:1]
+        if not indices:
+            continue
+        if rule.action == 'regroup':
+            for i in indices:
+                channels[i].set_attr('group-title', rule.group)
+        elif rule.action == 'move_to_end':
+            moved = [channels.pop(i) for i in sorted(indices, reverse=True)]
+            channels.extend(reversed(moved))
+        else:
+            target = find_channel_index(channels, rule.target_patterns, rule.target_kind)
+            if target == -1:
+                continue
+            if rule.action == 'copy_after':
+                items = [channels[i].copy() for i in indices]
+            else:
+                items = []
+                for i in sorted(indices, reverse=True):
+                    items.insert(0, channels.pop(i))
+                target = find_channel_index(channels, rule.target_patterns, rule.target_kind)
+            for offset, item in enumerate(items):
+                channels.insert(target + 1 + offset, item)
+    return channels
+
+
+# ==================== 基准 ====================
+
+def load_channels():
+    channels = []
+    for path in PLAYLISTS:
+        if os.path.exists(path):
+            channels.extend(iter_m3u_file(path))
+    return channels
+
+
+def best_time(func, channels, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        # 每轮使用新副本，regroup 会修改频道
+        copies = [channel.copy() for channel in channels]
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            func(copies)
+            best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="RulePlan 与逐条线性查找的耗时对比")
+    parser.add_argument('--scales', default='1,4,16', help="播放列表放大倍数，逗号分隔")
+    parser.add_argument('--rules', default='1,8,32', help="规则表重复份数，逗号分隔")
+    parser.add_argument('--repeat', type=int, default=3, help="每个规模重复次数，取最好成绩")
+    args = parser.parse_args()
+
+    with open(RULES_FILE, 'r', encoding='utf-8') as f:
+        specs = json.load(f).get('rules', [])
+    base = load_channels()
+    print(f"{len(base)} 个频道, {len(specs)} 条规则")
+    print(f"{'频道数':>8} {'规则数':>6} {'RulePlan(ms)':>14} {'每频道(us)':>12} {'旧实现(ms)':>12} {'每频道(us)':>12}")
+    for copies in (int(s) for s in args.rules.split(',')):
+        plan = RulePlan(specs * copies)
+        for scale in (int(s) for s in args.scales.split(',')):
+            channels = base * scale
+            new = best_time(plan.apply, channels, args.repeat)
+            old = best_time(lambda chs: legacy_apply(plan, chs), channels, args.repeat)
+            n = len(channels)
+            print(f"{n:>8} {len(plan.rules):>6} {new * 1e3:>14.1f} {new / n * 1e6:>12.2f} "
+                  f"{old * 1e3:>12.1f} {old / n * 1e6:>12.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+分城市生成器的构建清单
+
+每个输出目录在 .data/ 下有一个清单文件，记录目录中每个输出文件的
+输入摘要（源播放列表内容 + 该城市的规则/频道配置 + 生成器版本）
+和输出摘要。再次生成时只重建输入摘要变化、文件缺失或被改动的城市，
+其余文件保持不动，不再整体删除目录后重写全部文件；重建出的内容与
+磁盘上相同时也不重写。
+
+写入使用同目录临时文件 + os.replace，中途失败不会留下半个文件。
+
+publish_outputs 用于不在分城市目录中的单个输出（如合并后的播放列表）：
+调用方先算出新内容的摘要，只有与磁盘上的内容不同时才写文件。
+"""
+
+import gzip
+import hashlib
+import json
+import os
+import tempfile
+
+STATE_DIR = ".data"
+
+
+def content_digest(data):
+    """内容摘要 (MD5)，与 http_cache.content_digest 相同；生成器不依赖 requests"""
+    if isinstance(data, str):
+        data = data.encode('utf-8')
+    return hashlib.md5(data).hexdigest()
+
+
+def atomic_write(path, content):
+    """先写同目录临时文件再改名替换，content 为 str 时按 UTF-8 编码"""
+    if isinstance(content, str):
+        content = content.encode('utf-8')
+    directory = os.path.dirname(path) or '.'
+    os.makedirs(directory, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix='.' + os.path.basename(path), suffix='.tmp')
+    try:
+        # mkstemp 创建的文件权限为 0600，改回普通文件的权限
+        os.chmod(temp_path, 0o644)
+        with os.fdopen(fd, 'wb') as f:
+            f.write(content)
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def write_if_changed(path, content):
+    """内容与磁盘上的文件不同时原子写入，返回是否写入"""
+    if isinstance(content, str):
+        content = content.encode('utf-8')
+    if os.path.isfile(path):
+        with open(path, 'rb') as f:
+            if f.read() == content:
+                return False
+    atomic_write(path, content)
+    return True
+
+
+def file_digest(path):
+    """文件内容摘要；文件不存在时返回空串"""
+    if not os.path.isfile(path):
+        return ""
+    with open(path, 'rb') as f:
+        return content_digest(f.read())
+
+
+def gzip_content_digest(path):
+    """.gz 文件解压后内容的摘要（与 content_digest 相同），分块计算，不把整个文件读入内存"""
+    h = hashlib.md5()
+    with gzip.open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def build_digest(version, source_digest, config):
+    """输出文件的输入摘要；config 为可 JSON 序列化的城市配置"""
+    h = hashlib.sha256()
+    h.update(f"version:{version}\n".encode('utf-8'))
+    h.update(f"source:{source_digest}\n".encode('utf-8'))
+    h.update(json.dumps(config, ensure_ascii=False, sort_keys=True).encode('utf-8'))
+    return h.hexdigest()
+
+
+class BuildManifest:
+    """
+    一个输出目录的构建清单
+
+    entries: {输出文件名: {"input": 输入摘要, "output": 输出内容摘要}}
+    """
+
+    def __init__(self, output_dir, state_dir=STATE_DIR, name=None):
+        self.output_dir = str(output_dir)
+        # 清单文件名默认取输出目录名；同名目录（如 EPG/SDU-Multicast）需另取名字
+        name = name or os.path.basename(os.path.normpath(self.output_dir))
+        self.path = os.path.join(state_dir, f"build_{name}.json")
+        self.entries = self._load()
+        self.written = []
+        self.unchanged = []
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"警告: 构建清单 {self.path} 无法读取，将重新生成全部文件: {e}")
+            return {}
+
+    def is_current(self, filename, digest):
+        """输入摘要与记录相同，且磁盘上的文件与上次写出的内容一致"""
+        entry = self.entries.get(filename)
+        if not entry or entry.get('input') != digest:
+            return False
+        return file_digest(os.path.join(self.output_dir, filename)) == entry.get('output')
+
+    def write(self, filename, digest, content):
+        """
+        登记摘要，内容与磁盘上的文件不同时才原子写入；
+        输入变了但生成结果相同时文件保持不动，计为未变化；返回是否写入
+        """
+        written = write_if_changed(os.path.join(self.output_dir, filename), content)
+        (self.written if written else self.unchanged).append(filename)
+        self.entries[filename] = {'input': digest, 'output': content_digest(content)}
+        return written
+
+    def keep(self, filename):
+        """登记本次跳过的文件"""
+        self.unchanged.append(filename)
+
+    def adopt(self, filename, digest):
+        """把磁盘上已有的文件登记为该输入摘要的输出（内容等价、无需重写时使用）"""
+        self.entries[filename] = {'input': digest,
+                                  'output': file_digest(os.path.join(self.output_dir, filename))}
+        self.unchanged.append(filename)
+
+    def prune(self):
+        """删除输出目录中本次既未写出也未跳过的旧文件，并移出清单"""
+        expected = set(self.written) | set(self.unchanged)
+        removed = []
+        if os.path.isdir(self.output_dir):
+            for filename in sorted(os.listdir(self.output_dir)):
+                path = os.path.join(self.output_dir, filename)
+                if filename not in expected and os.path.isfile(path):
+                    os.remove(path)
+                    removed.append(filename)
+        for filename in list(self.entries):
+            if filename not in expected:
+                del self.entries[filename]
+        return removed
+
+    def save(self):
+        content = json.dumps(self.entries, ensure_ascii=False, indent=2, sort_keys=True) + '\n'
+        atomic_write(self.path, content)
+
+    def finish(self):
+        """清理旧文件、保存清单并打印汇总"""
+        removed = self.prune()
+        self.save()
+        print(f"{self.output_dir}: 重新生成 {len(self.written)} 个，"
+              f"未变化 {len(self.unchanged)} 个，删除 {len(removed)} 个")
+        for filename in removed:
+            print(f"  - 已删除: {filename}")
+
+
+def publish_outputs(outputs):
+    """
+    按内容摘要判断是否需要写出的一组输出文件（如合并后的播放列表）
+    outputs: {路径: (新内容摘要, write)}，write(临时路径) 负责写出新内容
+    只写出与磁盘上内容摘要不同的文件（先写同目录临时文件再改名），返回写出的路径列表
+
+    磁盘上的摘要每次都读取文件重新计算：这些文件都不大，而任何记录
+    都可能被不提交 .data/ 的工作流留成过期状态。
+    """
+    written = []
+    for path, (digest, write) in outputs.items():
+        if os.path.isfile(path) and file_digest(path) == digest:
+            continue
+        directory = os.path.dirname(path) or '.'
+        os.makedirs(directory, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=directory, prefix='.' + os.path.basename(path), suffix='.tmp')
+        os.close(fd)
+        try:
+            os.chmod(temp_path, 0o644)
+            write(temp_path)
+            os.replace(temp_path, path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        written.append(path)
+    return written
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+分城市播放列表的共享片段
+
+SDT / SDM 生成器为每个城市输出同一份频道列表，区别只在于部分频道的
+group-title 被改写为"山东频道"或"县级频道"。这里先把每个频道的三种写法
+（原样、山东频道、县级频道）各渲染一次为 UTF-8 字节片段，每个城市只需按
+频道归属挑选片段并拼接，不再对每个城市的每个频道重复做正则替换和编码。
+EXTINF 行的其他改写（如 logo_assets 的台标地址）也在渲染时一并完成。
+"""
+
+import re
+
+SHANDONG_GROUP = "山东频道"
+COUNTY_GROUP = "县级频道"
+
+_GROUP_TITLE_PATTERN = re.compile(r'group-title="[^"]*"')
+
+
+def _segment(extinf, url):
+    """一个频道在输出文件中的字节片段，包含前导换行"""
+    return f"\n{extinf}\n{url}".encode('utf-8')
+
+
+def _regroup(extinf, group):
+    return _GROUP_TITLE_PATTERN.sub(f'group-title="{group}"', extinf)
+
+
+class ChannelSegments:
+    """一个频道预先渲染好的三种写法"""
+
+    __slots__ = ('name', 'group', 'original', 'shandong', 'county')
+
+    def __init__(self, channel, rewrite=None):
+        extinf = channel.canonical_extinf
+        if rewrite is not None:
+            extinf = rewrite(extinf)
+        self.name = channel.name
+        self.group = channel.group_title
+        self.original = _segment(extinf, channel.url)
+        self.shandong = _segment(_regroup(extinf, SHANDONG_GROUP), channel.url)
+        self.county = _segment(_regroup(extinf, COUNTY_GROUP), channel.url)
+
+
+def prerender(channels, rewrite=None):
+    """把频道列表渲染为片段列表，所有城市共用；rewrite 为 EXTINF 行的改写函数（可选）"""
+    return [ChannelSegments(ch, rewrite) for ch in channels]
+
+
+def render_city(segments, header, city, city_channel_names, city_names):
+    """
+    拼接一个城市的输出文件
+
+    city_channel_names 中的频道（本市市级和县级）→ 山东频道；
+    group-title 为其他城市名的频道（外市县级）→ 县级频道；其余保持原样。
+    返回 (文件字节, 本地频道数, 县级频道数, 其他频道数)。
+    """
+    parts = [header.encode('utf-8')]
+    append = parts.append
+    local_count = county_count = 0
+    for seg in segments:
+        if seg.name in city_channel_names:
+            append(seg.shandong)
+            local_count += 1
+        elif seg.group in city_names and seg.group != city:
+            append(seg.county)
+            county_count += 1
+        else:
+            append(seg.original)
+    other_count = len(segments) - local_count - county_count
+    return b"".join(parts), local_count, county_count, other_count
@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+EPG 频道别名索引
+
+EPG 中每个 <channel> 带有多个 display-name（CCTV1、CCTV-1、CCTV-1综合、
+CCTV1HD ...），播放列表的 tvg-name 则沿用上游源的写法。这里把 EPG 的
+频道 id 和全部 display-name 规范化后建成一个字典：
+
+  - 全角字符转半角（NFKC），字母统一大写
+  - 去掉空白、连字符、下划线、间隔号
+  - 去掉末尾的清晰度标记（HD、高清 等）和"频道"
+
+播放列表中的每个频道先按原名精确查找，再按规范化后的名字查找，
+各只需一次字典查询；annotate 据此为频道批量写入 tvg-id。
+
+用法（在仓库根目录）:
+  python scripts/epg_alias.py [播放列表 ...]     # 报告 EPG 中找不到的频道
+"""
+
+import argparse
+import hashlib
+import os
+import re
+import unicodedata
+
+from build_manifest import file_digest
+from epg_stream import CHANNEL, EPG_FILE, EPGReader, channel_aliases
+from m3u_parser import Channel, iter_m3u_file
+
+# 规范化时忽略的分隔符（NFKC 之后全角符号已变为半角）
+_SEPARATOR_PATTERN = re.compile(r'[\s\-_·・]+')
+# 名字末尾可以忽略的后缀；4K、超高清 表示不同的频道，不在其中
+IGNORED_SUFFIXES = ('FHD', 'HD', '高清', '标清', '频道')
+ULTRA_HD = '超高清'
+
+DEFAULT_PLAYLISTS = ["SDU-Multicast.m3u", "SDU-Unicast.m3u", "SDT-Unicast.m3u", "SDM-Unicast.m3u"]
+
+
+def normalize_name(name):
+    """频道名的规范形式，用于忽略写法差异的匹配"""
+    key = _SEPARATOR_PATTERN.sub('', unicodedata.normalize('NFKC', name).upper())
+    stripped = True
+    while stripped and not key.endswith(ULTRA_HD):
+        stripped = False
+        for suffix in IGNORED_SUFFIXES:
+            if key.endswith(suffix) and len(key) > len(suffix):
+                key = key[:-len(suffix)]
+                stripped = True
+    return key
+
+
+class AliasIndex:
+    """EPG 别名 -> 频道 id；同一个名字对应多个频道时以 EPG 中先出现的为准"""
+
+    def __init__(self, channels=()):
+        """channels: [(频道 id, [别名 ...])]，按 EPG 中的顺序"""
+        self.exact = {}
+        self.normalized = {}
+        # 规范化后对应多个频道的名字 -> 全部频道 id
+        self.ambiguous = {}
+        self.channel_ids = set()
+        # 由频道 id 本身登记的键，不会被其他频道的 display-name 占用
+        self._pinned_exact = set()
+        self._pinned_normalized = set()
+        for channel_id, aliases in channels:
+            self.add(channel_id, aliases)
+
+    def __len__(self):
+        return len(self.channel_ids)
+
+    @staticmethod
+    def _claim(table, pinned_keys, key, channel_id, pin):
+        """登记 key -> channel_id，返回原来的归属（没有时为 None）"""
+        owner = table.get(key)
+        if owner is None or (pin and key not in pinned_keys):
+            table[key] = channel_id
+            if pin:
+                pinned_keys.add(key)
+        return owner
+
+    def add(self, channel_id, aliases):
+        """登记一个频道；EPG 中常有别名同时出现在两个频道下（如 山东卫视 与 山东卫视4K），
+        此时与频道 id 相同的别名归该频道，其余以先出现的为准"""
+        self.channel_ids.add(channel_id)
+        for alias in aliases:
+            pin = alias == channel_id
+            self._claim(self.exact, self._pinned_exact, alias, channel_id, pin)
+            key = normalize_name(alias)
+            owner = self._claim(self.normalized, self._pinned_normalized, key, channel_id, pin)
+            if owner is not None and owner != channel_id:
+                candidates = self.ambiguous.setdefault(key, [owner])
+                if channel_id not in candidates:
+                    candidates.append(channel_id)
+
+    @classmethod
+    def from_epg(cls, epg_file=EPG_FILE):
+        """流式读取 EPG，只用到其中的 <channel>"""
+        index = cls()
+        for elem in EPGReader(epg_file):
+            if elem.tag == CHANNEL and elem.get('id', '').strip():
+                index.add(elem.get('id').strip(), channel_aliases(elem))
+        return index
+
+    @property
+    def digest(self):
+        """别名表内容的摘要：节目每天更新，别名不变时摘要也不变"""
+        h = hashlib.md5()
+        for alias in sorted(self.exact):
+            h.update(f"{alias}\t{self.exact[alias]}\n".encode('utf-8'))
+        return h.hexdigest()
+
+    def resolve(self, *names):
+        """依次尝试 names 中的名字，返回匹配到的频道 id；都找不到时返回 None"""
+        names = [name for name in names if name]
+        for name in names:
+            channel_id = self.exact.get(name)
+            if channel_id is not None:
+                return channel_id
+        for name in names:
+            channel_id = self.normalized.get(normalize_name(name))
+            if channel_id is not None:
+                return channel_id
+        return None
+
+    def resolve_channel(self, channel):
+        """m3u_parser.Channel 对应的频道 id，已有的 tvg-id 优先"""
+        return self.resolve(channel.attr('tvg-id'), channel.tvg_name, channel.name)
+
+
+_loaded = {}
+
+
+def load_alias_index(epg_file=EPG_FILE):
+    """读取 epg_file 的别名索引，同一进程中内容不变时只读取一次；文件不存在时返回空索引"""
+    if not os.path.exists(epg_file):
+        return AliasIndex()
+    key = (os.path.abspath(epg_file), file_digest(epg_file))
+    if key not in _loaded:
+        _loaded.clear()
+        _loaded[key] = AliasIndex.from_epg(epg_file)
+    return _loaded[key]
+
+
+def annotate(channels, index):
+    """
+    为频道批量写入 EPG 中的频道 id（tvg-id），原地修改
+    返回找不到对应频道的频道名列表
+    """
+    unmatched = []
+    for channel in channels:
+        channel_id = index.resolve_channel(channel)
+        if channel_id is None:
+            unmatched.append(channel.tvg_name or channel.name)
+        elif channel.attr('tvg-id') != channel_id:
+            channel.set_attr('tvg-id', channel_id)
+    return unmatched
+
+
+def annotate_extinf(extinf, channel_id):
+    """在 EXTINF 行中写入 tvg-id；channel_id 为 None 时原样返回"""
+    if channel_id is None:
+        return extinf
+    channel = Channel(extinf, "")
+    if channel.attr('tvg-id') != channel_id:
+        channel.set_attr('tvg-id', channel_id)
+    return channel.extinf
+
+
+def main():
+    parser = argparse.ArgumentParser(description="报告播放列表中 EPG 找不到的频道")
+    parser.add_argument('playlists', nargs='*', default=DEFAULT_PLAYLISTS, help="播放列表")
+    parser.add_argument('--epg', default=EPG_FILE, help="EPG 文件")
+    args = parser.parse_args()
+
+    index = AliasIndex.from_epg(args.epg)
+    print(f"{args.epg}: {len(index)} 个频道, {len(index.exact)} 个别名, "
+          f"规范化后 {len(index.normalized)} 个")
+    for playlist in args.playlists:
+        if not os.path.exists(playlist):
+            print(f"Warning: {playlist} not found, skipping.")
+            continue
+        channels = list(iter_m3u_file(playlist))
+        unmatched = annotate(channels, index)
+        print(f"{playlist}: {len(channels) - len(unmatched)}/{len(channels)} 个频道匹配")
+        unmatched = list(dict.fromkeys(unmatched))
+        if unmatched:
+            print(f"  - EPG 中没有的频道 ({len(unmatched)}): {', '.join(unmatched)}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
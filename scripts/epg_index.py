@@ -0,0 +1,329 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+EPG 节目二进制索引
+
+从 EPG/sggc.xml.gz 构建一个可直接 mmap 的紧凑索引（默认 EPG/sggc.idx），
+回答"某频道在某时刻播什么"只需两次二分查找，不用解析 XML。
+
+文件布局（小端）：
+  头部        魔数、版本、各表条目数、字符串表大小、源 EPG 的 MD5
+  频道表      按频道 id 的 UTF-8 字节排序：(名称偏移, 名称长度, 第一个节目序号, 节目数)
+  别名表      频道 id 和全部 display-name，按 UTF-8 字节排序：(名称偏移, 名称长度, 频道序号)；
+              名字的归属由 epg_alias.AliasIndex 决定，与播放列表写入 tvg-id 时一致
+  节目表      每个频道的节目连续存放并按开始时间排序：(开始, 结束, 标题偏移, 标题长度)
+  字符串表    频道名和节目标题的 UTF-8 字节，相同字符串只存一份
+
+用法（在仓库根目录）:
+  python scripts/epg_index.py build
+  python scripts/epg_index.py now CCTV1 [--at 时间]
+  python scripts/epg_index.py schedule CCTV-1 [--date YYYYMMDD]
+
+时间可以是 Unix 时间戳或 XMLTV 格式（"20260722200000 +0800"，省略时区时按北京时间）。
+"""
+
+import argparse
+import mmap
+import os
+import struct
+import time
+from collections import namedtuple
+
+from build_manifest import atomic_write, file_digest
+from epg_alias import AliasIndex
+from epg_stream import CHANNEL, EPG_FILE, EPGReader, channel_aliases, parse_time
+
+INDEX_FILE = "EPG/sggc.idx"
+
+MAGIC = b'SGGCIDX\0'
+# 格式或别名归属规则变化时递增，旧索引会被重新构建
+VERSION = 2
+
+# 魔数, 版本, 保留, 频道数, 别名数, 节目数, 字符串表字节数, 源 EPG 摘要
+HEADER = struct.Struct('<8sHHIIII32s')
+CHANNEL_ENTRY = struct.Struct('<IIII')
+ALIAS_ENTRY = struct.Struct('<III')
+PROGRAMME_ENTRY = struct.Struct('<qqII')
+
+Programme = namedtuple('Programme', 'channel start stop title')
+
+
+class _Strings:
+    """构建时的字符串表，相同字符串只存一份"""
+
+    def __init__(self):
+        self.offsets = {}
+        self.chunks = []
+        self.size = 0
+
+    def add(self, text):
+        """返回 (偏移, 字节长度)"""
+        entry = self.offsets.get(text)
+        if entry is None:
+            data = text.encode('utf-8')
+            entry = self.offsets[text] = (self.size, len(data))
+            self.chunks.append(data)
+            self.size += len(data)
+        return entry
+
+
+def build_index(epg_file=EPG_FILE, index_file=INDEX_FILE):
+    """流式读取 EPG 并写出索引，返回 (频道数, 节目数, 索引字节数)"""
+    strings = _Strings()
+    # 频道 id -> [(开始, 结束, 标题偏移, 标题长度)]，按 EPG 中的出现顺序
+    programmes = {}
+    # 与 epg_alias 共用同一套归属规则：与频道 id 相同的名字归该频道，其余以先出现的为准
+    alias_index = AliasIndex()
+
+    for elem in EPGReader(epg_file):
+        if elem.tag == CHANNEL:
+            channel_id = elem.get('id', '').strip()
+            if not channel_id:
+                continue
+            programmes.setdefault(channel_id, [])
+            alias_index.add(channel_id, channel_aliases(elem))
+            continue
+
+        channel_id = elem.get('channel', '').strip()
+        start = parse_time(elem.get('start'))
+        if not channel_id or start is None:
+            continue
+        stop = parse_time(elem.get('stop'))
+        title = elem.find('title')
+        title = (title.text or '').strip() if title is not None else ''
+        programmes.setdefault(channel_id, []).append(
+            (start, stop if stop is not None else start) + strings.add(title))
+        if channel_id not in alias_index.exact:
+            # 没有 <channel> 声明的频道只能按 id 查找，不占用已有的名字
+            alias_index.add(channel_id, [channel_id])
+    aliases = alias_index.exact
+
+    channel_ids = sorted(programmes, key=lambda name: name.encode('utf-8'))
+    channel_number = {channel_id: number for number, channel_id in enumerate(channel_ids)}
+
+    channel_table = bytearray()
+    programme_table = bytearray()
+    first = 0
+    for channel_id in channel_ids:
+        entries = sorted(programmes[channel_id])
+        channel_table += CHANNEL_ENTRY.pack(*strings.add(channel_id), first, len(entries))
+        for entry in entries:
+            programme_table += PROGRAMME_ENTRY.pack(*entry)
+        first += len(entries)
+
+    alias_table = bytearray()
+    for alias in sorted(aliases, key=lambda name: name.encode('utf-8')):
+        alias_table += ALIAS_ENTRY.pack(*strings.add(alias), channel_number[aliases[alias]])
+
+    header = HEADER.pack(MAGIC, VERSION, 0, len(channel_ids), len(aliases), first, strings.size,
+                         file_digest(epg_file).encode('ascii'))
+    content = b''.join([header, channel_table, alias_table, programme_table] + strings.chunks)
+    atomic_write(index_file, content)
+    return len(channel_ids), first, len(content)
+
+
+class ProgrammeIndex:
+    """只读的 mmap 节目索引，可用作上下文管理器"""
+
+    def __init__(self, index_file=INDEX_FILE):
+        self._file = open(index_file, 'rb')
+        try:
+            self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self._file.close()
+            raise ValueError(f"{index_file}: 索引文件为空")
+        if len(self._mm) < HEADER.size:
+            self.close()
+            raise ValueError(f"{index_file}: 索引文件不完整，可能已损坏")
+        magic, version, _, self.channel_count, self.alias_count, self.programme_count, \
+            strings_size, digest = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise ValueError(f"{index_file}: 不是版本 {VERSION} 的 EPG 索引")
+        self.source_digest = digest.decode('ascii')
+        self._channels_at = HEADER.size
+        self._aliases_at = self._channels_at + self.channel_count * CHANNEL_ENTRY.size
+        self._programmes_at = self._aliases_at + self.alias_count * ALIAS_ENTRY.size
+        self._strings_at = self._programmes_at + self.programme_count * PROGRAMME_ENTRY.size
+        if self._strings_at + strings_size != len(self._mm):
+            self.close()
+            raise ValueError(f"{index_file}: 索引文件长度不符，可能已损坏")
+
+    def close(self):
+        if self._mm is not None:
+            self._mm.close()
+            self._mm = None
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _bytes(self, offset, length):
+        start = self._strings_at + offset
+        return self._mm[start:start + length]
+
+    def _channel(self, number):
+        """(频道 id, 第一个节目序号, 节目数)"""
+        offset, length, first, count = CHANNEL_ENTRY.unpack_from(
+            self._mm, self._channels_at + number * CHANNEL_ENTRY.size)
+        return self._bytes(offset, length).decode('utf-8'), first, count
+
+    def _programme(self, number):
+        return PROGRAMME_ENTRY.unpack_from(self._mm, self._programmes_at + number * PROGRAMME_ENTRY.size)
+
+    def channels(self):
+        """全部频道 id（按 UTF-8 字节排序）"""
+        return [self._channel(number)[0] for number in range(self.channel_count)]
+
+    def _find_alias(self, name):
+        """二分查找别名表，返回频道序号；找不到时返回 None"""
+        key = name.encode('utf-8')
+        low, high = 0, self.alias_count
+        while low < high:
+            middle = (low + high) // 2
+            offset, length, number = ALIAS_ENTRY.unpack_from(
+                self._mm, self._aliases_at + middle * ALIAS_ENTRY.size)
+            current = self._bytes(offset, length)
+            if current == key:
+                return number
+            if current < key:
+                low = middle + 1
+            else:
+                high = middle
+        return None
+
+    def resolve(self, name):
+        """频道 id 或 display-name 对应的频道 id；找不到时返回 None"""
+        number = self._find_alias(name)
+        return None if number is None else self._channel(number)[0]
+
+    def _last_starting_before(self, first, count, when):
+        """[first, first + count) 中开始时间 <= when 的最后一个节目序号，没有时返回 first - 1"""
+        low, high = first, first + count
+        while low < high:
+            middle = (low + high) // 2
+            if self._programme(middle)[0] <= when:
+                low = middle + 1
+            else:
+                high = middle
+        return low - 1
+
+    def _make(self, channel_id, number):
+        start, stop, offset, length = self._programme(number)
+        return Programme(channel_id, start, stop, self._bytes(offset, length).decode('utf-8'))
+
+    def at(self, name, when=None):
+        """name 频道在 when（Unix 时间戳，默认当前时间）播出的节目；没有时返回 None"""
+        number = self._find_alias(name)
+        if number is None:
+            return None
+        when = time.time() if when is None else when
+        channel_id, first, count = self._channel(number)
+        found = self._last_starting_before(first, count, when)
+        if found < first:
+            return None
+        programme = self._make(channel_id, found)
+        return programme if programme.stop > when else None
+
+    def between(self, name, start, stop):
+        """name 频道中与 [start, stop) 有重叠的节目，按开始时间排序"""
+        number = self._find_alias(name)
+        if number is None:
+            return []
+        channel_id, first, count = self._channel(number)
+        position = max(self._last_starting_before(first, count, start), first)
+        result = []
+        for current in range(position, first + count):
+            programme = self._make(channel_id, current)
+            if programme.start >= stop:
+                break
+            if programme.stop > start:
+                result.append(programme)
+        return result
+
+
+def ensure_index(epg_file=EPG_FILE, index_file=INDEX_FILE):
+    """索引不存在或与 EPG 内容不符时重新构建，返回打开的 ProgrammeIndex"""
+    digest = file_digest(epg_file)
+    if os.path.exists(index_file):
+        try:
+            index = ProgrammeIndex(index_file)
+        except ValueError:
+            index = None
+        if index is not None:
+            if index.source_digest == digest:
+                return index
+            index.close()
+    build_index(epg_file, index_file)
+    return ProgrammeIndex(index_file)
+
+
+# ==================== 命令行 ====================
+
+# 省略时区的时间按北京时间解释
+DEFAULT_OFFSET = '+0800'
+
+
+def parse_when(value):
+    """命令行时间参数转为 Unix 时间戳"""
+    if value.isdigit() and len(value) < 14:
+        return int(value)
+    if len(value.strip()) == 14:
+        value = f"{value.strip()} {DEFAULT_OFFSET}"
+    timestamp = parse_time(value)
+    if timestamp is None:
+        raise argparse.ArgumentTypeError(f"无法解析的时间: {value}")
+    return timestamp
+
+
+def format_time(timestamp):
+    return time.strftime('%Y-%m-%d %H:%M', time.gmtime(timestamp + 8 * 3600))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="EPG 节目二进制索引")
+    parser.add_argument('--epg', default=EPG_FILE, help="EPG 文件")
+    parser.add_argument('--index', default=INDEX_FILE, help="索引文件")
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('build', help="构建索引")
+    now_parser = commands.add_parser('now', help="查询某时刻正在播出的节目")
+    now_parser.add_argument('channel', help="频道 id 或 display-name")
+    now_parser.add_argument('--at', type=parse_when, help="时间，默认当前时间")
+    schedule_parser = commands.add_parser('schedule', help="列出某天的节目")
+    schedule_parser.add_argument('channel', help="频道 id 或 display-name")
+    schedule_parser.add_argument('--date', help="日期 YYYYMMDD（北京时间），默认今天")
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        start = time.perf_counter()
+        channels, programmes, size = build_index(args.epg, args.index)
+        print(f"{args.index}: {channels} 个频道, {programmes} 个节目, {size} 字节, "
+              f"耗时 {time.perf_counter() - start:.2f} 秒")
+        return 0
+
+    with ensure_index(args.epg, args.index) as index:
+        channel_id = index.resolve(args.channel)
+        if channel_id is None:
+            print(f"EPG 中没有频道: {args.channel}")
+            return 1
+        if args.command == 'now':
+            programme = index.at(channel_id, args.at)
+            if programme is None:
+                print(f"{channel_id}: 没有节目")
+                return 1
+            print(f"{channel_id}: {format_time(programme.start)} - {format_time(programme.stop)} "
+                  f"{programme.title}")
+            return 0
+
+        date = args.date or time.strftime('%Y%m%d', time.gmtime(time.time() + 8 * 3600))
+        start = parse_when(date + '000000')
+        for programme in index.between(channel_id, start, start + 86400):
+            print(f"{format_time(programme.start)}  {programme.title}")
+        return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
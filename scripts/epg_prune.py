@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+按播放列表裁剪 EPG
+
+每个分城市播放列表只带一部分频道，却都指向完整的 EPG/sggc.xml.gz。
+这里用 epg_alias 的别名索引把播放列表中的频道（tvg-id / tvg-name / 显示名称）
+对应到 EPG 中 <channel> 的 id，只保留用到的频道及其节目，为每个播放列表
+写出一份裁剪后的 EPG（<输出目录>/<播放列表名>.xml.gz）。
+
+EPG 只流式读取一遍，同时写出全部需要更新的文件；gzip 头中不写时间戳，
+内容不变时输出字节也不变。输出通过 build_manifest 记录输入摘要，
+EPG 内容（按解压后计算）和播放列表频道都没变时整个文件跳过。
+
+用法（在仓库根目录）:
+  python scripts/epg_prune.py
+"""
+
+import glob
+import os
+from collections import defaultdict
+
+from build_manifest import BuildManifest, build_digest, gzip_content_digest
+from epg_alias import load_alias_index
+from epg_stream import CHANNEL, EPG_FILE, EPGReader, GzipDocument, serialize
+from m3u_parser import iter_m3u_file
+
+# 裁剪逻辑变化时递增，使全部输出重新生成
+PRUNER_VERSION = 2
+
+# (播放列表通配符, 输出目录)
+PRUNE_TARGETS = [
+    ("SDU-Multicast/*.m3u", "EPG/SDU-Multicast"),
+]
+
+
+def channel_keys(channels, aliases):
+    """播放列表中每个频道的 (名称, EPG 频道 id)；EPG 中找不到时 id 为 None"""
+    return [(ch.tvg_name or ch.name, aliases.resolve_channel(ch)) for ch in channels]
+
+
+def output_filename(playlist):
+    return os.path.splitext(os.path.basename(playlist))[0] + '.xml.gz'
+
+
+def prune_epg(playlists, epg_file=EPG_FILE):
+    """
+    一次读取 epg_file，为每个播放列表生成裁剪后的 EPG
+
+    playlists: {输出键: channel_keys() 的结果}；频道相同的播放列表共用一份输出
+    返回 ({输出键: 压缩后的内容}, {输出键: (频道数, 节目数, 未匹配的频道名列表)})
+    """
+    # EPG 频道 id 集合 -> 分组编号；多数城市只有公共频道，裁剪结果完全相同
+    groups = {}
+    group_of = {key: groups.setdefault(frozenset(channel_id for _, channel_id in channels if channel_id),
+                                       len(groups))
+                for key, channels in playlists.items()}
+
+    # EPG 频道 id -> 用到它的分组
+    wanted = defaultdict(set)
+    for key, channels in playlists.items():
+        for _, channel_id in channels:
+            if channel_id is not None:
+                wanted[channel_id].add(group_of[key])
+
+    reader = EPGReader(epg_file)
+    outputs = None
+
+    for elem in reader:
+        if outputs is None:
+            outputs = [GzipDocument(reader.attrib) for _ in groups]
+
+        if elem.tag == CHANNEL:
+            targets = wanted.get(elem.get('id', '').strip())
+            if not targets:
+                continue
+            data = serialize(elem).encode('utf-8')
+            for group in targets:
+                outputs[group].write(data)
+                outputs[group].channels += 1
+        else:
+            targets = wanted.get(elem.get('channel'))
+            if not targets:
+                continue
+            data = serialize(elem).encode('utf-8')
+            for group in targets:
+                outputs[group].write(data)
+                outputs[group].programmes += 1
+
+    if outputs is None:
+        outputs = [GzipDocument(reader.attrib) for _ in groups]
+
+    closed = [output.close() for output in outputs]
+    contents, stats = {}, {}
+    for key, group in group_of.items():
+        output = outputs[group]
+        contents[key] = closed[group]
+        unmatched = [name for name, channel_id in playlists[key] if channel_id is None]
+        stats[key] = (output.channels, output.programmes, unmatched)
+    return contents, stats
+
+
+def prune_all(channels_of=None, epg_file=EPG_FILE, force=False):
+    """
+    为 PRUNE_TARGETS 中的每个播放列表写出裁剪后的 EPG，只重新生成输入变化的文件；
+    全部目标共用一次 EPG 读取
+    channels_of 为 pipeline 传入的 路径 -> 频道列表 函数，省略时读取文件
+    """
+    if not os.path.exists(epg_file):
+        print(f"Warning: {epg_file} not found, skipping.")
+        return False
+
+    channels_of = channels_of or (lambda path: list(iter_m3u_file(path)))
+    # 按解压后的内容计算：EPG 只是重新压缩时不重建
+    epg_digest = gzip_content_digest(epg_file)
+    aliases = load_alias_index(epg_file)
+
+    manifests = []
+    # (清单, 输出文件名) -> 频道名 / 输入摘要
+    pending, digests = {}, {}
+    for pattern, output_dir in PRUNE_TARGETS:
+        manifest = BuildManifest(output_dir, name='EPG-' + os.path.basename(os.path.normpath(output_dir)))
+        manifests.append(manifest)
+        for playlist in sorted(glob.glob(pattern)):
+            filename = output_filename(playlist)
+            keys = channel_keys(channels_of(playlist), aliases)
+            digest = build_digest(PRUNER_VERSION, epg_digest, sorted(keys, key=str))
+            if not force and manifest.is_current(filename, digest):
+                manifest.keep(filename)
+                continue
+            pending[manifest, filename] = keys
+            digests[manifest, filename] = digest
+
+    if pending:
+        contents, stats = prune_epg(pending, epg_file)
+        for manifest, filename in pending:
+            content = contents[manifest, filename]
+            written = manifest.write(filename, digests[manifest, filename], content)
+            channels, programmes, unmatched = stats[manifest, filename]
+            print(f"{'Generated' if written else 'Unchanged'}: {filename} "
+                  f"({channels} 个频道, {programmes} 个节目, {len(content)} 字节)")
+            if unmatched:
+                print(f"  - EPG 中没有的频道 ({len(unmatched)}): {', '.join(unmatched)}")
+    for manifest in manifests:
+        manifest.finish()
+    return True
+
+
+if __name__ == "__main__":
+    prune_all()
@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+EPG 时间切片与按频道/日期分片
+
+完整的 EPG/sggc.xml.gz 覆盖好几天的节目，客户端每次刷新都要重新解析
+大量已经播完的节目。这里流式读取一遍 EPG，输出：
+
+  EPG/slices/now.xml.gz     正在播出以及 NOW_HOURS 小时内开始的节目
+  EPG/slices/today.xml.gz   今天（北京时间）播出的节目
+  EPG/shards/<日期>/<频道>.xml
+                            每个频道每天一个分片，本身是完整的 XMLTV 文档
+
+分片随 EPG 流式写出：一个频道的节目读完（切换到下一个频道）时写出它的分片，
+内存中只保留当前频道的节目，且只在内容变化时重写。EPG 通常按频道连续排列；
+节目不连续的频道，后出现的节目暂存起来，最后对涉及的分片各补写一次。
+EPG 中已经不存在的当天分片会删除，早于 RETAIN_DAYS 天前的日期目录整体清除。
+分片（约 2700 个文件）不提交到仓库（见 .gitignore），工作流用 actions/cache
+在运行之间保留；缺失时 pipeline 会重新生成。
+
+用法（在仓库根目录）:
+  python scripts/epg_slices.py [--now 时间戳]
+"""
+
+import argparse
+import os
+import shutil
+import time
+from urllib.parse import quote
+
+from build_manifest import write_if_changed
+from epg_stream import (CHANNEL, DOCUMENT_TAIL, EPG_FILE, EPGReader, GzipDocument, document_head,
+                        parse_time, serialize)
+
+SLICE_DIR = "EPG/slices"
+SHARD_DIR = "EPG/shards"
+
+# now 切片覆盖的小时数；需要大于两次 EPG 更新之间的最长间隔
+NOW_HOURS = 12
+# 保留今天之前多少天的分片（供回看使用）
+RETAIN_DAYS = 1
+# 切片按北京时间划分日期
+TZ_OFFSET = 8 * 3600
+
+# 文件名中不能出现的字符
+_UNSAFE_CHARS = set('/\\:*?"<>|%')
+
+
+def local_day(timestamp):
+    """时间戳对应的北京时间日期，格式 YYYYMMDD"""
+    return time.strftime('%Y%m%d', time.gmtime(timestamp + TZ_OFFSET))
+
+
+def day_start(timestamp):
+    """时间戳所在北京时间日期的零点"""
+    return (timestamp + TZ_OFFSET) // 86400 * 86400 - TZ_OFFSET
+
+
+def shard_filename(channel_id):
+    """频道 id 转为分片文件名，只转义文件系统不允许的字符"""
+    name = ''.join(quote(c, safe='') if c in _UNSAFE_CHARS else c for c in channel_id)
+    if name.startswith('.'):
+        name = '%2E' + name[1:]
+    return name + '.xml'
+
+
+def window_key(now):
+    """决定切片内容的时间窗口，同一小时内的多次运行结果相同"""
+    return f"{local_day(now)}:{now // 3600}"
+
+
+class ShardStore:
+    """按 日期/频道 存放的节目分片"""
+
+    def __init__(self, now, root=SHARD_DIR, channels=None):
+        self.root = root
+        # 早于该日期的分片不再保留
+        self.cutoff = local_day(day_start(now) - RETAIN_DAYS * 86400)
+        self.head = ''
+        # 频道 id -> 频道文本，由调用方在读到 <channel> 时填入
+        self.channels = {} if channels is None else channels
+        # 当前频道的节目：{日期: [节目文本]}
+        self.current_id, self.current = None, {}
+        # 已经写出过分片的频道
+        self.flushed = set()
+        # 节目不连续的频道后出现的节目：(日期, 频道 id) -> [节目文本]
+        self.late = {}
+        # 本次运行产出的 (日期, 文件名) -> 是否改写了文件
+        self.produced = {}
+
+    @property
+    def written(self):
+        return sum(self.produced.values())
+
+    @property
+    def unchanged(self):
+        return len(self.produced) - self.written
+
+    def path(self, day, channel_id):
+        return os.path.join(self.root, day, shard_filename(channel_id))
+
+    def add(self, channel_id, day, programme):
+        """加入一个节目；切换到新频道时写出上一个频道的分片，过期日期的节目直接丢弃"""
+        if day < self.cutoff:
+            return
+        if channel_id != self.current_id:
+            self._flush_current()
+            self.current_id = channel_id
+        if channel_id in self.flushed:
+            self.late.setdefault((day, channel_id), []).append(programme)
+        else:
+            self.current.setdefault(day, []).append(programme)
+
+    def _write(self, day, channel_id, body):
+        path = self.path(day, channel_id)
+        key = (day, os.path.basename(path))
+        changed = write_if_changed(path, self.head + self.channels[channel_id] + body + DOCUMENT_TAIL)
+        self.produced[key] = self.produced.get(key, False) or changed
+
+    def _flush_current(self):
+        if self.current_id is None or not self.current:
+            return
+        for day, programmes in self.current.items():
+            self._write(day, self.current_id, ''.join(programmes))
+        self.flushed.add(self.current_id)
+        self.current = {}
+
+    def flush(self):
+        """写出当前频道的分片，并为节目不连续的频道补写一次"""
+        self._flush_current()
+        self.current_id = None
+        for (day, channel_id), programmes in self.late.items():
+            path = self.path(day, channel_id)
+            body = ''
+            if (day, os.path.basename(path)) in self.produced:
+                prefix = self.head + self.channels[channel_id]
+                with open(path, 'r', encoding='utf-8') as f:
+                    body = f.read()[len(prefix):-len(DOCUMENT_TAIL)]
+            self._write(day, channel_id, body + ''.join(programmes))
+        self.late = {}
+
+    def cleanup(self):
+        """清除过期日期目录，以及 EPG 覆盖的日期中本次没有产出的分片；返回删除的文件数"""
+        if not os.path.isdir(self.root):
+            return 0
+        covered = {day for day, _ in self.produced}
+        removed = 0
+        for day in sorted(os.listdir(self.root)):
+            directory = os.path.join(self.root, day)
+            if not os.path.isdir(directory):
+                continue
+            if day < self.cutoff:
+                removed += len(os.listdir(directory))
+                shutil.rmtree(directory)
+                continue
+            if day not in covered:
+                continue
+            for filename in os.listdir(directory):
+                if (day, filename) not in self.produced:
+                    os.remove(os.path.join(directory, filename))
+                    removed += 1
+        return removed
+
+
+def build_slices(epg_file=EPG_FILE, now=None, slice_dir=SLICE_DIR, shard_dir=SHARD_DIR):
+    """流式读取 EPG，写出 now / today 切片并更新分片；返回是否成功"""
+    if not os.path.exists(epg_file):
+        print(f"Warning: {epg_file} not found, skipping.")
+        return False
+
+    now = int(time.time()) if now is None else int(now)
+    today_start = day_start(now)
+    today_end = today_start + 86400
+    window_end = now + NOW_HOURS * 3600
+
+    reader = EPGReader(epg_file)
+    channels = {}
+    store = ShardStore(now, shard_dir, channels)
+    now_slice = today_slice = None
+    skipped = 0
+
+    for elem in reader:
+        if now_slice is None:
+            now_slice = GzipDocument(reader.attrib)
+            today_slice = GzipDocument(reader.attrib)
+            store.head = document_head(reader.attrib)
+
+        if elem.tag == CHANNEL:
+            text = serialize(elem)
+            channels[elem.get('id')] = text
+            data = text.encode('utf-8')
+            now_slice.write(data)
+            today_slice.write(data)
+            continue
+
+        channel_id = elem.get('channel')
+        start = parse_time(elem.get('start'))
+        stop = parse_time(elem.get('stop'))
+        if channel_id not in channels or start is None:
+            skipped += 1
+            continue
+        if stop is None:
+            stop = start
+
+        text = serialize(elem)
+        store.add(channel_id, local_day(start), text)
+        if stop > now and start < window_end:
+            now_slice.write(text.encode('utf-8'))
+            now_slice.programmes += 1
+        if stop > today_start and start < today_end:
+            today_slice.write(text.encode('utf-8'))
+            today_slice.programmes += 1
+
+    if now_slice is None:
+        print(f"Warning: {epg_file} 中没有频道或节目")
+        return False
+    store.flush()
+
+    removed = store.cleanup()
+    for name, document in (('now', now_slice), ('today', today_slice)):
+        path = os.path.join(slice_dir, f"{name}.xml.gz")
+        content = document.close()
+        state = "已更新" if write_if_changed(path, content) else "未变化"
+        print(f"{path}: {document.programmes} 个节目, {len(content)} 字节 ({state})")
+    print(f"{shard_dir}: 重写 {store.written} 个分片，未变化 {store.unchanged} 个，删除 {removed} 个")
+    if skipped:
+        print(f"警告: 跳过 {skipped} 个频道未声明或时间无法解析的节目")
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description="EPG 时间切片与分片")
+    parser.add_argument('--epg', default=EPG_FILE, help="EPG 文件")
+    parser.add_argument('--now', type=int, help="以该 Unix 时间戳作为当前时间（调试用）")
+    args = parser.parse_args()
+    return 0 if build_slices(args.epg, args.now) else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+共享的流式 XMLTV (EPG) 读取器
+
+EPG/sggc.xml.gz 解压后约 18 MB、近十万个 <programme>。这里用 iterparse
+逐个产出顶层的 <channel> / <programme> 元素，调用方处理完后立即从树上
+移除，内存占用与文件大小无关。
+"""
+
+import calendar
+import gzip
+import io
+import xml.etree.ElementTree as ET
+from xml.sax.saxutils import escape
+
+EPG_FILE = "EPG/sggc.xml.gz"
+
+CHANNEL = 'channel'
+PROGRAMME = 'programme'
+
+XML_DECLARATION = '<?xml version="1.0" encoding="utf-8"?>'
+DOCUMENT_TAIL = "</tv>\n"
+
+_ATTR_ENTITIES = {'"': '&quot;'}
+
+
+def open_epg(path):
+    """以二进制方式打开 EPG 文件，.gz 结尾时透明解压"""
+    path = str(path)
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rb')
+    return open(path, 'rb')
+
+
+class EPGReader:
+    """
+    流式 EPG 读取器，迭代时逐个产出顶层的 channel / programme 元素
+
+    source 可以是文件路径或二进制文件对象；产出的元素只在处理下一个元素
+    之前有效。根元素 <tv> 的属性保存在 attrib 属性中。
+    """
+
+    def __init__(self, source):
+        self.source = source
+        self.attrib = {}
+
+    def __iter__(self):
+        if hasattr(self.source, 'read'):
+            yield from self._iter(self.source)
+        else:
+            with open_epg(self.source) as f:
+                yield from self._iter(f)
+
+    def _iter(self, stream):
+        root = None
+        depth = 0
+        for event, elem in ET.iterparse(stream, events=('start', 'end')):
+            if event == 'start':
+                if root is None:
+                    root = elem
+                    self.attrib = dict(elem.attrib)
+                depth += 1
+                continue
+            depth -= 1
+            if depth == 1:
+                if elem.tag in (CHANNEL, PROGRAMME):
+                    yield elem
+                # 处理完的顶层元素从根上摘掉，交给垃圾回收
+                del root[:]
+
+
+def iter_epg(source):
+    """逐个产出 EPG 中的 channel / programme 元素"""
+    return iter(EPGReader(source))
+
+
+def parse_time(value):
+    """XMLTV 时间（如 "20260719000000 +0800"）转为 Unix 时间戳，格式不对时返回 None"""
+    value = (value or '').strip()
+    digits = value[:14]
+    if len(digits) != 14 or not digits.isdigit():
+        return None
+    timestamp = calendar.timegm((int(digits[0:4]), int(digits[4:6]), int(digits[6:8]),
+                                 int(digits[8:10]), int(digits[10:12]), int(digits[12:14]), 0, 0, 0))
+    offset = value[14:].strip()
+    if len(offset) == 5 and offset[0] in '+-' and offset[1:].isdigit():
+        seconds = int(offset[1:3]) * 3600 + int(offset[3:5]) * 60
+        timestamp -= seconds if offset[0] == '+' else -seconds
+    return timestamp
+
+
+def channel_aliases(elem):
+    """<channel> 的 id 和全部 display-name（去掉两侧空白、去重、保持顺序）"""
+    names = [elem.get('id', '').strip()]
+    names.extend((name.text or '').strip() for name in elem.iter('display-name'))
+    return list(dict.fromkeys(name for name in names if name))
+
+
+def serialize(elem, indent='  '):
+    """把顶层元素序列化为带缩进的文本（以换行结尾），忽略元素本身的 tail"""
+    elem.tail = None
+    return f"{indent}{ET.tostring(elem, encoding='unicode')}\n"
+
+
+def document_head(attrib):
+    """EPG 文件开头：XML 声明和带原属性的 <tv> 开始标签"""
+    attrs = ''.join(f' {key}="{escape(value, _ATTR_ENTITIES)}"' for key, value in attrib.items())
+    return f"{XML_DECLARATION}\n<tv{attrs}>\n"
+
+
+class GzipDocument:
+    """
+    在内存中压缩的 EPG 文档，写入开头后逐段追加元素
+
+    gzip 头中不写时间戳，内容相同时压缩结果逐字节相同。
+    """
+
+    def __init__(self, attrib=None):
+        self.buffer = io.BytesIO()
+        self.gzip = gzip.GzipFile(filename='', mode='wb', fileobj=self.buffer, compresslevel=9, mtime=0)
+        self.gzip.write(document_head(attrib or {}).encode('utf-8'))
+        self.channels = 0
+        self.programmes = 0
+
+    def write(self, data):
+        self.gzip.write(data)
+
+    def close(self):
+        """写入结尾并返回压缩后的字节"""
+        self.gzip.write(DOCUMENT_TAIL.encode('utf-8'))
+        self.gzip.close()
+        return self.buffer.getvalue()
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+并发下载全部上游源，再交给各自的处理脚本
+
+各源通过 http_cache 共用一个 keep-alive Session，同一主机的并发数、
+重试和退避都由 http_cache 控制，超时按源单独配置。
+某个源下载失败时退回到它最后一份可用的副本；连副本都没有时
+跳过该源，其余源照常处理，最后以非零状态退出。
+
+用法: python scripts/fetch_sources.py [源名称 ...]   (默认处理全部源)
+"""
+
+import argparse
+import importlib
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from http_cache import fetch_source, set_output
+
+# 源名称 -> 处理脚本模块；模块需提供 SOURCE (http_cache.Source) 和 run(result)
+CONSUMERS = {
+    'unicast': 'process_unicast',
+    'multicast': 'process_multicast',
+    'catchup': 'update_catchup_source',
+    'huya': 'update_huya_source',
+}
+MAX_WORKERS = 4
+
+
+def timed_fetch(source):
+    """下载一个源，返回 (结果, 异常, 耗时秒)"""
+    start = time.perf_counter()
+    try:
+        return fetch_source(source), None, time.perf_counter() - start
+    except Exception as e:
+        return None, e, time.perf_counter() - start
+
+
+def fetch_all(sources):
+    """并发下载，按 sources 的顺序返回 [(结果, 异常, 耗时秒)]"""
+    with ThreadPoolExecutor(max_workers=min(MAX_WORKERS, len(sources))) as pool:
+        return list(pool.map(timed_fetch, sources))
+
+
+def describe_fetch(result, error):
+    if error is not None:
+        return f"失败: {error}"
+    if result.fallback:
+        return "失败，使用副本"
+    if result.not_modified:
+        return "304 未变化"
+    return "已变化" if result.changed else "内容未变化"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="并发下载上游源并处理")
+    parser.add_argument('names', nargs='*', metavar='源名称', help=f"可选: {', '.join(CONSUMERS)}")
+    args = parser.parse_args()
+    names = args.names or list(CONSUMERS)
+    unknown = [name for name in names if name not in CONSUMERS]
+    if unknown:
+        parser.error(f"未知的源: {', '.join(unknown)}")
+
+    modules = [importlib.import_module(CONSUMERS[name]) for name in names]
+    sources = [module.SOURCE for module in modules]
+
+    print(f"并发下载 {len(sources)} 个源...")
+    start = time.perf_counter()
+    fetched = fetch_all(sources)
+    print(f"下载完成，总耗时 {time.perf_counter() - start:.2f} 秒\n")
+
+    print(f"{'源':<12}{'尝试':>6}{'耗时(s)':>10}  状态")
+    for source, (result, error, elapsed) in zip(sources, fetched):
+        attempts = result.attempts if result is not None else '-'
+        print(f"{source.name:<12}{attempts:>6}{elapsed:>10.2f}  {describe_fetch(result, error)}")
+
+    failed = []
+    any_changed = False
+    for name, module, (result, error, _) in zip(names, modules, fetched):
+        print(f"\n==================== {name} ====================")
+        if result is None:
+            print("跳过: 下载失败且没有可用的副本")
+            failed.append(name)
+            continue
+        if not module.run(result):
+            failed.append(name)
+        changed = result.changed
+        any_changed = any_changed or changed
+        set_output(f"{name}_changed", "true" if changed else "false")
+
+    set_output("changed", "true" if any_changed else "false")
+    if failed:
+        print(f"\n处理失败的源: {', '.join(failed)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
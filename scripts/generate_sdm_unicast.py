@@ -1,9 +1,15 @@
-import re
-import os
-import shutil
 from pathlib import Path
 
+from build_manifest import BuildManifest, build_digest, file_digest
+from city_fanout import prerender, render_city
+from logo_assets import LogoMap
+from m3u_parser import iter_m3u_file
+from stream_score import ScoreTable
+
 BASE_DIR = Path(r".")
+# 生成逻辑变化时递增，使构建清单中的全部城市重新生成
+GENERATOR_VERSION = 4
+M3U_HEADER = '#EXTM3U url-tvg="https://gh-proxy.org/https://raw.githubusercontent.com/sggc/SD-EPG/main/EPG/sggc-desc.xml.gz"'
 CITY_NAMES = [
     "济南", "青岛", "淄博", "潍坊", "烟台", "威海", "日照", "临沂",
     "济宁", "泰安", "德州", "聊城", "滨州", "菏泽", "枣庄", "东营"
@@ -38,27 +44,7 @@ CITY_CHANNELS = {
 
 def parse_m3u(source_file):
     """解析M3U文件，提取频道信息"""
-    channels = []
-    with open(source_file, "r", encoding="utf-8") as f:
-        content = f.read()
-
-    pattern = r'#EXTINF:-1 (.*?),(.*?)\n(.*?)(?=\n#EXTINF|$)'
-    for match in re.findall(pattern, content, re.DOTALL):
-        extinf_attrs = match[0]
-        channel_name = match[1].strip()
-        stream_url = match[2].strip()
-        
-        # 提取当前的 group-title
-        group_match = re.search(r'group-title="([^"]*)"', extinf_attrs)
-        current_group = group_match.group(1) if group_match else ""
-        
-        channels.append({
-            "name": channel_name,
-            "url": stream_url,
-            "extinf": f"#EXTINF:-1 {extinf_attrs},{channel_name}",
-            "group": current_group
-        })
-    return channels
+    return list(iter_m3u_file(source_file))
 
 
 def build_channel_city_map():
@@ -70,83 +56,65 @@ def build_channel_city_map():
     return channel_to_city
 
 
-def generate_sdm_unicast(source_m3u, output_dir):
-    """生成分城市的M3U文件，输出文件名使用源文件前缀"""
+def city_config(city, logos, scores):
+    """影响该城市输出的配置，用于构建清单的输入摘要"""
+    return {
+        "logos": logos.digest,
+        "scores": scores.digest,
+        "city": city,
+        "channels": CITY_CHANNELS.get(city, []),
+        "cities": CITY_NAMES,
+        "header": M3U_HEADER,
+    }
+
+
+def generate_sdm_unicast(source_m3u, output_dir, channels=None, force=False):
+    """
+    生成分城市的M3U文件，输出文件名使用源文件前缀
+    channels 为 pipeline 传入的已解析频道，省略时读取源文件
+    只重新生成构建清单中输入摘要变化的城市，force=True 时全部重新生成
+    tvg-logo 按 logo_assets 的索引改写为缩小后的台标，同名频道按 stream_score 的评分排序
+    """
     source_file = BASE_DIR / source_m3u
     if not source_file.exists():
         print(f"Warning: {source_file} not found, skipping.")
         return
 
-    output_path = BASE_DIR / output_dir
-    if output_path.exists():
-        shutil.rmtree(output_path)
-
-    all_channels = parse_m3u(source_file)
-    channel_to_city = build_channel_city_map()
-    
-    os.makedirs(output_path, exist_ok=True)
+    manifest = BuildManifest(BASE_DIR / output_dir)
+    source_digest = file_digest(source_file)
+    city_name_set = set(CITY_NAMES)
+    logos = LogoMap()
+    scores = ScoreTable()
+    segments = None
 
     # 提取源文件名的主干部分作为输出文件前缀，例如 "SDM-Unicast" 或 "SDM-Unicast-Rtsp"
     file_prefix = Path(source_m3u).stem
 
     for city in CITY_NAMES:
-        city_channel_names = set(CITY_CHANNELS.get(city, []))
-        
-        output_lines = ['#EXTM3U url-tvg="https://gh-proxy.org/https://raw.githubusercontent.com/sggc/SD-EPG/main/EPG/sggc-desc.xml.gz"']
-        
-        local_count = 0
-        county_count = 0
-        other_count = 0
-        
-        for ch in all_channels:
-            channel_name = ch["name"]
-            current_group = ch["group"]
-            
-            if channel_name in city_channel_names:
-                # 当前城市的频道（包括市级和县级）→ 分类为"山东频道"
-                modified_extinf = re.sub(
-                    r'group-title="[^"]*"',
-                    'group-title="山东频道"',
-                    ch["extinf"]
-                )
-                output_lines.append(modified_extinf)
-                output_lines.append(ch["url"])
-                local_count += 1
-                
-            elif current_group in CITY_NAMES and current_group != city:
-                # 其他地市的县级频道（group-title 是其他城市名）→ 分类为"县级频道"
-                modified_extinf = re.sub(
-                    r'group-title="[^"]*"',
-                    'group-title="县级频道"',
-                    ch["extinf"]
-                )
-                output_lines.append(modified_extinf)
-                output_lines.append(ch["url"])
-                county_count += 1
-                
-            elif current_group == "市级频道":
-                # 其他地市的市级频道 → 保持原样
-                output_lines.append(ch["extinf"])
-                output_lines.append(ch["url"])
-                other_count += 1
-                
-            else:
-                # 其他频道（央视、卫视等）→ 保持原样
-                output_lines.append(ch["extinf"])
-                output_lines.append(ch["url"])
-                other_count += 1
-        
         # 生成文件名，例如 SDM-Unicast-Rtsp-Weifang.m3u
-        output_file = output_path / f"{file_prefix}-{CITY_NAMES_EN[city]}.m3u"
-        with open(output_file, "w", encoding="utf-8") as f:
-            f.write("\n".join(output_lines))
+        filename = f"{file_prefix}-{CITY_NAMES_EN[city]}.m3u"
+        digest = build_digest(GENERATOR_VERSION, source_digest, city_config(city, logos, scores))
+        if not force and manifest.is_current(filename, digest):
+            manifest.keep(filename)
+            print(f"Unchanged: {filename}")
+            continue
+
+        if segments is None:
+            # 每个频道的三种写法只渲染一次，所有城市共用
+            segments = prerender(scores.rank(parse_m3u(source_file) if channels is None else channels),
+                                 logos.rewrite)
+        content, local_count, county_count, other_count = render_city(
+            segments, M3U_HEADER, city, set(CITY_CHANNELS.get(city, [])), city_name_set)
+        manifest.write(filename, digest, content)
         
-        print(f"Generated: {output_file.name}")
+        print(f"Generated: {filename}")
         print(f"  - 本地频道（山东频道）: {local_count}")
         print(f"  - 县级频道: {county_count}")
         print(f"  - 其他频道: {other_count}")
         print()
 
+    manifest.finish()
+
 
 if __name__ == "__main__":
     # 处理第一个源文件
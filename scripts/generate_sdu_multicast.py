@@ -1,11 +1,19 @@
-import re
-import os
-import shutil
 from pathlib import Path
 
+from build_manifest import BuildManifest, build_digest, file_digest
+from epg_alias import annotate_extinf, load_alias_index
+from logo_assets import LogoMap
+from m3u_parser import Channel, iter_m3u_file, tokenize_extinf
+from multicast_url import CityVariant, RemapTable, compile_url
+from stream_score import ScoreTable
+
 BASE_DIR = Path(r".")
 SOURCE_M3U_FILE = BASE_DIR / "SDU-Multicast.m3u"
 OUTPUT_DIR = BASE_DIR / "SDU-Multicast"
+# 生成逻辑变化时递增，使构建清单中的全部城市重新生成
+GENERATOR_VERSION = 5
+# 每个城市指向 epg_prune 按该城市频道裁剪出的 EPG/SDU-Multicast/<文件名>.xml.gz
+M3U_HEADER = '#EXTM3U url-tvg="https://gh-proxy.org/https://raw.githubusercontent.com/sggc/SDU-IPTV-PRO/main/EPG/SDU-Multicast/{epg}"'
 
 CITY_NAMES = [
     "济南", "青岛", "淄博", "潍坊", "烟台", "威海", "日照", "临沂",
@@ -27,6 +35,12 @@ CITY_CODES = {
     "东营": 232, "莱芜": 222
 }
 
+# 联通组播地址所在网段，第三段为城市标识（CITY_CODES）
+GROUP_NETWORK = "239.253.0.0/16"
+
+# 组播地址整段迁移表，例如 {"239.253.0.0/16": "239.254.0.0/16"}，在填入城市标识之后应用
+GROUP_REMAP = {}
+
 FCC_CONFIG = {
     "潍坊": "60.210.139.78:8027",
     "滨州": "112.252.79.46:8027",
@@ -124,80 +138,115 @@ CITY_CHANNELS = {
 }
 
 def parse_m3u():
-    channels = []
-    with open(SOURCE_M3U_FILE, "r", encoding="utf-8") as f:
-        content = f.read()
-
-    pattern = r'#EXTINF:-1 (.*?),(.*?)\n(.*?)(?=\n#EXTINF|$)'
-    for match in re.findall(pattern, content, re.DOTALL):
-        extinf_attrs = match[0]
-        channel_name = match[1].strip()
-        stream_url = match[2].strip()
-        channels.append({
-            "name": channel_name,
-            "url": stream_url,
-            "extinf": f"#EXTINF:-1 {extinf_attrs},{channel_name}"
-        })
-    return channels
-
-def replace_ip_segment(url, city_code, fcc=None):
-    pattern = r'239\.253\.\d+\.(\d+)'
-    match = re.search(pattern, url)
-    if match:
-        fourth_segment = match.group(1)
-        new_ip = f'239.253.{city_code}.{fourth_segment}'
-        result = re.sub(r'239\.253\.\d+\.\d+', new_ip, url)
-        result = re.sub(r'\?fcc=[^&]+', '', result)
-        if fcc:
-            result = f"{result}?fcc={fcc}"
-        return result
-    return url
-
-def generate_sdu_multicast():
-    if os.path.exists(OUTPUT_DIR):
-        shutil.rmtree(OUTPUT_DIR)
-
-    all_channels = parse_m3u()
-
-    os.makedirs(OUTPUT_DIR, exist_ok=True)
-
-    all_known_channel_names = set()
+    return list(iter_m3u_file(SOURCE_M3U_FILE))
+
+def city_variant(city, remap=None):
+    """该城市的组播地址改写：填入城市标识，fcc 换成该城市的 FCC 服务器"""
+    return CityVariant(GROUP_NETWORK, CITY_CODES[city], FCC_CONFIG.get(city), remap)
+
+def compile_channels(channels):
+    """每个频道的播放地址只解析一次，返回 [(EXTINF 行, 地址, 地址模板)]"""
+    return [(extinf, url, compile_url(url)) for extinf, url in channels]
+
+def with_tvg_ids(channels, aliases, logos, unmatched):
+    """
+    按 EPG 别名索引为频道写入 tvg-id、按台标索引改写 tvg-logo，逐个产出 (EXTINF 行, 地址)
+    找不到的频道名追加到 unmatched
+    """
+    for ch in channels:
+        channel_id = aliases.resolve_channel(ch)
+        if channel_id is None:
+            unmatched.append(ch.tvg_name or ch.name)
+        yield logos.rewrite(annotate_extinf(ch.canonical_extinf, channel_id)), ch.url
+
+def render_urls(compiled, variant):
+    """按城市改写预先解析好的频道地址，逐个产出 EXTINF 行和新地址"""
+    apply = variant.apply
+    for extinf, url, template in compiled:
+        yield extinf
+        yield url if template is None else apply(template)
+
+def known_channel_names():
+    """CITY_CHANNELS 中全部地方台的频道名"""
+    names = set()
     for channels in CITY_CHANNELS.values():
         for ch in channels:
-            name_match = re.search(r',(.+)$', ch["extinf"])
-            if name_match:
-                all_known_channel_names.add(name_match.group(1).strip())
+            _, channel_name, _ = tokenize_extinf(ch["extinf"])
+            if channel_name:
+                names.add(channel_name)
+    return names
+
+def city_filename(city):
+    return f"SDU-Multicast-{CITY_NAMES_EN[city]}.m3u"
+
+def city_header(city):
+    return M3U_HEADER.format(epg=Path(city_filename(city)).stem + ".xml.gz")
+
+def city_config(city, known_names, aliases, logos, scores):
+    """影响该城市输出的配置，用于构建清单的输入摘要"""
+    return {
+        "epg_aliases": aliases.digest,
+        "logos": logos.digest,
+        "scores": scores.digest,
+        "city": city,
+        "code": CITY_CODES[city],
+        "fcc": FCC_CONFIG.get(city),
+        "network": GROUP_NETWORK,
+        "remap": GROUP_REMAP,
+        "channels": CITY_CHANNELS.get(city, []),
+        "known": sorted(known_names),
+        "header": city_header(city),
+    }
+
+def generate_sdu_multicast(channels=None, force=False):
+    """
+    生成分城市的组播M3U文件；channels 为 pipeline 传入的已解析频道，省略时读取源文件
+    只重新生成构建清单中输入摘要变化的城市，force=True 时全部重新生成
+    频道的 tvg-id 取自 EPG 别名索引（epg_alias），tvg-logo 按 logo_assets 的索引改写，
+    同名频道按 stream_score 的评分排序
+    """
+    manifest = BuildManifest(OUTPUT_DIR)
+    source_digest = file_digest(SOURCE_M3U_FILE)
+    all_known_channel_names = known_channel_names()
+    remap = RemapTable(GROUP_REMAP)
+    aliases = load_alias_index()
+    logos = LogoMap()
+    scores = ScoreTable()
+    shared_channels = None
+    unmatched = []
 
     for city in CITY_NAMES:
-        city_code = CITY_CODES[city]
-        fcc = FCC_CONFIG.get(city)
+        filename = city_filename(city)
+        digest = build_digest(GENERATOR_VERSION, source_digest, city_config(city, all_known_channel_names, aliases, logos, scores))
+        if not force and manifest.is_current(filename, digest):
+            manifest.keep(filename)
+            print(f"Unchanged: {filename}")
+            continue
+
+        if shared_channels is None:
+            all_channels = scores.rank(parse_m3u() if channels is None else channels)
+            # 地方台由 CITY_CHANNELS 单独提供，公共频道只需筛选一次
+            shared_channels = compile_channels(with_tvg_ids(
+                (ch for ch in all_channels if ch.name not in all_known_channel_names), aliases, logos, unmatched))
+
+        variant = city_variant(city, remap)
         city_channels = CITY_CHANNELS.get(city, [])
 
-        output_lines = ['#EXTM3U url-tvg="https://gh-proxy.org/https://raw.githubusercontent.com/sggc/SDU-IPTV-PRO/main/EPG/sggc.xml.gz"']
-
-        for ch in all_channels:
-            name_match = re.search(r',(.+)$', ch["extinf"])
-            channel_name = name_match.group(1).strip() if name_match else ch["name"]
+        output_lines = [city_header(city)]
+        output_lines.extend(render_urls(shared_channels, variant))
+        output_lines.extend(render_urls(compile_channels(with_tvg_ids(
+            (Channel(ch["extinf"], ch["url"]) for ch in city_channels), aliases, logos, unmatched)), variant))
 
-            if channel_name in all_known_channel_names:
-                continue
-
-            modified_url = replace_ip_segment(ch["url"], city_code, fcc)
-            output_lines.append(ch["extinf"])
-            output_lines.append(modified_url)
-
-        for ch in city_channels:
-            modified_url = replace_ip_segment(ch["url"], city_code, fcc)
-            output_lines.append(ch["extinf"])
-            output_lines.append(modified_url)
-
-        output_file = OUTPUT_DIR / f"SDU-Multicast-{CITY_NAMES_EN[city]}.m3u"
-        with open(output_file, "w", encoding="utf-8") as f:
-            f.write("\n".join(output_lines))
+        manifest.write(filename, digest, "\n".join(output_lines))
 
         ch_count = len(city_channels)
         status = "" if ch_count > 0 else " [无地方台数据]"
-        print(f"Generated: {output_file.name} ({ch_count} channels){status}")
+        print(f"Generated: {filename} ({ch_count} channels){status}")
+
+    manifest.finish()
+    if unmatched:
+        unmatched = list(dict.fromkeys(unmatched))
+        print(f"EPG 中没有的频道，未写入 tvg-id ({len(unmatched)}): {', '.join(unmatched)}")
 
 if __name__ == "__main__":
     generate_sdu_multicast()
@@ -0,0 +1,280 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+带条件请求的上游源下载
+
+每个源在 .data/ 下有一个状态文件，记录上次成功处理时的
+ETag、Last-Modified 和内容摘要 (MD5)，旁边的 .last 文件保存
+当时的内容（最后一份可用的副本）。下载时带上
+If-None-Match / If-Modified-Since，服务器返回 304 时不传输正文，
+调用方可以直接跳过后续处理。.last 副本不提交到仓库（见 .gitignore），
+工作流用 actions/cache 保留；没有副本时 304 的源由调用方重新下载完整内容。
+
+所有请求共用一个带连接池的 Session，同一主机的并发连接数受
+MAX_PER_HOST 限制；连接失败、超时、429 和 5xx 会按带抖动的
+指数退避重试。fetch_source 在重试耗尽后退回到最后一份可用的副本。
+
+状态不会在下载时自动保存：调用方在处理成功后再调用 save_state，
+这样处理中途失败时，下次运行仍会重新下载。
+"""
+
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+DEFAULT_TIMEOUT = 30
+# 同一主机同时进行的请求数上限
+MAX_PER_HOST = 2
+# 重试次数（不含第一次请求）与退避参数（秒）
+RETRIES = 3
+BACKOFF_BASE = 1.0
+BACKOFF_MAX = 20.0
+RETRY_STATUS = (429, 500, 502, 503, 504)
+
+_session = None
+_session_lock = threading.Lock()
+_host_limits = {}
+
+
+def get_session():
+    """进程内共享的 keep-alive Session"""
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=8, pool_maxsize=MAX_PER_HOST)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            _session = session
+        return _session
+
+
+def _host_limit(url):
+    host = urlsplit(url).netloc
+    with _session_lock:
+        if host not in _host_limits:
+            _host_limits[host] = threading.BoundedSemaphore(MAX_PER_HOST)
+        return _host_limits[host]
+
+
+def backoff_delay(attempt):
+    """第 attempt 次重试前的等待时间：指数退避 + 全量抖动"""
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+
+
+def content_digest(data):
+    """内容摘要，与原先 .data/*_hash.txt 中的 MD5 一致"""
+    if isinstance(data, str):
+        data = data.encode('utf-8')
+    return hashlib.md5(data).hexdigest()
+
+
+def last_good_path(state_file):
+    """状态文件对应的内容副本路径"""
+    return os.path.splitext(state_file)[0] + '.last'
+
+
+def load_state(state_file):
+    """读取源的状态文件，不存在或损坏时返回空字典"""
+    if not os.path.exists(state_file):
+        return {}
+    try:
+        with open(state_file, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"警告: 状态文件 {state_file} 无法读取，将重新下载: {e}")
+        return {}
+
+
+def load_last_good(state_file, digest):
+    """读取最后一份可用的副本（字节），内容摘要与记录不符时返回 None"""
+    path = last_good_path(state_file)
+    if not digest or not os.path.exists(path):
+        return None
+    with open(path, 'rb') as f:
+        data = f.read()
+    if content_digest(data) != digest:
+        print(f"警告: {path} 与状态记录不一致，忽略该副本")
+        return None
+    return data
+
+
+class Source:
+    """一个上游源的配置"""
+
+    __slots__ = ('name', 'url', 'state_file', 'headers', 'timeout')
+
+    def __init__(self, name, url, state_file, headers=None, timeout=DEFAULT_TIMEOUT):
+        self.name = name
+        self.url = url
+        self.state_file = state_file
+        self.headers = headers or {}
+        self.timeout = timeout
+
+
+class FetchResult:
+    """一次条件下载的结果"""
+
+    __slots__ = ('url', 'status', 'content', 'digest', 'etag', 'last_modified',
+                 'previous_digest', 'attempts', 'error')
+
+    def __init__(self, url, status, content, digest, etag, last_modified, previous_digest,
+                 attempts=1, error=None):
+        self.url = url
+        self.status = status
+        self.content = content
+        self.digest = digest
+        self.etag = etag
+        self.last_modified = last_modified
+        self.previous_digest = previous_digest
+        self.attempts = attempts
+        self.error = error
+
+    @property
+    def text(self):
+        """按 UTF-8 解码的内容，没有内容时为 None"""
+        if self.content is None:
+            return None
+        return self.content.decode('utf-8', errors='replace')
+
+    @property
+    def not_modified(self):
+        """服务器返回 304；有副本时 content 为上次的内容，否则为 None"""
+        return self.status == 304
+
+    @property
+    def fallback(self):
+        """下载失败，content 为最后一份可用的副本"""
+        return self.error is not None
+
+    @property
+    def changed(self):
+        """内容与上次成功处理时不同（没有记录时视为变化）"""
+        return not self.not_modified and not self.fallback and self.digest != self.previous_digest
+
+
+def _request(url, headers, timeout, retries):
+    """带重试的 GET，返回 (response, 尝试次数)"""
+    session = get_session()
+    limit = _host_limit(url)
+    attempt = 0
+    while True:
+        attempt += 1
+        try:
+            with limit:
+                response = session.get(url, headers=headers, timeout=timeout)
+            if response.status_code not in RETRY_STATUS or attempt > retries:
+                return response, attempt
+            reason = f"HTTP {response.status_code}"
+        except (requests.ConnectionError, requests.Timeout) as e:
+            if attempt > retries:
+                raise
+            reason = type(e).__name__
+        delay = backoff_delay(attempt - 1)
+        print(f"请求失败 ({reason})，{delay:.1f} 秒后第 {attempt} 次重试: {url}")
+        time.sleep(delay)
+
+
+def conditional_get(url, state_file, headers=None, timeout=DEFAULT_TIMEOUT, conditional=True,
+                    retries=RETRIES):
+    """
+    下载 url，有状态记录时带上条件请求头
+
+    conditional=False 时忽略记录强制下载完整内容，
+    用于上游未变化但本地需要重新生成的场景。
+    """
+    state = load_state(state_file)
+    previous_digest = state.get('digest')
+
+    request_headers = dict(headers or {})
+    if conditional and previous_digest and state.get('url') == url:
+        if state.get('etag'):
+            request_headers['If-None-Match'] = state['etag']
+        if state.get('last_modified'):
+            request_headers['If-Modified-Since'] = state['last_modified']
+
+    response, attempts = _request(url, request_headers, timeout, retries)
+    if response.status_code == 304:
+        print(f"源未变化 (304 Not Modified): {url}")
+        return FetchResult(url, 304, load_last_good(state_file, previous_digest), previous_digest,
+                           state.get('etag'), state.get('last_modified'), previous_digest,
+                           attempts)
+
+    response.raise_for_status()
+    digest = content_digest(response.content)
+    print(f"已下载 {len(response.content)} 字节: {url}")
+    return FetchResult(url, response.status_code, response.content, digest,
+                       response.headers.get('ETag'), response.headers.get('Last-Modified'),
+                       previous_digest, attempts)
+
+
+def fetch_source(source, conditional=True):
+    """
+    下载一个源；重试耗尽仍失败时退回到最后一份可用的副本
+
+    没有副本可用时重新抛出异常。
+    """
+    try:
+        return conditional_get(source.url, source.state_file, headers=source.headers,
+                               timeout=source.timeout, conditional=conditional)
+    except requests.RequestException as e:
+        state = load_state(source.state_file)
+        content = load_last_good(source.state_file, state.get('digest'))
+        if content is None:
+            raise
+        print(f"警告: [{source.name}] 下载失败 ({e})，使用最后一份可用的副本")
+        return FetchResult(source.url, None, content, state['digest'], state.get('etag'),
+                           state.get('last_modified'), state['digest'], RETRIES + 1, e)
+
+
+def save_state(state_file, result):
+    """处理成功后保存验证器、摘要和内容副本，供下次条件请求和失败回退使用"""
+    if result.fallback:
+        return
+    state = {
+        'url': result.url,
+        'etag': result.etag,
+        'last_modified': result.last_modified,
+        'digest': result.digest,
+    }
+    os.makedirs(os.path.dirname(state_file) or '.', exist_ok=True)
+    if result.content is not None:
+        with open(last_good_path(state_file), 'wb') as f:
+            f.write(result.content)
+    with open(state_file, 'w', encoding='utf-8') as f:
+        json.dump(state, f, ensure_ascii=False, indent=2)
+        f.write('\n')
+
+
+def describe_change(result):
+    """打印变化情况，返回是否需要继续处理"""
+    if result.not_modified:
+        print("源文件没有变化 (304)，跳过处理")
+        return False
+    if result.fallback:
+        print("源文件下载失败，沿用上次的处理结果")
+        return False
+    if result.previous_digest is None:
+        print("首次运行，没有之前的哈希记录")
+        return True
+    if not result.changed:
+        print("源文件没有变化，跳过处理")
+        return False
+    print(f"源文件发生变化: 旧哈希 {result.previous_digest[:8]}... -> 新哈希 {result.digest[:8]}...")
+    return True
+
+
+def set_output(name, value):
+    """设置 GitHub Actions 输出变量"""
+    github_output = os.environ.get('GITHUB_OUTPUT')
+    if github_output:
+        with open(github_output, 'a') as f:
+            f.write(f"{name}={value}\n")
+    print(f"设置输出: {name}={value}")
@@ -0,0 +1,282 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+台标资源：去重、缩放和按内容寻址
+
+logo/ 中约 1900 个 PNG 共 78 MB，多数宽 500 像素左右，客户端每个 tvg-logo
+都要经 gh-proxy 下载原图；还有不少频道共用内容完全相同的图片。这里：
+
+  - 对 logo/ 中的全部文件计算 SHA-256，内容相同的文件只处理一次
+  - 为播放列表引用到的台标生成一份固定高度（LOGO_HEIGHT）的缩小版本，
+    无损 PNG（RGBA，optimize 压缩）
+  - 输出按源文件内容的摘要命名：logo-assets/<前两位>/<摘要>-h<高度>.<格式>，
+    同一内容无论被多少个路径引用都只有一份，源文件改动后自动换名
+  - logo-assets/index.json 记录 logo/ 路径 -> 摘要；生成器通过 LogoMap
+    把播放列表中指向 logo/ 的 tvg-logo 改写为缩小版本
+
+原图保持不动，外部直接引用 logo/ 的地址不受影响。--optimize-originals 会把
+logo/ 中的原图无损重新压缩（像素完全相同时才替换）。
+
+注意：缩小版本是在原图之外新增的文件，仓库总大小因此增加；为此只生成一种
+高度和格式（每个去重后的台标一个文件），不再生成多种尺寸、WebP 和精灵图。
+减少的是客户端的下载量（128 像素 PNG 约为原图的一半）。
+
+缩放依赖 Pillow（可选）：未安装时不生成新文件，已有的 index.json 保持不变。
+
+用法（在仓库根目录）:
+  python scripts/logo_assets.py [--force] [--optimize-originals]
+"""
+
+import argparse
+import glob
+import hashlib
+import io
+import json
+import os
+import re
+import unicodedata
+from urllib.parse import unquote
+
+from build_manifest import atomic_write, content_digest, write_if_changed
+from m3u_parser import Channel, iter_m3u_file
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+LOGO_DIR = "logo"
+ASSET_DIR = "logo-assets"
+INDEX_FILE = os.path.join(ASSET_DIR, "index.json")
+# 播放列表中仓库内文件的地址前缀
+REPO_URL = "https://gh-proxy.org/https://raw.githubusercontent.com/sggc/SDU-IPTV-PRO/main/"
+
+# 缩放或编码参数变化时递增，使全部缩小版本重新生成
+ASSET_VERSION = 3
+# 缩小版本的高度；格式固定为 PNG，客户端兼容性最好
+LOGO_HEIGHT = 128
+# 缩放后的最大宽高比，超宽的台标按宽度缩放
+MAX_ASPECT = 4
+
+# 引用台标的源播放列表（生成器的输入）
+SOURCE_PLAYLISTS = ["SDT-Unicast.m3u", "SDM-Unicast.m3u", "SDM-Unicast-Rtsp.m3u", "SDU-Multicast.m3u"]
+
+_LOGO_ATTR_PATTERN = re.compile(r'tvg-logo="([^"]*)"')
+
+
+def normalize_path(path):
+    """URL 解码并转为 NFC 的相对路径，以 / 分隔"""
+    return unicodedata.normalize('NFC', unquote(path)).replace(os.sep, '/')
+
+
+def logo_path(url):
+    """指向仓库 logo/ 目录的 tvg-logo 地址对应的本地路径（normalize_path 的形式），其他地址返回 None"""
+    if not url.startswith(REPO_URL + LOGO_DIR + '/'):
+        return None
+    return normalize_path(url[len(REPO_URL):])
+
+
+def asset_name(digest, height=LOGO_HEIGHT):
+    """缩小版本在 ASSET_DIR 中的相对路径"""
+    return f"{digest[:2]}/{digest}-h{height}.png"
+
+
+def hash_logos(root=LOGO_DIR):
+    """一次遍历 root，返回 {路径（normalize_path 的形式）: 内容摘要前 16 位}"""
+    hashes = {}
+    for directory, _, filenames in os.walk(root):
+        for filename in filenames:
+            path = os.path.join(directory, filename)
+            with open(path, 'rb') as f:
+                hashes[normalize_path(path)] = hashlib.sha256(f.read()).hexdigest()[:16]
+    return hashes
+
+
+def render_logo(path):
+    """把一个台标缩小到 LOGO_HEIGHT，返回 PNG 字节"""
+    with Image.open(path) as image:
+        image = image.convert('RGBA')
+    # 只缩小不放大
+    image.thumbnail((LOGO_HEIGHT * MAX_ASPECT, LOGO_HEIGHT), Image.LANCZOS)
+    buffer = io.BytesIO()
+    # 无损：保留 RGBA 像素，只用 optimize 选择最小的压缩参数
+    image.save(buffer, 'PNG', optimize=True)
+    return buffer.getvalue()
+
+
+def collect_logo_urls(channels):
+    """频道（m3u_parser.Channel）引用的全部 tvg-logo 地址"""
+    return {ch.attr('tvg-logo') for ch in channels if ch.attr('tvg-logo')}
+
+
+def generator_channels(load=iter_m3u_file):
+    """
+    生成器用到的全部频道：源播放列表 + SDU 生成器内置的地方台
+    load(路径) 返回播放列表中的频道，pipeline 传入已解析的结果
+    """
+    import generate_sdu_multicast
+    channels = []
+    for path in SOURCE_PLAYLISTS:
+        if os.path.exists(path):
+            channels.extend(load(path))
+    for city_channels in generate_sdu_multicast.CITY_CHANNELS.values():
+        channels.extend(Channel(ch["extinf"], ch["url"]) for ch in city_channels)
+    return channels
+
+
+def load_index(index_file=INDEX_FILE):
+    """读取 INDEX_FILE，文件不存在时返回空字典"""
+    if not os.path.exists(index_file):
+        return {}
+    with open(index_file, 'rb') as f:
+        return json.loads(f.read())
+
+
+def build_assets(urls, force=False):
+    """
+    为 urls 中指向 logo/ 的台标生成缩小版本并更新 INDEX_FILE，删除不再引用的文件
+    返回是否成功；未安装 Pillow 时不做改动
+    """
+    if Image is None:
+        print("Warning: 未安装 Pillow，跳过台标缩小版本生成")
+        return True
+
+    if not force and load_index().get('version', ASSET_VERSION) != ASSET_VERSION:
+        # 文件名不含版本号，版本变化时已有的文件也要重新生成
+        force = True
+
+    hashes = hash_logos()
+    referenced, missing = {}, set()
+    for url in urls:
+        path = logo_path(url)
+        if path is None:
+            continue
+        if path in hashes:
+            referenced[path] = hashes[path]
+        else:
+            missing.add(path)
+
+    # 摘要 -> 第一个引用它的路径（按路径排序），内容相同的台标只处理一次
+    sources = {}
+    for path in sorted(referenced):
+        sources.setdefault(referenced[path], path)
+
+    expected = set()
+    written = 0
+    for digest, path in sources.items():
+        name = asset_name(digest)
+        expected.add(name)
+        if not force and os.path.exists(os.path.join(ASSET_DIR, name)):
+            continue
+        if write_if_changed(os.path.join(ASSET_DIR, name), render_logo(path)):
+            written += 1
+
+    removed = 0
+    for path in glob.glob(os.path.join(ASSET_DIR, '*', '*')):
+        if os.path.relpath(path, ASSET_DIR).replace(os.sep, '/') not in expected:
+            os.remove(path)
+            removed += 1
+
+    index = {"version": ASSET_VERSION, "height": LOGO_HEIGHT, "logos": dict(sorted(referenced.items()))}
+    write_if_changed(INDEX_FILE, json.dumps(index, ensure_ascii=False, indent=2) + '\n')
+
+    original_size = sum(os.path.getsize(path) for path in referenced)
+    variant_size = sum(os.path.getsize(os.path.join(ASSET_DIR, asset_name(digest)))
+                       for digest in referenced.values())
+    print(f"{ASSET_DIR}: 引用 {len(referenced)} 个台标，去重后 {len(sources)} 个；"
+          f"写出 {written} 个文件，删除 {removed} 个")
+    print(f"  - 客户端下载量: 原图 {original_size} 字节 -> {LOGO_HEIGHT} 像素 PNG {variant_size} 字节")
+    if missing:
+        print(f"  - logo/ 中不存在的台标 ({len(missing)}): {', '.join(sorted(missing))}")
+    return True
+
+
+def duplicate_groups(hashes):
+    """内容相同的台标分组（只返回有重复的组）"""
+    groups = {}
+    for path, digest in sorted(hashes.items()):
+        groups.setdefault(digest, []).append(path)
+    return [paths for paths in groups.values() if len(paths) > 1]
+
+
+def optimize_originals(root=LOGO_DIR):
+    """无损重新压缩 root 中的 PNG：解码后像素完全相同且更小时才替换，返回节省的字节数"""
+    saved = 0
+    for directory, _, filenames in os.walk(root):
+        for filename in filenames:
+            path = os.path.join(directory, filename)
+            with open(path, 'rb') as f:
+                original = f.read()
+            with Image.open(io.BytesIO(original)) as image:
+                if image.format != 'PNG':
+                    continue
+                image.load()
+                buffer = io.BytesIO()
+                image.save(buffer, 'PNG', optimize=True)
+            optimized = buffer.getvalue()
+            if len(optimized) >= len(original):
+                continue
+            with Image.open(io.BytesIO(optimized)) as check, Image.open(io.BytesIO(original)) as source:
+                if check.mode != source.mode or check.tobytes() != source.tobytes():
+                    continue
+            atomic_write(path, optimized)
+            saved += len(original) - len(optimized)
+    return saved
+
+
+class LogoMap:
+    """播放列表 tvg-logo 的改写表，来自 INDEX_FILE；文件不存在时不改写"""
+
+    def __init__(self, index_file=INDEX_FILE):
+        self.logos = {}
+        self.digest = ""
+        if os.path.exists(index_file):
+            with open(index_file, 'rb') as f:
+                content = f.read()
+            self.logos = json.loads(content).get('logos', {})
+            self.digest = content_digest(content)
+
+    def __len__(self):
+        return len(self.logos)
+
+    def url(self, url):
+        """改写后的台标地址；不在索引中的地址原样返回"""
+        path = logo_path(url)
+        digest = self.logos.get(path) if path else None
+        if digest is None:
+            return url
+        return f"{REPO_URL}{ASSET_DIR}/{asset_name(digest)}"
+
+    def rewrite(self, extinf):
+        """改写 EXTINF 行中的 tvg-logo"""
+        if not self.logos:
+            return extinf
+        return _LOGO_ATTR_PATTERN.sub(lambda m: f'tvg-logo="{self.url(m.group(1))}"', extinf)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="台标去重、缩放和按内容寻址")
+    parser.add_argument('--force', action='store_true', help="重新生成全部缩小版本")
+    parser.add_argument('--optimize-originals', action='store_true', help="无损重新压缩 logo/ 中的原图")
+    args = parser.parse_args()
+
+    hashes = hash_logos()
+    groups = duplicate_groups(hashes)
+    total = sum(os.path.getsize(path) for path in hashes)
+    print(f"{LOGO_DIR}: {len(hashes)} 个文件, {total} 字节；"
+          f"{len(groups)} 组重复, 多出 {sum(len(paths) - 1 for paths in groups)} 个文件")
+    for paths in groups:
+        print(f"  - {' = '.join(paths)}")
+
+    if args.optimize_originals:
+        if Image is None:
+            print("Warning: 未安装 Pillow，无法重新压缩原图")
+            return 1
+        print(f"无损重新压缩原图，节省 {optimize_originals()} 字节")
+
+    build_assets(collect_logo_urls(generator_channels()), force=args.force)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
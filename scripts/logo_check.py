@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+台标引用检查
+
+播放列表和 generate_sdu_multicast.CITY_CHANNELS 中的 tvg-logo 大多指向仓库的 logo/
+目录，文件名里有空格和中文，地址中可能是百分号编码，也可能是 NFD 形式的字符
+（macOS 上保存的文件）。这里只遍历一次 logo/，建立规范化路径的索引：
+
+  - 路径统一为 NFC，地址先做 URL 解码
+  - 精确路径、忽略大小写的路径、规范化后的台标名（epg_alias.normalize_name）各一个字典
+
+生成的播放列表中的 tvg-logo 已改写为 logo-assets/ 中的缩小版本（见 logo_assets），
+这类地址通过 logo-assets/index.json 反查：资源名必须对应索引中某个摘要的变体，
+文件也必须存在；它们对应的 logo/ 原图算作被引用。
+
+之后每个 tvg-logo 的检查都只是字典查询。报告：
+  - 不存在的台标，附上按台标名和编辑距离找到的候选
+  - 只有大小写不同的台标（Windows / macOS 上能打开，raw.githubusercontent.com 上 404）
+  - 不在 index.json 中或文件不存在的 logo-assets/ 变体
+  - logo/ 中没有被任何播放列表引用的文件
+
+用法（在仓库根目录）:
+  python scripts/logo_check.py [播放列表或通配符 ...] [--unused]
+
+有不存在或大小写不符的台标、失效的变体时返回 1。
+"""
+
+import argparse
+import difflib
+import glob
+import os
+import re
+import time
+
+from epg_alias import normalize_name
+from logo_assets import ASSET_DIR, INDEX_FILE, LOGO_DIR, REPO_URL, asset_name, load_index, normalize_path
+
+# 默认检查的播放列表：源文件、生成的分城市文件和外部播放列表
+DEFAULT_PLAYLISTS = [
+    "*.m3u",
+    "SDT-Unicast/*.m3u",
+    "SDM-Unicast/*.m3u",
+    "SDM-Unicast-Rtsp/*.m3u",
+    "SDU-Multicast/*.m3u",
+    "SDU-Unicast/*.m3u",
+    "external/*.m3u",
+    "custom/*.m3u",
+    ".github/expand/*.m3u",
+]
+# generate_sdu_multicast.CITY_CHANNELS 中的引用在报告中的来源名
+CITY_CHANNELS_SOURCE = "generate_sdu_multicast.py"
+MAX_SUGGESTIONS = 3
+
+_LOGO_URL_PATTERN = re.compile(r'tvg-logo="([^"]*)"')
+_LOGO_PREFIX = REPO_URL + LOGO_DIR + '/'
+_ASSET_PREFIX = REPO_URL + ASSET_DIR + '/'
+
+
+def _stem_key(path):
+    return normalize_name(os.path.splitext(os.path.basename(path))[0])
+
+
+class LogoIndex:
+    """logo/ 目录的规范化路径索引，构建时只遍历一次目录"""
+
+    def __init__(self, root=LOGO_DIR):
+        self.root = root
+        # NFC 路径 -> 磁盘上的路径
+        self.paths = {}
+        # 忽略大小写的 NFC 路径 -> 磁盘上的路径
+        self.folded = {}
+        # 规范化后的台标名 -> [磁盘上的路径]
+        self.by_name = {}
+        for directory, _, filenames in os.walk(root):
+            for filename in filenames:
+                path = os.path.join(directory, filename).replace(os.sep, '/')
+                key = normalize_path(path)
+                self.paths[key] = path
+                self.folded.setdefault(key.casefold(), path)
+                self.by_name.setdefault(_stem_key(path), []).append(path)
+
+    def __len__(self):
+        return len(self.paths)
+
+    def lookup(self, path):
+        """返回 (状态, 磁盘上的路径)，状态为 'ok' / 'case' / 'missing'"""
+        key = normalize_path(path)
+        found = self.paths.get(key)
+        if found is not None:
+            return 'ok', found
+        found = self.folded.get(key.casefold())
+        if found is not None:
+            return 'case', found
+        return 'missing', None
+
+    def suggest(self, path, limit=MAX_SUGGESTIONS):
+        """不存在的台标的候选：台标名规范化后相同的文件优先，其次按台标名的相似度"""
+        key = _stem_key(normalize_path(path))
+        directory = os.path.dirname(normalize_path(path))
+        candidates = list(self.by_name.get(key, []))
+        if len(candidates) < limit:
+            for close in difflib.get_close_matches(key, self.by_name, n=limit, cutoff=0.6):
+                candidates.extend(self.by_name[close])
+        # 同一目录下的候选排在前面
+        candidates = sorted(dict.fromkeys(candidates), key=lambda p: os.path.dirname(p) != directory)
+        return candidates[:limit]
+
+
+class AssetIndex:
+    """logo-assets/index.json 中全部变体的资源名 -> 对应的 logo/ 路径"""
+
+    def __init__(self, index_file=INDEX_FILE, root=ASSET_DIR):
+        self.root = root
+        self.sources = {}
+        index = load_index(index_file)
+        height = index.get('height')
+        if height is None:
+            # 旧版本的索引，下次生成时会重建
+            return
+        for path, digest in index.get('logos', {}).items():
+            self.sources.setdefault(asset_name(digest, height), []).append(path)
+
+    def lookup(self, path):
+        """
+        检查 logo-assets/ 下的路径，返回 (状态, 对应的 logo/ 路径列表)，
+        状态为 'ok' / 'unindexed'（不在索引中）/ 'missing'（在索引中但文件不存在）
+        """
+        name = normalize_path(path)[len(ASSET_DIR) + 1:]
+        sources = self.sources.get(name)
+        if sources is None:
+            return 'unindexed', []
+        if not os.path.isfile(os.path.join(self.root, name)):
+            return 'missing', sources
+        return 'ok', sources
+
+
+def logo_reference(url):
+    """指向 logo/ 或 logo-assets/ 目录的 tvg-logo 地址中的路径，其他地址返回 None"""
+    if not url.startswith((_LOGO_PREFIX, _ASSET_PREFIX)):
+        return None
+    return url[len(REPO_URL):]
+
+
+def is_asset(path):
+    return path.startswith(ASSET_DIR + '/')
+
+
+def collect_references(patterns=DEFAULT_PLAYLISTS, include_city_channels=True):
+    """{logo/ 或 logo-assets/ 中的路径（未解码）: [引用它的来源]}，按来源的出现顺序"""
+    references = {}
+
+    def add(url, source):
+        path = logo_reference(url)
+        if path is not None:
+            sources = references.setdefault(path, [])
+            if source not in sources:
+                sources.append(source)
+
+    for pattern in patterns:
+        for playlist in sorted(glob.glob(pattern)):
+            with open(playlist, 'r', encoding='utf-8', errors='replace') as f:
+                for url in _LOGO_URL_PATTERN.findall(f.read()):
+                    add(url, playlist)
+
+    if include_city_channels:
+        import generate_sdu_multicast
+        for city_channels in generate_sdu_multicast.CITY_CHANNELS.values():
+            for ch in city_channels:
+                for url in _LOGO_URL_PATTERN.findall(ch["extinf"]):
+                    add(url, CITY_CHANNELS_SOURCE)
+    return references
+
+
+def check(index, references, assets):
+    """
+    返回 (不存在的 {路径: 来源}, 大小写不符的 {路径: 磁盘上的路径}, 未被引用的 [路径],
+    失效的变体 {路径: (状态, 来源)})
+    """
+    missing, mismatched, used, broken = {}, {}, set(), {}
+    for path, sources in references.items():
+        if is_asset(path):
+            state, originals = assets.lookup(path)
+            if state != 'ok':
+                broken[normalize_path(path)] = (state, sources)
+            for original in originals:
+                found = index.lookup(original)[1]
+                if found is not None:
+                    used.add(found)
+            continue
+        state, found = index.lookup(path)
+        if state == 'missing':
+            # 编码不同的地址可能指向同一个路径
+            missing.setdefault(normalize_path(path), []).extend(sources)
+            continue
+        used.add(found)
+        if state == 'case':
+            mismatched[normalize_path(path)] = found
+    unused = sorted(set(index.paths.values()) - used)
+    return missing, mismatched, unused, broken
+
+
+def _format_sources(sources):
+    if len(sources) <= 2:
+        return ', '.join(sources)
+    return f"{sources[0]} 等 {len(sources)} 个文件"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="检查播放列表中的 tvg-logo 是否存在于 logo/")
+    parser.add_argument('playlists', nargs='*', default=DEFAULT_PLAYLISTS, help="播放列表或通配符")
+    parser.add_argument('--unused', action='store_true', help="列出未被引用的台标文件")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    index = LogoIndex()
+    assets = AssetIndex()
+    references = collect_references(args.playlists)
+    missing, mismatched, unused, broken = check(index, references, assets)
+    elapsed = time.perf_counter() - start
+
+    asset_count = sum(1 for path in references if is_asset(path))
+    print(f"{LOGO_DIR}: {len(index)} 个文件；引用 {len(references) - asset_count} 个路径，"
+          f"不存在 {len(missing)} 个，大小写不符 {len(mismatched)} 个，未被引用 {len(unused)} 个；"
+          f"{ASSET_DIR}: 引用 {asset_count} 个变体，失效 {len(broken)} 个 "
+          f"({elapsed * 1000:.0f} ms)")
+    for path, sources in sorted(missing.items()):
+        suggestions = index.suggest(path)
+        hint = f" -> 候选: {', '.join(suggestions)}" if suggestions else ""
+        print(f"  - 不存在: {path} ({_format_sources(sources)}){hint}")
+    for path, found in sorted(mismatched.items()):
+        print(f"  - 大小写不符: {path} -> {found}")
+    for path, (state, sources) in sorted(broken.items()):
+        reason = f"不在 {INDEX_FILE} 中" if state == 'unindexed' else "文件不存在"
+        print(f"  - 变体{reason}: {path} ({_format_sources(sources)})")
+    if args.unused:
+        for path in unused:
+            print(f"  - 未被引用: {path}")
+    return 1 if missing or mismatched or broken else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+结构化的播放列表合并
+
+按顺序读入多个播放列表（流式解析，见 m3u_parser），按键去重后输出：
+只有一行 #EXTM3U，没有空行，频道按第一次出现的位置排列。
+
+键默认是 (tvg-name, 播放地址)，tvg-name 为空时用显示名称。后加入的文件中
+键已经存在的频道按该文件的策略处理：
+
+  skip      保留先出现的频道，丢弃后来的（默认）
+  override  用后来的频道替换先出现的，位置不变
+  append    删除先出现的频道，把后来的放到末尾
+  keep      不去重，全部保留（用于基础文件：规则复制出的频道与原频道键相同，
+            例如复制到央视频道的山东卫视，两者都要保留）
+
+策略和键可以由调用方指定，也可以写在文件自己的 #EXTM3U 行上：
+  #EXTM3U x-merge-policy="override" x-merge-key="tvg-name"
+这两个属性不会出现在输出中。
+
+频道的指令行（#EXTVLCOPT、#KODIPROP、#EXTGRP 等）跟随频道一起去重和输出。
+第一个输入文件头部的注释（如处理规则说明）写在输出的 #EXTM3U 行之后，
+之后输入的文件头注释跟随该文件的第一个频道。
+
+所有操作都是字典查询，时间和内存与输入总大小成线性关系。
+"""
+
+import hashlib
+import re
+
+from m3u_parser import EXTM3U_PREFIX, M3UReader, is_directive, tokenize_extinf
+
+POLICIES = ('skip', 'override', 'append', 'keep')
+DEFAULT_POLICY = 'skip'
+# 可以作为键的字段
+KEY_FIELDS = ('tvg-name', 'tvg-id', 'name', 'url')
+DEFAULT_KEY = ('tvg-name', 'url')
+
+POLICY_ATTR = 'x-merge-policy'
+KEY_ATTR = 'x-merge-key'
+_MERGE_ATTR_PATTERN = re.compile(r'\s+x-merge-[\w-]+="[^"]*"')
+
+
+def parse_key(spec):
+    """"tvg-name+url" 形式的键描述转为字段元组"""
+    fields = tuple(field.strip() for field in spec.split('+') if field.strip())
+    unknown = [field for field in fields if field not in KEY_FIELDS]
+    if not fields or unknown:
+        raise ValueError(f"无效的合并键: {spec!r}，可用字段: {', '.join(KEY_FIELDS)}")
+    return fields
+
+
+def channel_key(channel, fields):
+    """频道在 fields 上的键"""
+    values = []
+    for field in fields:
+        if field == 'url':
+            values.append(channel.url)
+        elif field == 'name':
+            values.append(channel.name)
+        elif field == 'tvg-name':
+            values.append(channel.tvg_name or channel.name)
+        else:
+            values.append(channel.attr(field))
+    return tuple(values)
+
+
+def header_options(header):
+    """#EXTM3U 行上的合并选项：(策略, 键字段)，未指定的为 None"""
+    attrs, _, _ = tokenize_extinf(header)
+    policy = attrs.get(POLICY_ATTR) or None
+    if policy is not None and policy not in POLICIES:
+        raise ValueError(f"无效的合并策略: {policy!r}，可用策略: {', '.join(POLICIES)}")
+    key = attrs.get(KEY_ATTR)
+    return policy, parse_key(key) if key else None
+
+
+class MergeStats:
+    """一个输入的合并结果"""
+
+    __slots__ = ('label', 'policy', 'added', 'replaced', 'moved', 'skipped')
+
+    def __init__(self, label, policy):
+        self.label = label
+        self.policy = policy
+        self.added = self.replaced = self.moved = self.skipped = 0
+
+    def __str__(self):
+        parts = [f"新增 {self.added}"]
+        if self.replaced:
+            parts.append(f"替换 {self.replaced}")
+        if self.moved:
+            parts.append(f"移到末尾 {self.moved}")
+        if self.skipped:
+            parts.append(f"重复跳过 {self.skipped}")
+        return f"{self.label} [{self.policy}]: {', '.join(parts)}"
+
+
+class PlaylistMerger:
+    """按顺序加入播放列表，输出去重后的结果"""
+
+    def __init__(self, key=DEFAULT_KEY):
+        self.key = tuple(key)
+        # 序号 -> Channel；dict 保持插入顺序，即输出顺序
+        self.channels = {}
+        # 键字段 -> {键: 序号}，每种用到的键一个索引，频道变化时一起维护
+        self._indexes = {}
+        self._next = 0
+        self.header = None
+        # 第一个输入的文件头注释，为 None 时还没有加入任何输入
+        self.comments = None
+
+    def __len__(self):
+        return len(self.channels)
+
+    def _index(self, fields):
+        index = self._indexes.get(fields)
+        if index is None:
+            # 第一次用到这种键时按现有频道建立索引
+            index = self._indexes[fields] = {}
+            for number, channel in self.channels.items():
+                index.setdefault(channel_key(channel, fields), number)
+        return index
+
+    def _insert(self, channel):
+        number = self._next
+        self._next += 1
+        self.channels[number] = channel
+        for fields, index in self._indexes.items():
+            index.setdefault(channel_key(channel, fields), number)
+        return number
+
+    def _unindex(self, number):
+        for fields, index in self._indexes.items():
+            k = channel_key(self.channels[number], fields)
+            if index.get(k) == number:
+                del index[k]
+
+    def _replace(self, number, channel):
+        """替换序号 number 的频道，保持原来的位置"""
+        self._unindex(number)
+        self.channels[number] = channel
+        for fields, index in self._indexes.items():
+            index.setdefault(channel_key(channel, fields), number)
+
+    def _remove(self, number):
+        self._unindex(number)
+        del self.channels[number]
+
+    def add(self, source, policy=None, key=None, label=""):
+        """
+        加入一个播放列表（文件对象、字节流或文本，见 M3UReader）
+        policy / key 省略时依次取文件 #EXTM3U 行上的设置和默认值；返回 MergeStats
+        """
+        reader = M3UReader(source)
+        stats = index = fields = None
+        for channel in reader:
+            if stats is None:
+                # #EXTM3U 行和文件头注释在第一个频道之前，此时已经读到
+                stats, fields = self._options(reader.header, policy, key, label)
+                index = self._index(fields)
+                if self.comments is None:
+                    self.comments = reader.comments
+                elif reader.comments:
+                    channel.directives = tuple(reader.comments) + channel.directives
+            number = None if stats.policy == 'keep' else index.get(channel_key(channel, fields))
+            if number is None:
+                self._insert(channel)
+                stats.added += 1
+            elif stats.policy == 'override':
+                self._replace(number, channel)
+                stats.replaced += 1
+            elif stats.policy == 'append':
+                self._remove(number)
+                self._insert(channel)
+                stats.moved += 1
+            else:
+                stats.skipped += 1
+        if stats is None:
+            stats, _ = self._options(reader.header, policy, key, label)
+            if self.comments is None:
+                self.comments = reader.comments
+        return stats
+
+    def _options(self, header, policy, key, label):
+        header_policy, header_key = header_options(header)
+        header = _MERGE_ATTR_PATTERN.sub('', header)
+        if self.header is None and header != EXTM3U_PREFIX:
+            # 输出使用第一个带其他属性（如 x-tvg-url）的 #EXTM3U 行
+            self.header = header
+        policy = policy or header_policy or DEFAULT_POLICY
+        if policy not in POLICIES:
+            raise ValueError(f"无效的合并策略: {policy!r}，可用策略: {', '.join(POLICIES)}")
+        return MergeStats(label, policy), tuple(key or header_key or self.key)
+
+    def reorder(self, order):
+        """
+        按 order(频道列表) 返回的顺序重新排列频道（如 stream_score.ScoreTable.rank），
+        返回位置改变的频道数；之后仍可继续 add
+        """
+        channels = list(self.channels.values())
+        ranked = order(channels)
+        self.channels, self._indexes, self._next = {}, {}, 0
+        for channel in ranked:
+            self._insert(channel)
+        return sum(1 for old, new in zip(channels, ranked) if old is not new)
+
+    def lines(self):
+        """逐行产出合并结果（不含换行符）"""
+        yield self.header or EXTM3U_PREFIX
+        yield from self.comments or ()
+        for channel in self.channels.values():
+            if channel.directives:
+                # 普通注释写在 EXTINF 行之前，指令行写在 EXTINF 行和播放地址之间
+                yield from (line for line in channel.directives if not is_directive(line))
+                yield channel.extinf
+                yield from (line for line in channel.directives if is_directive(line))
+            else:
+                yield channel.extinf
+            yield channel.url
+
+    def digest(self):
+        """合并结果的内容摘要（与 build_manifest.content_digest 相同），逐行计算，不拼出整个文件"""
+        h = hashlib.md5()
+        lines = self.lines()
+        h.update(next(lines).encode('utf-8'))
+        for line in lines:
+            h.update(b'\n')
+            h.update(line.encode('utf-8'))
+        return h.hexdigest()
+
+    def render(self):
+        """合并结果的完整文本"""
+        return "\n".join(self.lines())
+
+    def write(self, path):
+        """用一个带缓冲的文件对象逐行写出合并结果，不在内存中拼出整个文件"""
+        lines = self.lines()
+        with open(path, 'w', encoding='utf-8', newline='\n') as f:
+            f.write(next(lines))
+            for line in lines:
+                f.write('\n')
+                f.write(line)
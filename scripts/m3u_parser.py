@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+共享的流式 M3U 解析器
+
+逐行读取文件对象/字节流，按需产出紧凑的频道记录 (Channel)，
+不会把整个文件读入内存；频道属性在第一次访问时由 tokenize_extinf
+一次扫描解析出来并缓存在记录上。
+
+#EXTVLCOPT、#KODIPROP、#EXTGRP 等指令行和频道之间的注释行跟随其后的频道保存在
+Channel.directives 中；第一个频道之前的普通注释（如文件头的处理规则说明）
+保存在 M3UReader.comments 中。
+"""
+
+import io
+import re
+from sys import intern
+from types import MappingProxyType
+
+EXTM3U_PREFIX = '#EXTM3U'
+EXTINF_PREFIX = '#EXTINF:'
+
+# #EXTVLCOPT:、#KODIPROP: 这样的指令行，与普通注释相对
+_DIRECTIVE_PATTERN = re.compile(r'#[A-Z][A-Z0-9-]*:')
+
+# 一个 token 要么是 key="value" 属性，要么是引号之外的逗号及其后的显示名称
+_TOKEN_PATTERN = re.compile(r'([\w-]+)="([^"]*)"|(,)(.*)')
+
+
+def is_directive(line):
+    """line 是否为 #EXTVLCOPT:、#KODIPROP: 这样的指令行（而不是普通注释）"""
+    return _DIRECTIVE_PATTERN.match(line) is not None
+
+
+def tokenize_extinf(line):
+    """
+    一次扫描读出 EXTINF 行的全部属性和显示名称
+
+    返回 (只读属性表, 显示名称, 显示名称前逗号的位置)；
+    引号内的逗号不会被当作名称分隔符，重复的属性以第一次出现为准。
+    """
+    attrs = {}
+    for key, value, comma, name in _TOKEN_PATTERN.findall(line):
+        if comma:
+            return MappingProxyType(attrs), name.strip(), len(line) - len(name) - 1
+        if key not in attrs:
+            # 属性名在所有频道间共享同一个字符串对象
+            attrs[intern(key)] = value
+    return MappingProxyType(attrs), "", len(line)
+
+
+class Channel:
+    """
+    单个频道记录：EXTINF 行 + 播放地址，属性在第一次访问时解析并缓存；
+    directives 是属于这个频道的指令行和注释行（按原来的顺序）
+    """
+
+    __slots__ = ('extinf', 'url', 'directives', '_comma', '_name', '_attrs')
+
+    def __init__(self, extinf, url, directives=()):
+        self.extinf = extinf
+        self.url = url
+        self.directives = directives
+        self._comma = None
+        self._name = None
+        self._attrs = None
+
+    def __repr__(self):
+        return f"Channel({self.name!r}, {self.url!r})"
+
+    def _parse(self):
+        self._attrs, self._name, self._comma = tokenize_extinf(self.extinf)
+
+    @property
+    def head(self):
+        """EXTINF 行中显示名称之前的部分（不含逗号）"""
+        if self._attrs is None:
+            self._parse()
+        return self.extinf[:self._comma]
+
+    @property
+    def name(self):
+        """频道显示名称（EXTINF 行逗号之后的部分）"""
+        if self._attrs is None:
+            self._parse()
+        return self._name
+
+    @property
+    def canonical_extinf(self):
+        """规范化的 EXTINF 行：去掉显示名称两侧的空白"""
+        return f"{self.head},{self.name}"
+
+    @property
+    def attrs(self):
+        """EXTINF 行中的全部 key="value" 属性（只读）"""
+        if self._attrs is None:
+            self._parse()
+        return self._attrs
+
+    def attr(self, key, default=""):
+        """读取单个属性，不存在时返回 default"""
+        return self.attrs.get(key, default)
+
+    @property
+    def tvg_name(self):
+        return self.attr('tvg-name')
+
+    @property
+    def group_title(self):
+        return self.attr('group-title')
+
+    def set_attr(self, key, value):
+        """改写（或插入）一个属性，并清空已缓存的解析结果"""
+        replacement = f'{key}="{value}"'
+        if f'{key}=' in self.extinf:
+            self.extinf = re.sub(f'{re.escape(key)}="[^"]*"', lambda m: replacement, self.extinf)
+        else:
+            self.extinf = self.extinf.replace('#EXTINF:-1 ', f'#EXTINF:-1 {replacement} ', 1)
+        self._comma = None
+        self._name = None
+        self._attrs = None
+
+    def copy(self):
+        return Channel(self.extinf, self.url, self.directives)
+
+
+def _iter_lines(content):
+    """按行切分已在内存中的文本，不额外复制整段内容"""
+    find = content.find
+    start = 0
+    while True:
+        end = find('\n', start)
+        if end == -1:
+            yield content[start:]
+            return
+        yield content[start:end]
+        start = end + 1
+
+
+class M3UReader:
+    """
+    流式 M3U 读取器，迭代时逐个产出 Channel
+
+    source 可以是文本/二进制文件对象、已读入内存的 str/bytes，
+    或任何按行迭代的对象；
+    遇到的 #EXTM3U 行保存在 header 属性中，第一个频道之前的普通注释行
+    保存在 comments 中，其他 # 行跟随下一个频道（Channel.directives）。
+    """
+
+    def __init__(self, source):
+        self.source = source
+        self.header = EXTM3U_PREFIX
+        self.comments = []
+
+    def __iter__(self):
+        source = self.source
+        wrapper = None
+        if isinstance(source, str):
+            source = _iter_lines(source.lstrip('\ufeff'))
+        elif isinstance(source, (bytes, bytearray)):
+            source = io.BytesIO(source)
+        if isinstance(source, (io.RawIOBase, io.BufferedIOBase)):
+            # 由 C 实现的 TextIOWrapper 负责解码和分行，比逐行 decode 快得多
+            source = wrapper = io.TextIOWrapper(source, encoding='utf-8-sig')
+
+        extinf = None
+        # 大多数频道没有指令行，共用同一个空元组
+        pending = ()
+        started = False
+        try:
+            for line in source:
+                if isinstance(line, bytes):
+                    line = line.decode('utf-8-sig')
+                line = line.strip()
+                if not line:
+                    continue
+
+                if line[0] != '#':
+                    if extinf is not None:
+                        yield Channel(extinf, line, tuple(pending))
+                        extinf = None
+                        pending = ()
+                elif line.startswith(EXTINF_PREFIX):
+                    extinf = line
+                    started = True
+                elif line.startswith(EXTM3U_PREFIX):
+                    self.header = line
+                elif not started and not is_directive(line):
+                    self.comments.append(line)
+                else:
+                    if not pending:
+                        pending = []
+                    pending.append(line)
+        finally:
+            if wrapper is not None:
+                # 不关闭调用方传入的底层流
+                wrapper.detach()
+
+
+def iter_m3u(source):
+    """从文件对象/字节流/文本中逐个产出频道"""
+    return iter(M3UReader(source))
+
+
+def iter_m3u_file(path):
+    """打开文件并逐个产出频道，迭代结束后自动关闭文件"""
+    with open(path, 'rb') as f:
+        yield from iter_m3u(f)
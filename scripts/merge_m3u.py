@@ -1,8 +1,11 @@
 import os
-import filecmp
 import glob
 import re
 
+from build_manifest import publish_outputs
+from m3u_merge import DEFAULT_KEY, PlaylistMerger
+from stream_score import ScoreTable
+
 # --- 配置 ---
 # 定义备份文件目录和文件路径
 backup_dir = 'backup'
@@ -18,8 +21,9 @@ final_unicast_path = 'unicast.m3u'
 final_multicast_r2h_path = 'multicast-r2h.m3u'
 final_multicast_nofcc_path = 'multicast-nofcc.m3u'
 
-# 标记，用于记录是否有文件被实际更新
-any_file_updated = False
+# 去重使用的键，见 m3u_merge；自定义文件可以在自己的 #EXTM3U 行上用
+# x-merge-policy / x-merge-key 指定合并策略（skip / override / append）和键
+MERGE_KEY = DEFAULT_KEY
 
 def natural_sort_key(s):
     """
@@ -43,7 +47,12 @@ def find_and_sort_custom_files():
     return custom_files
 
 # --- 主程序 ---
-if __name__ == "__main__":
+def merge_playlists(base_contents=None):
+    """
+    合并播放列表，返回是否有文件被实际更新
+    base_contents: {基础文件路径: 内容}，pipeline 传入上游阶段刚生成的内容，不再从磁盘重新读取
+    """
+    base_contents = base_contents or {}
     print("开始合并播放列表...")
     
     # 1. 预先查找所有自定义文件
@@ -61,46 +70,58 @@ if __name__ == "__main__":
         (temp_multicast_nofcc_path, final_multicast_nofcc_path),
     ]
 
-    # 3. 遍历并执行每个合并任务
+    # 自定义文件只读取一次，三个合并任务共用
+    custom_contents = []
+    for custom_file in all_custom_files:
+        if os.path.exists(custom_file):
+            with open(custom_file, 'rb') as f:
+                custom_contents.append((os.path.basename(custom_file), f.read()))
+
+    # 同名频道按 stream_score 的评分把起播最快的地址排在前面；没有评分文件时顺序不变
+    scores = ScoreTable()
+
+    # 3. 遍历并执行每个合并任务；结果先留在内存中，只计算内容摘要
+    outputs = {}
     for temp_path, final_path in merge_tasks:
-        # 读取备份文件内容作为基础
-        merged_content = ""
-        if os.path.exists(temp_path):
-            with open(temp_path, 'r', encoding='utf-8') as f:
-                merged_content = f.read()
-            print(f"  - 基础文件: {temp_path}")
+        # 备份文件作为基础原样保留（规则复制出的同名频道不能去掉），只对自定义文件去重
+        merger = PlaylistMerger(MERGE_KEY)
+        if temp_path in base_contents:
+            stats = merger.add(base_contents[temp_path], policy='keep', label=temp_path)
+            print(f"  - 基础文件: {stats} (来自上游阶段)")
+        elif os.path.exists(temp_path):
+            with open(temp_path, 'rb') as f:
+                stats = merger.add(f, policy='keep', label=temp_path)
+            print(f"  - 基础文件: {stats}")
         else:
             print(f"  - 警告: 基础文件 {temp_path} 不存在，将只合并自定义文件。")
-        
-        # 依次追加所有自定义文件内容
-        for custom_file in all_custom_files:
-            if os.path.exists(custom_file):
-                with open(custom_file, 'r', encoding='utf-8') as f:
-                    merged_content += '\n' + f.read()
-                print(f"    + 合并自定义文件: {os.path.basename(custom_file)}")
-
-        # 检查并写入最终文件（仅在内容有变化时）
-        if os.path.exists(final_path):
-            temp_merged_path = final_path + '.tmp'
-            with open(temp_merged_path, 'w', encoding='utf-8') as f:
-                f.write(merged_content)
-                
-            if not filecmp.cmp(final_path, temp_merged_path, shallow=False):
-                os.replace(temp_merged_path, final_path)
-                print(f"  -> 成功合并并更新: {final_path}")
-                any_file_updated = True
-            else:
-                os.remove(temp_merged_path)
-                print(f"  -> 无变化: {final_path} 内容已是最新，跳过更新。")
+
+        # 依次合并所有自定义文件
+        for name, content in custom_contents:
+            print(f"    + 合并自定义文件: {merger.add(content, label=name)}")
+
+        moved = merger.reorder(scores.rank)
+        if moved:
+            print(f"    * 按评分调整了 {moved} 个同名频道的顺序")
+
+        outputs[final_path] = (merger.digest(), merger.write)
+
+    # 一次处理三个输出：摘要与磁盘上的内容相同时不改写文件
+    written = publish_outputs(outputs)
+    for final_path in outputs:
+        if final_path in written:
+            print(f"  -> 成功合并并更新: {final_path}")
         else:
-            with open(final_path, 'w', encoding='utf-8') as f:
-                f.write(merged_content)
-            print(f"  -> 成功创建: {final_path} (新文件)")
-            any_file_updated = True
-            
+            print(f"  -> 无变化: {final_path} 内容已是最新，跳过更新。")
+    any_file_updated = bool(written)
+
     # 4. 输出最终状态
     print("\n--- 合并任务完成 ---")
     if any_file_updated:
         print("状态: 检测到文件更新，已提交。")
     else:
         print("状态: 所有文件均无变化。")
+    return any_file_updated
+
+
+if __name__ == "__main__":
+    merge_playlists()
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+组播地址模板
+
+每个播放地址只解析一次（compile_url），拆成组播地址之前的部分、
+组播地址（整数形式）和去掉 fcc 参数后的其余部分。各城市的版本
+由 CityVariant 直接填入城市标识和 FCC 参数，不再对每个城市的每个地址
+重复做正则查找和替换。
+
+RemapTable 支持整段迁移组播地址（例如整个 /16 迁到另一个 /16），
+按前缀长度分桶查字典，条目再多也只需要几次查找。
+"""
+
+import ipaddress
+import re
+
+# 组播地址（224.0.0.0/4）；前后不能紧挨数字或点，避免匹配到更长的数字串
+_GROUP_PATTERN = re.compile(r'(?<![\d.])(22[4-9]|23\d)\.(\d{1,3})\.(\d{1,3})\.(\d{1,3})(?!\d)')
+_FCC_PATTERN = re.compile(r'\?fcc=[^&]+')
+
+_FULL_MASK = 0xFFFFFFFF
+
+
+def format_address(address):
+    """整数形式的 IPv4 地址转为点分十进制"""
+    return f"{address >> 24}.{(address >> 16) & 255}.{(address >> 8) & 255}.{address & 255}"
+
+
+class UrlTemplate:
+    """解析后的播放地址"""
+
+    __slots__ = ('url', 'prefix', 'address', 'suffix', 'suffix_nofcc')
+
+    def __init__(self, url, prefix, address, suffix):
+        self.url = url
+        self.prefix = prefix
+        self.address = address
+        self.suffix = suffix
+        self.suffix_nofcc = _FCC_PATTERN.sub('', suffix)
+
+    def __repr__(self):
+        return f"UrlTemplate({self.url!r})"
+
+    def render(self, address, fcc=None):
+        """填入组播地址；fcc 不为 None 时去掉原有 fcc 参数，有值时追加新的"""
+        if fcc is None:
+            return f"{self.prefix}{format_address(address)}{self.suffix}"
+        url = f"{self.prefix}{format_address(address)}{self.suffix_nofcc}"
+        return f"{url}?fcc={fcc}" if fcc else url
+
+
+def compile_url(url):
+    """解析播放地址中的组播地址，没有组播地址时返回 None"""
+    match = _GROUP_PATTERN.search(url)
+    if not match:
+        return None
+    octets = [int(part) for part in match.groups()]
+    if any(octet > 255 for octet in octets):
+        return None
+    address = (octets[0] << 24) | (octets[1] << 16) | (octets[2] << 8) | octets[3]
+    return UrlTemplate(url, url[:match.start()], address, url[match.end():])
+
+
+class RemapTable:
+    """
+    组播地址整段迁移表：{源网段: 目标网段}，两者前缀长度必须相同
+
+    一个地址同时落在多个源网段中时，以前缀最长的为准。
+    """
+
+    def __init__(self, mappings=None):
+        # 前缀长度 -> {源网络地址: 目标网络地址}
+        self._by_prefix = {}
+        self._lengths = []
+        for source, target in (mappings or {}).items():
+            self.add(source, target)
+
+    def __len__(self):
+        return sum(len(table) for table in self._by_prefix.values())
+
+    def add(self, source, target):
+        source = ipaddress.IPv4Network(source)
+        target = ipaddress.IPv4Network(target)
+        if source.prefixlen != target.prefixlen:
+            raise ValueError(f"迁移表 {source} -> {target}: 前缀长度不一致")
+        table = self._by_prefix.setdefault(source.prefixlen, {})
+        table[int(source.network_address)] = int(target.network_address)
+        self._lengths = sorted(self._by_prefix, reverse=True)
+
+    def remap(self, address):
+        """迁移后的地址，不在任何源网段内时原样返回"""
+        for length in self._lengths:
+            mask = (_FULL_MASK << (32 - length)) & _FULL_MASK
+            target = self._by_prefix[length].get(address & mask)
+            if target is not None:
+                return target | (address & ~mask & _FULL_MASK)
+        return address
+
+
+class CityVariant:
+    """
+    一个城市的组播地址改写
+
+    network 内的地址，紧跟网络前缀的那一段改为城市标识 code
+    （例如 239.253.0.0/16 时改第三段），并把 fcc 参数换成该城市的
+    FCC 服务器（没有时去掉）；随后再按 remap 迁移。
+    不在 network 内、也没有被迁移的地址原样保留。
+    """
+
+    __slots__ = ('network', 'mask', 'shift', 'code', 'fcc', 'remap')
+
+    def __init__(self, network, code, fcc=None, remap=None):
+        network = ipaddress.IPv4Network(network)
+        if network.prefixlen % 8 or network.prefixlen >= 32:
+            raise ValueError(f"{network}: 前缀长度必须是 8 的倍数且小于 32")
+        self.network = int(network.network_address)
+        self.mask = int(network.netmask)
+        self.shift = 24 - network.prefixlen
+        self.code = code
+        self.fcc = fcc or ""
+        self.remap = remap
+
+    def apply(self, template):
+        """由编译好的地址模板生成该城市的播放地址"""
+        address = template.address
+        if address & self.mask == self.network:
+            address = (address & ~(255 << self.shift)) | (self.code << self.shift)
+            if self.remap:
+                address = self.remap.remap(address)
+            return template.render(address, self.fcc)
+        if self.remap:
+            remapped = self.remap.remap(address)
+            if remapped != address:
+                return template.render(remapped)
+        return template.url
+
+    def rewrite(self, url, template=None):
+        """改写单个地址；template 可传入预先编译好的结果"""
+        template = template or compile_url(url)
+        if template is None:
+            return url
+        return self.apply(template)
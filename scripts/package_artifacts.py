@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+EPG 与播放列表的预压缩产物
+
+  EPG/sggc.xml.gz           就地重新压缩为最高压缩率的 gzip（安装了 zopfli 时使用 zopfli）
+  EPG/sggc.xml.xz / .zst    同一内容的 xz / zstd 版本，供支持的客户端使用
+  packed/<路径>.gz/.xz/.zst 生成的 .m3u 播放列表的预压缩版本，目录结构与原文件相同
+
+预压缩版本不能和播放列表放在同一目录：分城市目录由生成器的构建清单管理，
+清单之外的文件会被删除。
+
+所有格式都不写入时间戳和文件名，内容不变时输出逐字节相同，不会在 git 中产生无意义的改动。
+输出通过 build_manifest 记录输入摘要，源文件没变时跳过压缩；EPG 的输入摘要按
+解压后的内容计算，聚合脚本重新写出的 .gz 只要节目没变就不会再用 zopfli 重新压缩。
+
+zstd 依赖 zstandard 包，zopfli 依赖 zopfli 包，两者都是可选的：
+未安装 zstandard 时不生成 .zst，未安装 zopfli 时 gzip 使用标准库的最高级别。
+
+用法（在仓库根目录）:
+  python scripts/package_artifacts.py [--force]
+"""
+
+import argparse
+import glob
+import gzip
+import lzma
+import os
+
+from build_manifest import BuildManifest, build_digest, content_digest
+from epg_stream import EPG_FILE
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import zopfli.gzip as zopfli_gzip
+except ImportError:
+    zopfli_gzip = None
+
+# 压缩参数变化时递增，使全部输出重新生成
+PACKER_VERSION = 1
+
+PACKED_DIR = "packed"
+PLAYLIST_PATTERNS = [
+    "*.m3u",
+    "SDT-Unicast/*.m3u",
+    "SDM-Unicast/*.m3u",
+    "SDM-Unicast-Rtsp/*.m3u",
+    "SDU-Multicast/*.m3u",
+]
+
+# zopfli 每多一次迭代约多花一倍时间，收益很小；1 次已比 gzip -9 小约 10%
+ZOPFLI_ITERATIONS = 1
+XZ_PRESET = 9 | lzma.PRESET_EXTREME
+ZSTD_LEVEL = 19
+
+
+def compress_gzip(data):
+    """最高压缩率的 gzip，头中不写时间戳和文件名"""
+    if zopfli_gzip is not None:
+        return zopfli_gzip.compress(data, numiterations=ZOPFLI_ITERATIONS)
+    return gzip.compress(data, compresslevel=9, mtime=0)
+
+
+def compress_xz(data):
+    return lzma.compress(data, format=lzma.FORMAT_XZ, check=lzma.CHECK_CRC64, preset=XZ_PRESET)
+
+
+def compress_zstd(data):
+    return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(data)
+
+
+def codecs():
+    """可用的压缩格式：[(扩展名, 压缩函数, 影响输出的参数)]"""
+    available = [
+        ('.gz', compress_gzip, f'zopfli:{ZOPFLI_ITERATIONS}' if zopfli_gzip else 'gzip:9'),
+        ('.xz', compress_xz, f'xz:{XZ_PRESET}'),
+    ]
+    if zstandard is not None:
+        available.append(('.zst', compress_zstd, f'zstd:{ZSTD_LEVEL}'))
+    return available
+
+
+def epg_outputs(epg_file=EPG_FILE):
+    """EPG 的全部输出文件（含就地重新压缩的 .gz 本身）"""
+    stem = epg_file[:-len('.gz')]
+    return [stem + suffix for suffix, _, _ in codecs()]
+
+
+def _existing_gzip_is_better(path, data, content):
+    """path 处已有的 gzip 解压后与 data 相同且不比 content 大（例如本地未安装 zopfli 时）"""
+    if not os.path.isfile(path):
+        return False
+    with open(path, 'rb') as f:
+        existing = f.read()
+    if len(existing) > len(content):
+        return False
+    try:
+        return gzip.decompress(existing) == data
+    except (OSError, EOFError):
+        return False
+
+
+def _pack(manifest, filename, data, source_digest, codec, force, in_place=False):
+    """
+    按一种格式压缩 data 写入清单目录中的 filename，返回 'written' / 'kept' / 'unchanged'
+    in_place: filename 就是 data 的来源（EPG 本身的 .gz），内容就是 data，
+    只要解压后的内容与上次压缩时相同就不再重新压缩，即使文件已被其他工具改写
+    """
+    suffix, compress, params = codec
+    digest = build_digest(PACKER_VERSION, source_digest, params)
+    if not force and manifest.is_current(filename, digest):
+        manifest.keep(filename)
+        return 'unchanged'
+    if not force and in_place and manifest.entries.get(filename, {}).get('input') == digest:
+        manifest.adopt(filename, digest)
+        return 'kept'
+    content = compress(data)
+    if suffix == '.gz' and _existing_gzip_is_better(os.path.join(manifest.output_dir, filename), data, content):
+        # 不用更差的压缩结果覆盖已有文件，避免不同环境之间来回改动
+        manifest.adopt(filename, digest)
+        return 'kept'
+    manifest.write(filename, digest, content)
+    return 'written'
+
+
+def pack_epg(epg_file=EPG_FILE, force=False):
+    """重新压缩 EPG 并写出其他格式；返回是否成功"""
+    if not os.path.exists(epg_file):
+        print(f"Warning: {epg_file} not found, skipping.")
+        return False
+
+    with open(epg_file, 'rb') as f:
+        data = gzip.decompress(f.read())
+    directory, stem = os.path.split(epg_file[:-len('.gz')])
+    # EPG 目录中还有其他工作流写入的文件，这里只登记摘要，不调用 finish() 清理目录
+    manifest = BuildManifest(directory, name='packed-' + os.path.basename(os.path.normpath(directory)))
+    source_digest = content_digest(data)
+
+    for codec in codecs():
+        filename = stem + codec[0]
+        state = _pack(manifest, filename, data, source_digest, codec, force,
+                      in_place=os.path.join(directory, filename) == epg_file)
+        size = os.path.getsize(os.path.join(directory, filename))
+        print(f"{filename}: {len(data)} -> {size} 字节 ({state})")
+    manifest.save()
+    return True
+
+
+def pack_playlists(patterns=PLAYLIST_PATTERNS, packed_dir=PACKED_DIR, force=False):
+    """为匹配 patterns 的播放列表写出预压缩版本；返回是否成功"""
+    # 源文件所在目录 -> 源文件列表，每个目录对应 packed_dir 下的一个清单
+    by_dir = {}
+    for pattern in patterns:
+        for path in sorted(glob.glob(pattern)):
+            by_dir.setdefault(os.path.dirname(path), []).append(path)
+
+    available = codecs()
+    for directory, paths in by_dir.items():
+        output_dir = os.path.join(packed_dir, directory) if directory else packed_dir
+        name = 'packed-' + directory if directory else 'packed'
+        manifest = BuildManifest(output_dir, name=name)
+        for path in paths:
+            with open(path, 'rb') as f:
+                data = f.read()
+            source_digest = content_digest(data)
+            for codec in available:
+                _pack(manifest, os.path.basename(path) + codec[0], data, source_digest, codec, force)
+        manifest.finish()
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description="EPG 与播放列表的预压缩产物")
+    parser.add_argument('--force', action='store_true', help="忽略构建清单，全部重新压缩")
+    args = parser.parse_args()
+    if zstandard is None:
+        print("提示: 未安装 zstandard，不生成 .zst")
+    if zopfli_gzip is None:
+        print("提示: 未安装 zopfli，gzip 使用标准库的最高级别")
+    pack_epg(force=args.force)
+    pack_playlists(force=args.force)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,482 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+单进程流水线
+
+把原来由工作流逐个启动的脚本定义为一个有向无环图中的阶段，在同一个
+解释器里按依赖顺序执行：
+  - 需要的上游源先由 fetch_sources 并发下载，各阶段直接拿到 FetchResult
+  - 上游阶段写出的文件内容留在内存中，下游阶段（合并、生成）不再重新读取和解析
+  - 每个阶段根据输入（源内容摘要、输入文件、阶段代码）计算指纹，
+    与 .data/pipeline_<阶段>_hash.txt 中记录的相同且输出都存在时跳过
+
+用法（在仓库根目录）:
+  python -m scripts.pipeline [目标 ...] [--force] [--list]
+
+目标可以是阶段名或分组名，会连同它依赖的上游阶段一起执行；省略时执行全部阶段。
+"""
+
+import argparse
+import fnmatch
+import glob
+import hashlib
+import importlib
+import os
+import sys
+import time
+
+# 以 python -m scripts.pipeline 运行时，让同目录的脚本仍按原来的方式互相导入
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+if SCRIPT_DIR not in sys.path:
+    sys.path.insert(0, SCRIPT_DIR)
+
+import epg_prune
+import epg_slices
+import generate_sdm_unicast
+import generate_sdt_unicast
+import generate_sdu_multicast
+import logo_assets
+import merge_m3u
+import package_artifacts
+import process_multicast
+import process_unicast
+import stream_score
+import update_catchup_source
+import update_huya_source
+from build_manifest import gzip_content_digest
+from fetch_sources import CONSUMERS, fetch_all
+from epg_stream import EPG_FILE
+from http_cache import content_digest, set_output
+from m3u_parser import M3UReader, iter_m3u_file
+
+STATE_DIR = ".data"
+
+SDM_SOURCES = [("SDM-Unicast.m3u", "SDM-Unicast"), ("SDM-Unicast-Rtsp.m3u", "SDM-Unicast-Rtsp")]
+
+
+class Stage:
+    """
+    流水线中的一个阶段
+
+    deps     显式依赖的上游阶段（选择目标时一并执行）
+    sources  需要预先下载的上游源名称（见 fetch_sources.CONSUMERS）
+    inputs   影响输出的文件，支持通配符
+    outputs  阶段写出的文件或目录，任一不存在时不跳过
+    code     阶段用到的脚本文件，代码改动后重新执行
+    clock    可选，返回随时间变化的输入（如切片的时间窗口），变化后重新执行
+    """
+
+    __slots__ = ('name', 'func', 'deps', 'sources', 'inputs', 'outputs', 'code', 'clock')
+
+    def __init__(self, name, func, deps=(), sources=(), inputs=(), outputs=(), code=(), clock=None):
+        self.name = name
+        self.func = func
+        self.deps = tuple(deps)
+        self.sources = tuple(sources)
+        self.inputs = tuple(str(path) for path in inputs)
+        self.outputs = tuple(str(path) for path in outputs)
+        self.code = tuple(code)
+        self.clock = clock
+
+
+class Context:
+    """阶段之间在内存中传递的数据"""
+
+    def __init__(self, results, force=False):
+        # 源名称 -> FetchResult
+        self.results = results
+        # --force 时生成器忽略构建清单，重新生成全部城市
+        self.force = force
+        # 本次运行的当前时间，各阶段共用同一个值
+        self.now = int(time.time())
+        # 本次运行中写出的文件 -> 文本内容
+        self.files = {}
+        self._channels = {}
+        # .gz 文件 -> ((大小, 修改时间), 解压后内容的摘要)
+        self._gz_digests = {}
+
+    def publish(self, path, content):
+        """登记上游阶段刚写出的文件内容"""
+        path = str(path)
+        self.files[path] = content
+        self._channels.pop(path, None)
+
+    def channels(self, path):
+        """
+        path 的频道列表，同一文件在一次运行中只解析一次
+        本次运行写出的文件直接从内存解析；返回的列表由各阶段共享，只读使用
+        """
+        path = str(path)
+        if path not in self._channels:
+            if path in self.files:
+                self._channels[path] = list(M3UReader(self.files[path]))
+            else:
+                self._channels[path] = list(iter_m3u_file(path))
+        return self._channels[path]
+
+    def digest(self, path):
+        """
+        文件内容摘要，优先使用内存中的内容；文件不存在时返回空串
+        .gz 文件取解压后内容的摘要：EPG 被重新压缩或由其他工具写出时字节不同，
+        但节目没有变化，读取它的阶段不需要重新运行
+        """
+        if path in self.files:
+            return content_digest(self.files[path])
+        if not os.path.isfile(path):
+            return ""
+        if path.endswith('.gz'):
+            st = os.stat(path)
+            stamp = (st.st_size, st.st_mtime_ns)
+            cached = self._gz_digests.get(path)
+            if cached is None or cached[0] != stamp:
+                cached = self._gz_digests[path] = (stamp, gzip_content_digest(path))
+            return cached[1]
+        with open(path, 'rb') as f:
+            return content_digest(f.read())
+
+    def expand(self, pattern):
+        """展开输入中的通配符，同时匹配磁盘上的文件和本次运行写出的文件"""
+        if not glob.has_magic(pattern):
+            return [pattern]
+        matched = set(glob.glob(pattern))
+        matched.update(path for path in self.files if fnmatch.fnmatch(path, pattern))
+        return sorted(matched)
+
+
+# ==================== 各阶段 ====================
+
+def run_unicast(ctx):
+    processor = process_unicast.M3UProcessor(
+        process_unicast.SOURCE_M3U_URL, process_unicast.OUTPUT_FILENAME, process_unicast.STATE_FILE)
+    success = processor.process(ctx.results['unicast'], force=True)
+    for path, content in processor.outputs.items():
+        ctx.publish(path, content)
+    return success
+
+
+def run_multicast(ctx):
+    processor = process_multicast.MulticastM3UProcessor(
+        process_multicast.SOURCE_M3U_URL, process_multicast.OUTPUT_FILENAME,
+        process_multicast.OUTPUT_NOFCC_FILENAME, process_multicast.STATE_FILE)
+    success = processor.process(ctx.results['multicast'], force=True)
+    for path, content in processor.outputs.items():
+        ctx.publish(path, content)
+    return success
+
+
+def run_huya(ctx):
+    return update_huya_source.process_huya_source(ctx.results['huya'], force=True)
+
+
+def run_merge(ctx):
+    merge_m3u.merge_playlists(ctx.files)
+    return True
+
+
+def run_catchup(ctx):
+    return update_catchup_source.run(ctx.results['catchup'], force=True)
+
+
+def run_logos(ctx):
+    urls = logo_assets.collect_logo_urls(logo_assets.generator_channels(ctx.channels))
+    return logo_assets.build_assets(urls, force=ctx.force)
+
+
+def run_sdt(ctx):
+    generate_sdt_unicast.generate_sdt_unicast(ctx.channels(generate_sdt_unicast.SOURCE_M3U_FILE),
+                                              force=ctx.force)
+    return True
+
+
+def run_sdm(ctx):
+    for source_m3u, output_dir in SDM_SOURCES:
+        channels = ctx.channels(source_m3u) if os.path.exists(source_m3u) else None
+        generate_sdm_unicast.generate_sdm_unicast(source_m3u, output_dir, channels, force=ctx.force)
+    return True
+
+
+def run_sdu(ctx):
+    generate_sdu_multicast.generate_sdu_multicast(ctx.channels(generate_sdu_multicast.SOURCE_M3U_FILE),
+                                                  force=ctx.force)
+    return True
+
+
+def run_epg_prune(ctx):
+    return epg_prune.prune_all(ctx.channels, force=ctx.force)
+
+
+def run_epg_slices(ctx):
+    return epg_slices.build_slices(now=ctx.now)
+
+
+def run_epg_pack(ctx):
+    return package_artifacts.pack_epg(force=ctx.force)
+
+
+def run_package(ctx):
+    return package_artifacts.pack_playlists(force=ctx.force)
+
+
+PROCESSOR_CODE = ('m3u_parser.py', 'rule_engine.py', 'playlist_rules.json')
+GENERATOR_CODE = ('m3u_parser.py', 'build_manifest.py', 'logo_assets.py')
+MERGE_BASES = (merge_m3u.temp_unicast_path, merge_m3u.temp_multicast_r2h_path,
+               merge_m3u.temp_multicast_nofcc_path)
+
+STAGES = [
+    Stage('unicast', run_unicast, sources=['unicast'],
+          outputs=[process_unicast.OUTPUT_FILENAME],
+          code=('process_unicast.py',) + PROCESSOR_CODE),
+    Stage('multicast', run_multicast, sources=['multicast'],
+          outputs=[process_multicast.OUTPUT_FILENAME, process_multicast.OUTPUT_NOFCC_FILENAME],
+          code=('process_multicast.py', 'catchup_template.py') + PROCESSOR_CODE),
+    Stage('huya', run_huya, sources=['huya'],
+          outputs=[update_huya_source.OUTPUT_FILE],
+          code=['update_huya_source.py']),
+    Stage('merge', run_merge, deps=['unicast', 'multicast'],
+          inputs=MERGE_BASES + (os.path.join(merge_m3u.custom_dir, 'custom*.m3u'), stream_score.SCORE_FILE),
+          outputs=[merge_m3u.final_unicast_path, merge_m3u.final_multicast_r2h_path,
+                   merge_m3u.final_multicast_nofcc_path],
+          code=['merge_m3u.py', 'm3u_merge.py', 'stream_score.py']),
+    Stage('catchup', run_catchup, sources=['catchup'],
+          inputs=[update_catchup_source.LOCAL_FILE],
+          outputs=[update_catchup_source.OUTPUT_FILE],
+          code=['update_catchup_source.py', 'm3u_parser.py', 'epg_alias.py']),
+    # 台标缩小版本只为源播放列表引用的台标生成；索引是生成器的输入，排在生成器之前
+    Stage('logos', run_logos,
+          inputs=logo_assets.SOURCE_PLAYLISTS + [os.path.join(logo_assets.LOGO_DIR, '*.png'),
+                                                 os.path.join(logo_assets.LOGO_DIR, '*', '*.png')],
+          outputs=[logo_assets.INDEX_FILE],
+          code=('logo_assets.py', 'generate_sdu_multicast.py') + GENERATOR_CODE),
+    Stage('sdt', run_sdt,
+          inputs=[generate_sdt_unicast.SOURCE_M3U_FILE, logo_assets.INDEX_FILE, stream_score.SCORE_FILE],
+          outputs=[generate_sdt_unicast.OUTPUT_DIR],
+          code=('generate_sdt_unicast.py', 'city_fanout.py', 'stream_score.py') + GENERATOR_CODE),
+    Stage('sdm', run_sdm,
+          inputs=[source for source, _ in SDM_SOURCES] + [logo_assets.INDEX_FILE, stream_score.SCORE_FILE],
+          outputs=[output for _, output in SDM_SOURCES],
+          code=('generate_sdm_unicast.py', 'city_fanout.py', 'stream_score.py') + GENERATOR_CODE),
+    Stage('sdu', run_sdu,
+          inputs=[generate_sdu_multicast.SOURCE_M3U_FILE, EPG_FILE, logo_assets.INDEX_FILE,
+                  stream_score.SCORE_FILE],
+          outputs=[generate_sdu_multicast.OUTPUT_DIR],
+          code=('generate_sdu_multicast.py', 'multicast_url.py', 'epg_alias.py', 'epg_stream.py', 'stream_score.py')
+          + GENERATOR_CODE),
+    # 读取已提交的 SDU 播放列表，不依赖 sdu 阶段，EPG 工作流不必运行生成器；
+    # 同时执行时由输出/输入关系排在 sdu 之后
+    Stage('epg_prune', run_epg_prune,
+          inputs=[EPG_FILE] + [pattern for pattern, _ in epg_prune.PRUNE_TARGETS],
+          outputs=[output_dir for _, output_dir in epg_prune.PRUNE_TARGETS],
+          code=('epg_prune.py', 'epg_alias.py', 'epg_stream.py') + GENERATOR_CODE),
+    # 就地重新压缩 EPG，输出即输入，排在所有读取 EPG 的阶段之前
+    Stage('epg_pack', run_epg_pack,
+          inputs=[EPG_FILE],
+          outputs=package_artifacts.epg_outputs(),
+          code=('package_artifacts.py', 'build_manifest.py')),
+    Stage('epg_slices', run_epg_slices,
+          inputs=[EPG_FILE],
+          outputs=[epg_slices.SLICE_DIR, epg_slices.SHARD_DIR],
+          code=('epg_slices.py', 'epg_stream.py', 'build_manifest.py'),
+          clock=lambda ctx: epg_slices.window_key(ctx.now)),
+    Stage('package', run_package, deps=['sdt', 'sdm', 'sdu'],
+          inputs=package_artifacts.PLAYLIST_PATTERNS,
+          outputs=[package_artifacts.PACKED_DIR],
+          code=('package_artifacts.py', 'build_manifest.py')),
+]
+
+# 分组名 -> 阶段名，对应各个工作流
+GROUPS = {
+    'sources': ['merge'],
+    'generate': ['logos', 'sdt', 'sdm', 'sdu', 'epg_prune', 'package'],
+    'epg': ['epg_pack', 'epg_prune', 'epg_slices'],
+}
+
+# ==================== 调度 ====================
+
+def stage_map():
+    return {stage.name: stage for stage in STAGES}
+
+
+def resolve(targets):
+    """目标及其全部上游阶段，按拓扑顺序返回"""
+    stages = stage_map()
+    wanted = []
+    for target in targets or list(stages):
+        names = GROUPS.get(target, [target])
+        for name in names:
+            if name not in stages:
+                raise ValueError(f"未知的阶段或分组: {target}")
+            wanted.append(name)
+
+    selected = set()
+    pending = list(wanted)
+    while pending:
+        name = pending.pop()
+        if name not in selected:
+            selected.add(name)
+            pending.extend(stages[name].deps)
+    return topological_order([stage for stage in STAGES if stage.name in selected])
+
+
+def _produces(upstream, downstream):
+    """upstream 的某个输出（文件或目录）是否是 downstream 的输入"""
+    return any(fnmatch.fnmatch(output, pattern) or pattern.startswith(output.rstrip('/') + '/')
+               for output in upstream.outputs for pattern in downstream.inputs)
+
+
+def topological_order(stages):
+    """
+    Kahn 算法排序；边来自显式依赖以及"输出被另一阶段当作输入"，
+    没有先后关系的阶段保持定义顺序
+    """
+    names = {stage.name for stage in stages}
+    incoming = {stage.name: set() for stage in stages}
+    for stage in stages:
+        incoming[stage.name].update(dep for dep in stage.deps if dep in names)
+        for other in stages:
+            if other is not stage and _produces(other, stage):
+                incoming[stage.name].add(other.name)
+
+    order = []
+    remaining = list(stages)
+    while remaining:
+        ready = [stage for stage in remaining if not incoming[stage.name]]
+        if not ready:
+            raise ValueError(f"阶段之间存在循环依赖: {[stage.name for stage in remaining]}")
+        stage = ready[0]
+        order.append(stage)
+        remaining.remove(stage)
+        for deps in incoming.values():
+            deps.discard(stage.name)
+    return order
+
+
+def fingerprint(stage, ctx):
+    """阶段输入的指纹：代码、源内容摘要和输入文件内容"""
+    h = hashlib.sha256()
+    for path in stage.code:
+        h.update(f"code:{path}:{ctx.digest(os.path.join(SCRIPT_DIR, path))}\n".encode('utf-8'))
+    for name in stage.sources:
+        h.update(f"source:{name}:{ctx.results[name].digest}\n".encode('utf-8'))
+    for pattern in stage.inputs:
+        for path in ctx.expand(pattern):
+            h.update(f"input:{path}:{ctx.digest(path)}\n".encode('utf-8'))
+    if stage.clock is not None:
+        h.update(f"clock:{stage.clock(ctx)}\n".encode('utf-8'))
+    return h.hexdigest()
+
+
+def state_path(stage):
+    return os.path.join(STATE_DIR, f"pipeline_{stage.name}_hash.txt")
+
+
+def read_fingerprint(stage):
+    path = state_path(stage)
+    if os.path.exists(path):
+        with open(path, 'r', encoding='utf-8') as f:
+            return f.read().strip()
+    return None
+
+
+def save_fingerprint(stage, value):
+    os.makedirs(STATE_DIR, exist_ok=True)
+    with open(state_path(stage), 'w', encoding='utf-8') as f:
+        f.write(value)
+
+
+def fetch_stage_sources(stages):
+    """并发下载所选阶段需要的全部源，返回 (结果, 失败的源)"""
+    names = []
+    for stage in stages:
+        names.extend(name for name in stage.sources if name not in names)
+    if not names:
+        return {}, set()
+
+    sources = [importlib.import_module(CONSUMERS[name]).SOURCE for name in names]
+    print(f"并发下载 {len(sources)} 个源: {', '.join(names)}")
+    results, failed = {}, set()
+    for name, (result, error, elapsed) in zip(names, fetch_all(sources)):
+        if result is None:
+            print(f"  {name}: 下载失败且没有可用的副本 ({error})")
+            failed.add(name)
+        else:
+            results[name] = result
+            print(f"  {name}: {elapsed:.2f} 秒")
+    return results, failed
+
+
+def run(targets=None, force=False):
+    """执行流水线，返回 {阶段名: 状态}；状态为 ran / skipped / failed"""
+    stages = resolve(targets)
+    results, failed_sources = fetch_stage_sources(stages)
+    ctx = Context(results, force=force)
+    status = {}
+    timings = {}
+
+    for stage in stages:
+        print(f"\n==================== {stage.name} ====================")
+        blocked = [dep for dep in stage.deps if status.get(dep) == 'failed']
+        blocked += [name for name in stage.sources if name in failed_sources]
+        if blocked:
+            print(f"跳过: 依赖失败 ({', '.join(blocked)})")
+            status[stage.name] = 'failed'
+            continue
+
+        value = fingerprint(stage, ctx)
+        outputs_exist = all(os.path.exists(path) for path in stage.outputs)
+        if not force and outputs_exist and read_fingerprint(stage) == value:
+            print("输入未变化，跳过")
+            status[stage.name] = 'skipped'
+            continue
+
+        start = time.perf_counter()
+        try:
+            success = stage.func(ctx)
+        except Exception as e:
+            import traceback
+            print(f"阶段 {stage.name} 出错: {e}")
+            traceback.print_exc()
+            success = False
+        timings[stage.name] = time.perf_counter() - start
+
+        if success:
+            save_fingerprint(stage, value)
+            status[stage.name] = 'ran'
+        else:
+            status[stage.name] = 'failed'
+
+    print(f"\n{'阶段':<12}{'状态':<10}{'耗时(s)':>10}")
+    for stage in stages:
+        elapsed = timings.get(stage.name)
+        elapsed = f"{elapsed:.2f}" if elapsed is not None else "-"
+        print(f"{stage.name:<12}{status[stage.name]:<10}{elapsed:>10}")
+    return status
+
+
+def main():
+    parser = argparse.ArgumentParser(description="单进程流水线")
+    parser.add_argument('targets', nargs='*', metavar='目标',
+                        help=f"阶段: {', '.join(stage_map())}；分组: {', '.join(GROUPS)}")
+    parser.add_argument('--force', action='store_true',
+                        help="忽略指纹强制执行（环境变量 FORCE_UPDATE=true 同效）")
+    parser.add_argument('--list', action='store_true', help="只列出执行顺序")
+    args = parser.parse_args()
+
+    try:
+        stages = resolve(args.targets)
+    except ValueError as e:
+        parser.error(str(e))
+
+    if args.list:
+        for stage in stages:
+            deps = ', '.join(stage.deps) or '-'
+            print(f"{stage.name:<12}依赖: {deps:<22}源: {', '.join(stage.sources) or '-'}")
+        return 0
+
+    force = args.force or os.environ.get('FORCE_UPDATE', 'false').lower() == 'true'
+    status = run(args.targets, force=force)
+    set_output("changed", "true" if 'ran' in status.values() else "false")
+    return 1 if 'failed' in status.values() else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,399 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+本地直播 / 回看跳转服务
+
+生成的播放列表把回看的时间换算交给路由器上的 rtp2httpd：播放器按本地时间填入
+${(b)yyyyMMddHHmmss}，再由 r2h-seek-offset 换回 UTC。这个服务运行在家里的任意
+一台机器上，启动时读入播放列表并把每个频道的回看模板编译一次（catchup_template），
+之后每个请求只做字典查询和时间填充：
+
+  GET /live/<频道>                               302 到直播地址
+  GET /replay/<频道>?start=..&end=..             302 到填好时间的回看地址
+                     [&duration=秒] [&tz=+0800|utc]
+  GET /playlist.m3u                              播放地址和回看模板都指向本服务的播放列表
+  GET /metrics                                   请求数、延迟分位数和缓存命中情况（JSON）
+
+start / end 可以是 10 位（秒）或 13 位（毫秒）时间戳，也可以是 14 位的 yyyyMMddHHmmss，
+后者按 tz 参数（默认东八区）换算。/playlist.m3u 中的回看模板只用时间戳
+（${(b)10}），时区完全由服务处理。
+
+模板中的 r2h-seek-offset 在加载时折算进时间字段并从地址中去掉；rtsp:// 地址仍经
+--r2h 指定的 rtp2httpd 转为 HTTP（传空字符串时直接跳转到 rtsp 地址）。
+同一个 tvg-name 出现多次时，第一个使用频道名，之后的依次为 "频道名~2"、"频道名~3"。
+
+用法（在仓库根目录）:
+  python scripts/replay_proxy.py 播放列表 [...] [--host 0.0.0.0] [--port 8080] [--r2h URL]
+  python scripts/replay_proxy.py --self-check
+"""
+
+import argparse
+import asyncio
+import calendar
+import collections
+import json
+import re
+import time
+from urllib.parse import parse_qs, quote, unquote, urlsplit
+
+from catchup_template import (LOCAL_OFFSET, R2H_PROXY, TemplateError, compile_template, render_cached,
+                              strip_r2h_offset)
+from m3u_parser import EXTM3U_PREFIX, M3UReader
+
+DEFAULT_PORT = 8080
+# 回看窗口的上限（秒）
+MAX_WINDOW = 24 * 3600
+# 每种请求保留最近多少次的延迟用于计算分位数
+LATENCY_WINDOW = 10000
+SERVER_NAME = "replay_proxy"
+
+_TZ_PATTERN = re.compile(r'([+-])(\d{2}):?(\d{2})')
+_REASONS = {200: 'OK', 302: 'Found', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed'}
+
+
+class ReplayChannel:
+    """一个频道：原始记录和编译好的回看模板（没有回看时为 None）"""
+
+    __slots__ = ('key', 'channel', 'template')
+
+    def __init__(self, key, channel, template):
+        self.key = key
+        self.channel = channel
+        self.template = template
+
+
+def resolve_template(source, r2h=R2H_PROXY):
+    """编译回看模板：折算 r2h-seek-offset，rtsp 地址按需加上 rtp2httpd 前缀"""
+    source, seek_offset = strip_r2h_offset(source)
+    if r2h and source.startswith('rtsp://'):
+        source = f"{r2h}/rtsp/{source[len('rtsp://'):]}"
+    template = compile_template(source)
+    return template.shifted(seek_offset) if seek_offset else template
+
+
+def load_channels(paths, r2h=R2H_PROXY):
+    """读入播放列表，返回 (#EXTM3U 行, {频道键: ReplayChannel})，按出现顺序"""
+    header = None
+    channels = {}
+    counts = {}
+    for path in paths:
+        with open(path, 'rb') as f:
+            reader = M3UReader(f)
+            for channel in reader:
+                name = channel.tvg_name or channel.name
+                counts[name] = counts.get(name, 0) + 1
+                key = name if counts[name] == 1 else f"{name}~{counts[name]}"
+                template = None
+                source = channel.attr('catchup-source')
+                if source:
+                    try:
+                        template = resolve_template(source, r2h)
+                    except TemplateError as e:
+                        print(f"Warning: {path} [{name}] 回看模板无法解析，只提供直播: {e}")
+                channels[key] = ReplayChannel(key, channel, template)
+            if header is None and reader.header != EXTM3U_PREFIX:
+                header = reader.header
+    return header or EXTM3U_PREFIX, channels
+
+
+def parse_offset(value):
+    """tz 参数（utc、+0800、-05:00）-> 相对 UTC 的分钟数"""
+    if value.lower() in ('utc', 'z', 'gmt'):
+        return 0
+    match = _TZ_PATTERN.fullmatch(value)
+    if not match:
+        raise ValueError(f"无效的时区: {value!r}")
+    minutes = int(match.group(2)) * 60 + int(match.group(3))
+    return minutes if match.group(1) == '+' else -minutes
+
+
+def parse_time(value, offset=LOCAL_OFFSET):
+    """时间戳或 yyyyMMddHHmmss（offset 时区的时间）-> Unix 时间戳（秒）"""
+    if not value.isdigit():
+        raise ValueError(f"无效的时间: {value!r}")
+    if len(value) == 10:
+        return int(value)
+    if len(value) == 13:
+        return int(value) // 1000
+    if len(value) == 14:
+        return calendar.timegm(time.strptime(value, '%Y%m%d%H%M%S')) - offset * 60
+    raise ValueError(f"无效的时间: {value!r}")
+
+
+def parse_window(query):
+    """查询参数 -> (开始, 结束)；参数缺失或窗口不合理时抛出 ValueError"""
+    def single(name):
+        values = query.get(name)
+        return values[0] if values else None
+
+    offset = parse_offset(single('tz')) if single('tz') else LOCAL_OFFSET
+    start = single('start')
+    if start is None:
+        raise ValueError("缺少 start 参数")
+    start = parse_time(start, offset)
+    if single('end') is not None:
+        end = parse_time(single('end'), offset)
+    elif single('duration') is not None and single('duration').isdigit():
+        end = start + int(single('duration'))
+    else:
+        raise ValueError("缺少 end 或 duration 参数")
+    if not 0 < end - start <= MAX_WINDOW:
+        raise ValueError(f"无效的时间窗口: {start} ~ {end}")
+    return start, end
+
+
+def percentile(values, fraction):
+    """已排序的 values 中的分位数"""
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+
+class Metrics:
+    """按请求类型统计请求数、状态码和最近 LATENCY_WINDOW 次的延迟"""
+
+    def __init__(self, window=LATENCY_WINDOW):
+        self.window = window
+        self.started = time.time()
+        # 请求类型 -> {状态码: 次数}
+        self.statuses = {}
+        # 请求类型 -> 最近的延迟（秒）
+        self.latencies = {}
+
+    def record(self, route, status, seconds):
+        counts = self.statuses.setdefault(route, {})
+        counts[status] = counts.get(status, 0) + 1
+        latencies = self.latencies.get(route)
+        if latencies is None:
+            latencies = self.latencies[route] = collections.deque(maxlen=self.window)
+        latencies.append(seconds)
+
+    def snapshot(self):
+        routes = {}
+        for route, counts in self.statuses.items():
+            latencies = sorted(self.latencies[route])
+            routes[route] = {
+                "requests": sum(counts.values()),
+                "status": {str(status): count for status, count in sorted(counts.items())},
+                "latency_ms": {
+                    "mean": round(sum(latencies) / len(latencies) * 1000, 3),
+                    "p50": round(percentile(latencies, 0.5) * 1000, 3),
+                    "p90": round(percentile(latencies, 0.9) * 1000, 3),
+                    "p99": round(percentile(latencies, 0.99) * 1000, 3),
+                    "max": round(latencies[-1] * 1000, 3),
+                },
+            }
+        cache = render_cached.cache_info()
+        return {"uptime": round(time.time() - self.started), "routes": routes,
+                "render_cache": {"hits": cache.hits, "misses": cache.misses,
+                                 "size": cache.currsize, "max_size": cache.maxsize}}
+
+
+class ReplayProxy:
+    """跳转服务：respond 处理单个请求，handle 是 asyncio 的连接处理函数"""
+
+    def __init__(self, header, channels, metrics=None):
+        self.header = header
+        self.channels = channels
+        self.metrics = metrics or Metrics()
+        # 服务地址 -> 改写后的播放列表
+        self._playlists = {}
+
+    def playlist(self, base):
+        """播放地址和回看模板指向 base 的播放列表"""
+        content = self._playlists.get(base)
+        if content is None:
+            lines = [self.header]
+            for key, entry in self.channels.items():
+                channel = entry.channel.copy()
+                path = quote(key, safe='')
+                if entry.template is not None:
+                    channel.set_attr('catchup', 'default')
+                    channel.set_attr('catchup-source', f"{base}/replay/{path}?start=${{(b)10}}&end=${{(e)10}}")
+                lines.extend((channel.extinf, f"{base}/live/{path}"))
+            content = self._playlists[base] = ("\n".join(lines) + "\n").encode('utf-8')
+        return content
+
+    def respond(self, method, target, host):
+        """返回 (请求类型, 状态码, 附加响应头, 正文)"""
+        if method not in ('GET', 'HEAD'):
+            return 'other', 405, {'Allow': 'GET, HEAD'}, b""
+        parts = urlsplit(target)
+        route, _, rest = parts.path.lstrip('/').partition('/')
+
+        if route in ('live', 'replay'):
+            entry = self.channels.get(unquote(rest))
+            if entry is None:
+                return route, 404, {}, "未知的频道\n".encode('utf-8')
+            if route == 'live':
+                return route, 302, {'Location': entry.channel.url}, b""
+            if entry.template is None:
+                return route, 404, {}, "该频道没有回看\n".encode('utf-8')
+            try:
+                start, end = parse_window(parse_qs(parts.query))
+            except ValueError as e:
+                return route, 400, {}, f"{e}\n".encode('utf-8')
+            return route, 302, {'Location': render_cached(entry.template, start, end)}, b""
+        if parts.path == '/playlist.m3u':
+            return 'playlist', 200, {'Content-Type': 'audio/x-mpegurl; charset=utf-8'}, self.playlist(
+                f"http://{host}")
+        if parts.path == '/metrics':
+            body = json.dumps(self.metrics.snapshot(), ensure_ascii=False, indent=1) + "\n"
+            return 'metrics', 200, {'Content-Type': 'application/json; charset=utf-8'}, body.encode('utf-8')
+        return 'other', 404, {}, b""
+
+    async def handle(self, reader, writer):
+        """处理一个连接上的请求（支持 keep-alive）"""
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    return
+                started = time.perf_counter()
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    key, _, value = line.decode('latin-1').partition(':')
+                    headers[key.strip().lower()] = value.strip()
+                try:
+                    method, target, version = request_line.decode('latin-1').split()
+                except ValueError:
+                    route, status, extra, body, version = 'other', 400, {}, b"", 'HTTP/1.0'
+                else:
+                    route, status, extra, body = self.respond(method, target, headers.get('host', 'localhost'))
+                keep_alive = version == 'HTTP/1.1' and headers.get('connection', '').lower() != 'close'
+                head = [f"HTTP/1.1 {status} {_REASONS[status]}", f"Server: {SERVER_NAME}",
+                        f"Content-Length: {len(body)}", f"Connection: {'keep-alive' if keep_alive else 'close'}"]
+                head.extend(f"{key}: {value}" for key, value in extra.items())
+                writer.write(("\r\n".join(head) + "\r\n\r\n").encode('utf-8')
+                             + (body if request_line[:4] != b'HEAD' else b""))
+                await writer.drain()
+                self.metrics.record(route, status, time.perf_counter() - started)
+                if not keep_alive:
+                    return
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host, port):
+        server = await asyncio.start_server(self.handle, host, port)
+        print(f"{len(self.channels)} 个频道，"
+              f"{sum(entry.template is not None for entry in self.channels.values())} 个有回看；"
+              f"监听 http://{host}:{port}/ (播放列表: /playlist.m3u，统计: /metrics)")
+        async with server:
+            await server.serve_forever()
+
+
+# ==================== 自检 ====================
+
+def self_check():
+    """在本地端口上启动服务，检查跳转、时区换算、播放列表改写和统计，返回失败项列表"""
+    import http.client
+    import os
+    import tempfile
+
+    playlist = "\n".join([
+        '#EXTM3U url-tvg="http://epg/e.xml.gz"',
+        '#EXTINF:-1 tvg-name="CCTV1" catchup="default" catchup-source="rtsp://10.0.0.1:1554/iptv/ch1.rsc'
+        '?tvdr=${(b)yyyyMMddHHmmss}GMT-${(e)yyyyMMddHHmmss}GMT&r2h-seek-offset=-28800",CCTV1',
+        'http://192.168.100.1:5140/rtp/239.253.246.77:8000',
+        '#EXTINF:-1 tvg-name="山东卫视" catchup="default" catchup-source="http://h/index.m3u8'
+        "?startTime=${(b)yyyyMMdd'T'HHmmss'.00Z'|-08:00}&endTime=${(e)yyyyMMdd'T'HHmmss'.00Z'|-08:00}\",山东卫视",
+        'http://h/live/sdws.m3u8',
+        '#EXTINF:-1 tvg-name="CCTV1",CCTV1',
+        'http://backup/cctv1',
+    ])
+    start = calendar.timegm((2024, 5, 1, 12, 0, 0))
+    cctv1 = "http://192.168.100.1:5140/rtsp/10.0.0.1:1554/iptv/ch1.rsc?tvdr=20240501120000GMT-20240501123000GMT"
+    sdws = "http://h/index.m3u8?startTime=20240501T120000.00Z&endTime=20240501T123000.00Z"
+    cases = [
+        ('/live/CCTV1', 302, 'http://192.168.100.1:5140/rtp/239.253.246.77:8000'),
+        ('/live/CCTV1~2', 302, 'http://backup/cctv1'),
+        (f'/replay/CCTV1?start={start}&end={start + 1800}', 302, cctv1),
+        ('/replay/CCTV1?start=20240501200000&end=20240501203000', 302, cctv1),
+        ('/replay/CCTV1?start=20240501120000&duration=1800&tz=utc', 302, cctv1),
+        (f'/replay/{quote("山东卫视")}?start={start}000&end={start + 1800}000', 302, sdws),
+        ('/replay/CCTV1~2?start=20240501200000&end=20240501203000', 404, None),
+        ('/replay/CCTV1?start=20240501200000', 400, None),
+        ('/replay/CCTV1?start=20240501203000&end=20240501200000', 400, None),
+        ('/live/CCTV99', 404, None),
+    ]
+    failures = []
+
+    async def check(proxy):
+        server = await asyncio.start_server(proxy.handle, '127.0.0.1', 0)
+        port = server.sockets[0].getsockname()[1]
+
+        def requests():
+            connection = http.client.HTTPConnection('127.0.0.1', port)
+            for target, status, location in cases:
+                connection.request('GET', target)
+                response = connection.getresponse()
+                response.read()
+                if response.status != status or location and response.getheader('Location') != location:
+                    failures.append(f"{target}: {response.status} {response.getheader('Location')}")
+            connection.request('GET', '/playlist.m3u')
+            content = connection.getresponse().read().decode('utf-8')
+            base = f"http://127.0.0.1:{port}"
+            if (f'catchup-source="{base}/replay/CCTV1?start=${{(b)10}}&end=${{(e)10}}"' not in content
+                    or f"{base}/live/CCTV1~2" not in content or 'catchup-source' in content.split('\n')[5]):
+                failures.append(f"播放列表改写不符:\n{content}")
+            # 保持连接，连续请求同一个节目，统计吞吐量
+            count = 2000
+            begin = time.perf_counter()
+            for _ in range(count):
+                connection.request('GET', f'/replay/CCTV1?start={start}&end={start + 1800}')
+                connection.getresponse().read()
+            rate = count / (time.perf_counter() - begin)
+            connection.request('GET', '/metrics')
+            metrics = json.loads(connection.getresponse().read())
+            connection.close()
+            return rate, metrics
+
+        async with server:
+            return await asyncio.get_running_loop().run_in_executor(None, requests)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'test.m3u')
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(playlist)
+        header, channels = load_channels([path])
+    proxy = ReplayProxy(header, channels)
+    rate, metrics = asyncio.run(check(proxy))
+    replay = metrics["routes"].get("replay", {})
+    if replay.get("status", {}).get("302") != 2004 or metrics["render_cache"]["hits"] < 2000:
+        failures.append(f"统计不符: {json.dumps(metrics, ensure_ascii=False)}")
+    print(f"  单连接 {rate:,.0f} 次/秒；回看延迟 p50 {replay.get('latency_ms', {}).get('p50')} ms，"
+          f"p99 {replay.get('latency_ms', {}).get('p99')} ms")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地直播 / 回看跳转服务")
+    parser.add_argument('playlists', nargs='*', help="播放列表（如 SDU-Multicast/SDU-Multicast-Weifang.m3u）")
+    parser.add_argument('--host', default='0.0.0.0', help="监听地址")
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help="监听端口")
+    parser.add_argument('--r2h', default=R2H_PROXY, help="把 rtsp 回看地址转为 HTTP 的 rtp2httpd 地址，空字符串表示不转换")
+    parser.add_argument('--self-check', action='store_true', help="在本地端口上自检")
+    args = parser.parse_args()
+
+    if args.self_check:
+        failures = self_check()
+        for failure in failures:
+            print(f"失败: {failure}")
+        print("自检通过" if not failures else f"{len(failures)} 项失败")
+        return 1 if failures else 0
+
+    if not args.playlists:
+        parser.error("需要至少一个播放列表")
+    header, channels = load_channels(args.playlists, args.r2h)
+    try:
+        asyncio.run(ReplayProxy(header, channels).serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
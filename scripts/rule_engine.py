@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+声明式播放列表改写规则
+
+规则写在 JSON 文件中（见 playlist_rules.json），每条规则包含：
+  description  说明文字，同时用于生成输出文件头部的"处理规则"注释
+  match        源频道匹配条件：{"exact": [...]} 或 {"contains": [...]}，
+               可加 "first": true 只取第一个命中的频道
+  action       regroup     修改分组
+               copy_after  复制到目标频道之后
+               move_after  移动到目标频道之后
+               move_to_end 移动到列表末尾
+  target       copy_after / move_after 的目标频道匹配条件（取第一个命中的频道）
+  group        可选，新的 group-title；copy_after 只修改副本的分组
+
+所有规则在加载时编译为一个执行计划：精确名称走字典查找，子串条件合并成一个
+Aho-Corasick 自动机。apply 只遍历频道一次，每个频道只做一次匹配，
+规则再多也不会增加额外的全表扫描。
+
+这也取代了处理脚本中原来的 find_channel_index / find_all_channel_indices
+线性查找和 pop/insert 移动：查找由上面的索引完成，移动和复制只是把频道放进
+目标之后的附加槽位（O(1)），不再需要单独的带索引的频道容器。
+与旧写法的耗时对比见 bench_rule_plan.py。
+"""
+
+import json
+
+ACTIONS = ('regroup', 'copy_after', 'move_after', 'move_to_end')
+TARGET_ACTIONS = ('copy_after', 'move_after')
+
+SOURCE = 'source'
+TARGET = 'target'
+
+
+class SubstringMatcher:
+    """
+    Aho-Corasick 多模式匹配器
+
+    一次扫描文本即可找出其中出现的全部模式，
+    代价只与文本长度和命中数有关，与模式数量无关。
+    """
+
+    def __init__(self, patterns):
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [set()]
+        self._match_all = set()
+        for pattern in patterns:
+            if pattern:
+                self._add(pattern)
+            else:
+                # 空模式匹配任何文本
+                self._match_all.add(pattern)
+        self._build()
+
+    def _add(self, pattern):
+        state = 0
+        for char in pattern:
+            nxt = self._goto[state].get(char)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append(set())
+                self._goto[state][char] = nxt
+            state = nxt
+        self._out[state].add(pattern)
+
+    def _build(self):
+        queue = list(self._goto[0].values())
+        for state in queue:
+            for char, nxt in self._goto[state].items():
+                queue.append(nxt)
+                fail = self._fail[state]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                target = self._goto[fail].get(char, 0)
+                self._fail[nxt] = target if target != nxt else 0
+                self._out[nxt] |= self._out[self._fail[nxt]]
+
+    def find(self, text):
+        """返回 text 中出现的全部模式"""
+        found = set(self._match_all)
+        goto, fail, out = self._goto, self._fail, self._out
+        state = 0
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if out[state]:
+                found |= out[state]
+        return found
+
+
+class Rule:
+    """编译后的单条规则"""
+
+    def __init__(self, index, spec):
+        self.index = index
+        self.description = spec.get('description', f"规则 {index + 1}")
+        self.action = spec.get('action')
+        self.group = spec.get('group')
+        if self.action not in ACTIONS:
+            raise ValueError(f"规则 {index + 1}: 未知的 action {self.action!r}")
+
+        self.source_kind, self.source_patterns = self._parse_match(spec.get('match'), 'match')
+        self.first = bool(spec['match'].get('first', False))
+
+        self.target_kind, self.target_patterns = None, ()
+        if self.action in TARGET_ACTIONS:
+            self.target_kind, self.target_patterns = self._parse_match(spec.get('target'), 'target')
+
+    def _parse_match(self, match, field):
+        if not isinstance(match, dict):
+            raise ValueError(f"规则 {self.index + 1}: 缺少 {field}")
+        kinds = [kind for kind in ('exact', 'contains') if kind in match]
+        if len(kinds) != 1:
+            raise ValueError(f"规则 {self.index + 1}: {field} 需要且只能包含 exact 或 contains 之一")
+        return kinds[0], tuple(match[kinds[0]])
+
+
+class RulePlan:
+    """把全部规则编译成一次遍历即可执行的计划"""
+
+    def __init__(self, rule_specs):
+        self.rules = [Rule(i, spec) for i, spec in enumerate(rule_specs)]
+
+        # 名称/模式 -> [(规则下标, 角色)]
+        self._exact = {}
+        self._contains = {}
+        for rule in self.rules:
+            self._register(rule.source_kind, rule.source_patterns, (rule.index, SOURCE))
+            if rule.target_kind:
+                self._register(rule.target_kind, rule.target_patterns, (rule.index, TARGET))
+        self._matcher = SubstringMatcher(self._contains)
+
+    def _register(self, kind, patterns, entry):
+        table = self._exact if kind == 'exact' else self._contains
+        for pattern in patterns:
+            table.setdefault(pattern, []).append(entry)
+
+    def _hits(self, name):
+        """频道名称命中的全部 (规则下标, 角色)，按规则顺序排列"""
+        hits = set(self._exact.get(name, ()))
+        for pattern in self._matcher.find(name):
+            hits.update(self._contains[pattern])
+        return sorted(hits)
+
+    def describe(self):
+        """生成头部注释用的规则说明，例如 ['1. CGTN频道改为"其他频道"', ...]"""
+        return [f"{rule.index + 1}. {rule.description}" for rule in self.rules]
+
+    def apply(self, channels):
+        """
+        按规则改写频道，返回新的频道列表
+
+        输出由若干槽位组成：每个频道占一个槽位，目标频道之后再挂一个附加槽位，
+        复制/移动过来的频道放进附加槽位。源频道出现在目标之前时先暂存，
+        等目标出现再放入；遍历结束仍未找到目标的移动会放回原位。
+        复制出的副本不再参与后续规则的匹配。
+        """
+        rules = self.rules
+        slots = []
+        anchors = {}
+        pending = {rule.index: [] for rule in rules if rule.action in TARGET_ACTIONS}
+        taken = set()
+        tail = []
+        counts = [0] * len(rules)
+
+        for channel in channels:
+            home = [channel]
+            slots.append(home)
+            hits = self._hits(channel.name)
+            if not hits:
+                continue
+
+            # 先确定锚点：同一频道上后面的规则的附加槽位更靠近频道
+            anchored_here = set()
+            for index, role in reversed(hits):
+                if role == TARGET and index not in anchors:
+                    attached = []
+                    for item in pending.pop(index):
+                        attached.append(item[1] if isinstance(item, tuple) else item)
+                    anchors[index] = attached
+                    slots.append(attached)
+                    anchored_here.add(index)
+
+            moved = False
+            for index, role in hits:
+                rule = rules[index]
+                if role != SOURCE or index in anchored_here:
+                    continue
+                if rule.first:
+                    if index in taken:
+                        continue
+                    taken.add(index)
+                counts[index] += 1
+
+                if rule.action == 'regroup':
+                    channel.set_attr('group-title', rule.group)
+                elif rule.action == 'copy_after':
+                    copied = channel.copy()
+                    if rule.group:
+                        copied.set_attr('group-title', rule.group)
+                    if index in anchors:
+                        anchors[index].append(copied)
+                    else:
+                        pending[index].append(copied)
+                elif not moved:
+                    if rule.group:
+                        channel.set_attr('group-title', rule.group)
+                    home.clear()
+                    moved = True
+                    if rule.action == 'move_to_end':
+                        tail.append(channel)
+                    elif index in anchors:
+                        anchors[index].append(channel)
+                    else:
+                        pending[index].append((home, channel))
+
+        for index, items in pending.items():
+            if items:
+                print(f"警告: 规则 {index + 1} 未找到目标频道 {list(rules[index].target_patterns)}")
+            for item in items:
+                if isinstance(item, tuple):
+                    home, channel = item
+                    home.append(channel)
+
+        for rule in rules:
+            if counts[rule.index]:
+                print(f"规则 {rule.index + 1} [{rule.description}]: 处理 {counts[rule.index]} 个频道")
+            else:
+                print(f"警告: 规则 {rule.index + 1} [{rule.description}] 未匹配到任何频道")
+
+        result = [channel for slot in slots for channel in slot]
+        result.extend(tail)
+        return result
+
+
+def load_rules(path):
+    """从 JSON 文件加载规则并编译"""
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    return RulePlan(data.get('rules', []))
@@ -0,0 +1,513 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+播放地址存活检查
+
+从生成的播放列表中收集全部播放地址，用 asyncio 并发做轻量检查：
+
+  http/https  带 Range 的 GET，只读开头 SAMPLE_BYTES 字节；
+              udpxy / rtp2httpd 的 /rtp/、/udp/ 地址必须读到 MPEG-TS 同步字节才算可用，
+              其他地址返回 2xx（m3u8 或 TS 内容）即可用；最多跟随 MAX_REDIRECTS 次跳转
+  rtsp        OPTIONS + DESCRIBE，DESCRIBE 返回 200 即可用
+  rtp/udp     组播地址无法在单播网络中检查，记为 skipped
+
+每次检查同时记录三项指标（毫秒 / kbps，测不到时为 null），供 stream_score 评分：
+  ttfb        发出请求到收到响应状态行
+  startup     开始连接到读到第一段媒体数据（m3u8 会继续请求其中的第一个地址）
+  kbps        读到媒体数据后继续读 window 秒的平均速率（window 为 0 时不测）
+
+并发数有全局上限（MAX_CONCURRENCY）和每个主机的上限（MAX_PER_HOST），
+单个地址的检查有总超时（PROBE_TIMEOUT）。结果写入 .data/stream_status.json，
+未超过 TTL 的记录在下次运行时直接沿用，只重新检查过期或新出现的地址。
+
+只用标准库，不依赖 requests。内网地址（192.168.x.x 等）只有在家庭网络中才能访问，
+在 CI 中可用 --skip-private 跳过。
+
+用法（在仓库根目录）:
+  python scripts/stream_probe.py [播放列表或通配符 ...] [--ttl 秒] [--skip-private] [--force]
+  python scripts/stream_probe.py --self-check     用本地替身服务器自检
+"""
+
+import argparse
+import asyncio
+import glob
+import ipaddress
+import json
+import os
+import ssl
+import time
+from urllib.parse import urljoin, urlsplit
+
+from build_manifest import STATE_DIR, atomic_write
+from m3u_parser import iter_m3u_file
+from package_artifacts import PLAYLIST_PATTERNS
+
+STATUS_FILE = os.path.join(STATE_DIR, "stream_status.json")
+DEFAULT_PLAYLISTS = PLAYLIST_PATTERNS + ["custom/custom*.m3u"]
+
+MAX_CONCURRENCY = 64
+MAX_PER_HOST = 4
+PROBE_TIMEOUT = 8
+# 记录的有效期（秒）
+DEFAULT_TTL = 6 * 3600
+# 读取的最大字节数；足够包含若干个 188 字节的 TS 包
+SAMPLE_BYTES = 4096
+MAX_REDIRECTS = 3
+# m3u8 中最多跟随几层（主列表 -> 子列表 -> 分片）
+MAX_PLAYLIST_DEPTH = 2
+USER_AGENT = "Mozilla/5.0 (stream_probe)"
+
+TS_PACKET = 188
+TS_SYNC = 0x47
+# 连续多少个包的同步字节对齐才认为是 TS 流
+TS_SYNC_PACKETS = 3
+
+OK, DEAD, SKIPPED = 'ok', 'dead', 'skipped'
+
+
+def find_ts_sync(data, packets=TS_SYNC_PACKETS):
+    """data 中第一个连续 packets 个包同步字节对齐的位置，没有时返回 -1"""
+    span = TS_PACKET * (packets - 1)
+    for offset in range(min(TS_PACKET, len(data) - span)):
+        if all(data[offset + i * TS_PACKET] == TS_SYNC for i in range(packets)):
+            return offset
+    return -1
+
+
+def is_private_host(host):
+    try:
+        address = ipaddress.ip_address(host)
+    except ValueError:
+        return False
+    return address.is_private or address.is_loopback or address.is_link_local
+
+
+def needs_ts(path):
+    """udpxy / rtp2httpd 的组播转单播地址"""
+    return path.startswith(('/rtp/', '/udp/'))
+
+
+class ProbeError(Exception):
+    """检查失败，消息即结果说明"""
+
+
+# ==================== 协议 ====================
+
+async def _read_head(reader):
+    """读取响应的状态行和头部，返回 (状态码, {小写头部名: 值})"""
+    lines = []
+    while True:
+        line = await reader.readline()
+        if not line:
+            raise ProbeError("连接被关闭")
+        line = line.decode('latin-1').rstrip('\r\n')
+        if not line:
+            break
+        lines.append(line)
+    parts = lines[0].split(None, 2) if lines else []
+    if len(parts) < 2 or not parts[1].isdigit():
+        raise ProbeError(f"无效的响应: {lines[0][:60] if lines else ''}")
+    headers = {}
+    for line in lines[1:]:
+        key, _, value = line.partition(':')
+        headers[key.strip().lower()] = value.strip()
+    return int(parts[1]), headers
+
+
+async def _read_body(reader, headers, limit):
+    """读取正文开头最多 limit 字节（支持 chunked）"""
+    if headers.get('transfer-encoding', '').lower() != 'chunked':
+        data = b''
+        while len(data) < limit:
+            chunk = await reader.read(limit - len(data))
+            if not chunk:
+                break
+            data += chunk
+        return data
+    data = b''
+    while len(data) < limit:
+        size_line = await reader.readline()
+        size = int(size_line.split(b';')[0].strip() or b'0', 16)
+        if size == 0:
+            break
+        data += await reader.readexactly(size)
+        await reader.readline()
+    return data[:limit]
+
+
+async def _open(host, port, use_ssl):
+    context = ssl.create_default_context() if use_ssl else None
+    try:
+        return await asyncio.open_connection(host, port, ssl=context)
+    except OSError as e:
+        raise ProbeError(f"无法连接: {e.strerror or e}")
+
+
+def first_uri(playlist):
+    """m3u8 文本中第一个媒体地址（子列表或分片）"""
+    for line in playlist.decode('utf-8', 'replace').splitlines():
+        line = line.strip()
+        if line and not line.startswith('#'):
+            return line
+    return None
+
+
+async def _sample_rate(reader, window, received):
+    """继续读 window 秒，返回这段时间（含已读到的 received 字节）的平均速率 kbps"""
+    start = time.perf_counter()
+    deadline = start + window
+    total = received
+    while True:
+        remaining = deadline - time.perf_counter()
+        if remaining <= 0:
+            break
+        try:
+            chunk = await asyncio.wait_for(reader.read(65536), remaining)
+        except asyncio.TimeoutError:
+            break
+        if not chunk:
+            break
+        total += len(chunk)
+    elapsed = max(time.perf_counter() - start, 1e-3)
+    return round(total * 8 / elapsed / 1000, 1)
+
+
+def _metrics(ttfb, startup, kbps=None):
+    return {'ttfb': round(ttfb * 1000, 1), 'startup': round(startup * 1000, 1), 'kbps': kbps}
+
+
+async def probe_http(url, window=0, redirects=MAX_REDIRECTS, started=None, depth=0):
+    """返回 (结果说明, 指标)；不可用时抛出 ProbeError"""
+    started = time.perf_counter() if started is None else started
+    parts = urlsplit(url)
+    use_ssl = parts.scheme == 'https'
+    port = parts.port or (443 if use_ssl else 80)
+    target = (parts.path or '/') + (f"?{parts.query}" if parts.query else '')
+    # 测速率时需要完整的流，不带 Range
+    ranged = f"Range: bytes=0-{SAMPLE_BYTES - 1}\r\n" if not window else ""
+    reader, writer = await _open(parts.hostname, port, use_ssl)
+    try:
+        sent = time.perf_counter()
+        writer.write((f"GET {target} HTTP/1.1\r\nHost: {parts.netloc}\r\nUser-Agent: {USER_AGENT}\r\n"
+                      f"{ranged}Connection: close\r\n\r\n").encode('utf-8'))
+        await writer.drain()
+        status, headers = await _read_head(reader)
+        ttfb = time.perf_counter() - sent
+        if status in (301, 302, 303, 307, 308) and headers.get('location'):
+            if redirects <= 0:
+                raise ProbeError("跳转次数过多")
+            return await probe_http(urljoin(url, headers['location']), window, redirects - 1, started, depth)
+        if status not in (200, 206):
+            raise ProbeError(f"HTTP {status}")
+        body = await _read_body(reader, headers, SAMPLE_BYTES)
+        received = time.perf_counter()
+
+        if body.lstrip().startswith(b'#EXTM3U'):
+            uri = first_uri(body)
+            if uri is None or depth >= MAX_PLAYLIST_DEPTH:
+                return f"HTTP {status} m3u8", _metrics(ttfb, received - started)
+            writer.close()
+            detail, metrics = await probe_http(urljoin(url, uri), window, redirects, started, depth + 1)
+            # ttfb 取播放地址本身的响应时间，startup 包含列表和分片的全部请求
+            metrics['ttfb'] = round(ttfb * 1000, 1)
+            return f"m3u8 -> {detail}", metrics
+        if find_ts_sync(body) >= 0:
+            kbps = await _sample_rate(reader, window, len(body)) if window else None
+            return f"HTTP {status} mpegts", _metrics(ttfb, received - started, kbps)
+        if needs_ts(parts.path):
+            raise ProbeError(f"HTTP {status} 但没有读到 TS 数据 ({len(body)} 字节)")
+        return f"HTTP {status} {headers.get('content-type', '')}".rstrip(), _metrics(ttfb, received - started)
+    finally:
+        writer.close()
+
+
+async def _rtsp_request(reader, writer, method, url, cseq, extra=""):
+    writer.write((f"{method} {url} RTSP/1.0\r\nCSeq: {cseq}\r\nUser-Agent: {USER_AGENT}\r\n"
+                  f"{extra}\r\n").encode('utf-8'))
+    await writer.drain()
+    status, headers = await _read_head(reader)
+    length = int(headers.get('content-length', '0') or 0)
+    if length:
+        await reader.readexactly(length)
+    return status, headers
+
+
+async def probe_rtsp(url, window=0, redirects=MAX_REDIRECTS, started=None):
+    """
+    OPTIONS + DESCRIBE；返回 (结果说明, 指标)，不可用时抛出 ProbeError
+    不建立 RTP 会话，startup 取 DESCRIBE 完成的时间，不测速率
+    """
+    started = time.perf_counter() if started is None else started
+    parts = urlsplit(url)
+    reader, writer = await _open(parts.hostname, parts.port or 554, False)
+    try:
+        sent = time.perf_counter()
+        status, _ = await _rtsp_request(reader, writer, 'OPTIONS', url, 1)
+        ttfb = time.perf_counter() - sent
+        if status != 200:
+            raise ProbeError(f"RTSP OPTIONS {status}")
+        status, headers = await _rtsp_request(reader, writer, 'DESCRIBE', url, 2,
+                                              "Accept: application/sdp\r\n")
+    finally:
+        writer.close()
+    if status in (301, 302) and headers.get('location') and redirects > 0:
+        return await probe_rtsp(headers['location'], window, redirects - 1, started)
+    if status != 200:
+        raise ProbeError(f"RTSP DESCRIBE {status}")
+    return "RTSP 200", _metrics(ttfb, time.perf_counter() - started)
+
+
+PROBES = {'http': probe_http, 'https': probe_http, 'rtsp': probe_rtsp}
+
+
+# ==================== 调度 ====================
+
+class StreamProber:
+    """带全局和每主机并发上限的检查器"""
+
+    def __init__(self, concurrency=MAX_CONCURRENCY, per_host=MAX_PER_HOST, timeout=PROBE_TIMEOUT,
+                 skip_private=False, window=0):
+        self.concurrency = concurrency
+        # 测速率的时长（秒），0 表示只检查是否可用
+        self.window = window
+        self.per_host = per_host
+        self.timeout = timeout
+        self.skip_private = skip_private
+        self._global = None
+        self._hosts = {}
+
+    def _host_limit(self, host):
+        semaphore = self._hosts.get(host)
+        if semaphore is None:
+            semaphore = self._hosts[host] = asyncio.Semaphore(self.per_host)
+        return semaphore
+
+    async def probe(self, url):
+        """检查一个地址，返回状态记录 {status, detail, ms, checked, ttfb, startup, kbps}"""
+        parts = urlsplit(url)
+        probe = PROBES.get(parts.scheme)
+        if probe is None or not parts.hostname:
+            return _record(SKIPPED, f"不支持的协议: {parts.scheme}")
+        if self.skip_private and is_private_host(parts.hostname):
+            return _record(SKIPPED, "内网地址")
+
+        async with self._global, self._host_limit(parts.hostname):
+            start = time.perf_counter()
+            metrics = None
+            try:
+                detail, metrics = await asyncio.wait_for(probe(url, self.window), self.timeout + self.window)
+                status = OK
+            except asyncio.TimeoutError:
+                status, detail = DEAD, f"超时 ({self.timeout} 秒)"
+            except ProbeError as e:
+                status, detail = DEAD, str(e)
+            except (OSError, ValueError, asyncio.IncompleteReadError) as e:
+                status, detail = DEAD, f"{type(e).__name__}: {e}"
+            return _record(status, detail, (time.perf_counter() - start) * 1000, metrics)
+
+    async def probe_all(self, urls):
+        """并发检查 urls，返回 {地址: 状态记录}"""
+        self._global = asyncio.Semaphore(self.concurrency)
+        self._hosts = {}
+        urls = list(urls)
+        results = await asyncio.gather(*(self.probe(url) for url in urls))
+        return dict(zip(urls, results))
+
+
+def _record(status, detail, ms=None, metrics=None):
+    record = {'status': status, 'detail': detail,
+              'ms': None if ms is None else round(ms, 1), 'checked': int(time.time())}
+    record.update(metrics or {'ttfb': None, 'startup': None, 'kbps': None})
+    return record
+
+
+def load_status(path=STATUS_FILE):
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_status(status, path=STATUS_FILE):
+    atomic_write(path, json.dumps(status, ensure_ascii=False, indent=1, sort_keys=True) + '\n')
+
+
+def stale_urls(urls, status, ttl, now=None):
+    """urls 中没有记录或记录已超过 ttl 的地址"""
+    now = time.time() if now is None else now
+    return [url for url in urls if url not in status or now - status[url].get('checked', 0) >= ttl]
+
+
+def collect_urls(patterns=DEFAULT_PLAYLISTS):
+    """{播放地址: [频道名]}，按首次出现的顺序"""
+    urls = {}
+    for pattern in patterns:
+        for playlist in sorted(glob.glob(pattern)):
+            for ch in iter_m3u_file(playlist):
+                names = urls.setdefault(ch.url, [])
+                name = ch.tvg_name or ch.name
+                if name not in names:
+                    names.append(name)
+    return urls
+
+
+def run(urls, status_file=STATUS_FILE, ttl=DEFAULT_TTL, force=False, prober=None):
+    """检查 urls 中过期的地址并更新状态文件，返回 (全部状态, 本次检查的地址数)"""
+    status = load_status(status_file)
+    todo = list(urls) if force else stale_urls(urls, status, ttl)
+    if todo:
+        status.update(asyncio.run((prober or StreamProber()).probe_all(todo)))
+    # 只保留仍在播放列表中的地址
+    status = {url: status[url] for url in urls if url in status}
+    save_status(status, status_file)
+    return status, len(todo)
+
+
+# ==================== 自检 ====================
+
+async def _serve_rtsp(reader, writer):
+    """最小的 RTSP 替身：OPTIONS 都返回 200，DESCRIBE 只对 /ok 开头的路径返回 200"""
+    try:
+        while True:
+            request = []
+            while True:
+                line = await reader.readline()
+                if not line:
+                    return
+                line = line.decode('latin-1').rstrip('\r\n')
+                if not line:
+                    break
+                request.append(line)
+            method, url, _ = request[0].split(' ', 2)
+            cseq = next((line.split(':', 1)[1].strip() for line in request
+                         if line.lower().startswith('cseq')), '0')
+            ok = method == 'OPTIONS' or urlsplit(url).path.startswith('/ok')
+            body = b"v=0\r\n" if ok and method == 'DESCRIBE' else b""
+            writer.write((f"RTSP/1.0 {200 if ok else 404} {'OK' if ok else 'Not Found'}\r\nCSeq: {cseq}\r\n"
+                          f"Content-Length: {len(body)}\r\n\r\n").encode('latin-1') + body)
+            await writer.drain()
+    finally:
+        writer.close()
+
+
+def self_check():
+    """用本地 HTTP / RTSP 替身服务器检查各种情况、并发上限和 TTL，返回失败项列表"""
+    import socket
+    import tempfile
+    from stub_http_server import StubHTTPServer
+
+    ts = bytes([TS_SYNC]) + bytes(TS_PACKET - 1)
+    routes = {
+        '/rtp/239.253.0.1:8000': ts * 40,
+        '/rtp/239.253.0.2:8000': b"<html>no signal</html>",
+        '/live/index.m3u8': "#EXTM3U\n#EXT-X-VERSION:3\n",
+        '/vod/file.ts': b"\x00" * 5 + ts * 20,
+        # 主列表 -> 子列表 -> 分片
+        '/hls/master.m3u8': "#EXTM3U\n#EXT-X-STREAM-INF:BANDWIDTH=800000\nsub/index.m3u8\n",
+        '/hls/sub/index.m3u8': "#EXTM3U\n#EXTINF:2.0,\nseg0.ts\n",
+        '/hls/sub/seg0.ts': ts * 400,
+    }
+    routes.update({f'/slow/{i}.m3u8': "#EXTM3U\n" for i in range(12)})
+    expected = {
+        '/rtp/239.253.0.1:8000': OK,
+        '/rtp/239.253.0.2:8000': DEAD,
+        '/live/index.m3u8': OK,
+        '/vod/file.ts': OK,
+        '/hls/master.m3u8': OK,
+        '/missing.m3u8': DEAD,
+    }
+    failures = []
+
+    async def check(server):
+        rtsp = await asyncio.start_server(_serve_rtsp, '127.0.0.1', 0)
+        rtsp_port = rtsp.sockets[0].getsockname()[1]
+        # 取一个空闲端口后立即关闭，连接会被拒绝
+        with socket.socket() as sock:
+            sock.bind(('127.0.0.1', 0))
+            closed_port = sock.getsockname()[1]
+        cases = {server.url(path): state for path, state in expected.items()}
+        cases[f"rtsp://127.0.0.1:{rtsp_port}/ok/channel1"] = OK
+        cases[f"rtsp://127.0.0.1:{rtsp_port}/gone/channel2"] = DEAD
+        cases[f"http://127.0.0.1:{closed_port}/rtp/239.253.0.3:8000"] = DEAD
+        cases["rtp://239.253.0.4:8000"] = SKIPPED
+        async with rtsp:
+            results = await StreamProber(timeout=3).probe_all(cases)
+        for url, state in cases.items():
+            if results[url]['status'] != state:
+                failures.append(f"{url}: 应为 {state}，实际 {results[url]['status']} ({results[url]['detail']})")
+        return results
+
+    with StubHTTPServer(routes) as server:
+        results = asyncio.run(check(server))
+        for url, result in results.items():
+            print(f"  {result['status']:8} {result['detail']:40} {url}")
+        for url, result in results.items():
+            if result['status'] == OK and not 0 <= result['ttfb'] <= result['startup']:
+                failures.append(f"{url}: 指标不合理 ttfb={result['ttfb']} startup={result['startup']}")
+        hls = results[server.url('/hls/master.m3u8')]
+        if not hls['detail'].endswith('mpegts'):
+            failures.append(f"m3u8 应跟随到分片: {hls['detail']}")
+        # 测速率：不带 Range 读完整的分片
+        sampled = asyncio.run(StreamProber(timeout=3, window=0.2).probe_all([server.url('/hls/master.m3u8')]))
+        kbps = next(iter(sampled.values()))['kbps']
+        if not kbps:
+            failures.append(f"应测出速率: {kbps}")
+        print(f"  m3u8 ttfb {hls['ttfb']} ms, startup {hls['startup']} ms, 速率 {kbps} kbps")
+
+    with StubHTTPServer(routes, delay=0.1) as server, tempfile.TemporaryDirectory() as tmp:
+        status_file = os.path.join(tmp, 'status.json')
+        urls = [server.url(f'/slow/{i}.m3u8') for i in range(12)]
+        start = time.perf_counter()
+        _, probed = run(urls, status_file, prober=StreamProber(per_host=3))
+        elapsed = time.perf_counter() - start
+        peak = server.peak
+        if peak > 3:
+            failures.append(f"同一主机并发数 {peak} 超过上限 3")
+        _, again = run(urls, status_file)
+        if probed != len(urls) or again != 0:
+            failures.append(f"未过期的记录应沿用：第一次检查 {probed} 个，第二次 {again} 个")
+        _, expired = run(urls, status_file, ttl=0)
+        if expired != len(urls):
+            failures.append("过期的记录应重新检查")
+        print(f"  并发检查 {len(urls)} 个地址（每主机上限 3）: {elapsed:.2f} 秒，峰值 {peak}")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="检查播放列表中的播放地址是否可用")
+    parser.add_argument('playlists', nargs='*', default=DEFAULT_PLAYLISTS, help="播放列表或通配符")
+    parser.add_argument('--ttl', type=int, default=DEFAULT_TTL, help="记录的有效期（秒）")
+    parser.add_argument('--force', action='store_true', help="忽略记录，全部重新检查")
+    parser.add_argument('--skip-private', action='store_true', help="跳过内网地址")
+    parser.add_argument('--concurrency', type=int, default=MAX_CONCURRENCY, help="全局并发上限")
+    parser.add_argument('--per-host', type=int, default=MAX_PER_HOST, help="每个主机的并发上限")
+    parser.add_argument('--self-check', action='store_true', help="用本地替身服务器自检")
+    args = parser.parse_args()
+
+    if args.self_check:
+        failures = self_check()
+        for failure in failures:
+            print(f"失败: {failure}")
+        print("自检通过" if not failures else f"{len(failures)} 项失败")
+        return 1 if failures else 0
+
+    urls = collect_urls(args.playlists)
+    prober = StreamProber(args.concurrency, args.per_host, skip_private=args.skip_private)
+    start = time.perf_counter()
+    status, probed = run(urls, ttl=args.ttl, force=args.force, prober=prober)
+    counts = {}
+    for record in status.values():
+        counts[record['status']] = counts.get(record['status'], 0) + 1
+    print(f"{len(urls)} 个地址，本次检查 {probed} 个，耗时 {time.perf_counter() - start:.1f} 秒: "
+          + ", ".join(f"{state} {count}" for state, count in sorted(counts.items())))
+    for url, record in status.items():
+        if record['status'] == DEAD:
+            print(f"  - {', '.join(urls[url][:3])}: {record['detail']} ({url})")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
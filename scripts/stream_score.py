@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+播放地址评分和重复频道的排序
+
+同一分组中的同一个 tvg-name 常有多个播放地址（备份文件和自定义文件各一个，或源文件中的主备线路），
+合并和生成时保留文件中的先后顺序，客户端总是先播第一个。这里为这些地址评分，
+把起播最快的地址排到前面：
+
+  - 用 stream_probe 检查每个候选地址，测出 ttfb、startup 和 window 秒内的速率
+  - 每项指标在 .data/stream_scores.json 中做指数加权平均，旧值的权重随时间衰减
+    （半衰期 HALF_LIFE），失败记为失败率的一次样本
+  - 代价 = startup * (1 - 失败率) + FAILURE_PENALTY_MS * 失败率；没有记录的地址按
+    UNKNOWN_COST 计；代价相同时速率高的在前
+  - ScoreTable.rank 在每组 (group-title, tvg-name) 相同的频道原来占据的位置上
+    按代价重新排列，其他频道的位置不变，备用地址仍然保留；不同分组中的
+    同名频道（如"央视频道"和"4K频道"里的 CCTV1）各自排序，不会跨分组交换位置
+
+HLS 地址的速率是第一个分片的下载速率，只能作为吞吐量的样本，不代表码率。
+没有评分文件时不改变任何顺序。
+
+用法（在仓库根目录）:
+  python scripts/stream_score.py [播放列表或通配符 ...] [--window 秒] [--skip-private]
+  python scripts/stream_score.py --self-check
+"""
+
+import argparse
+import asyncio
+import glob
+import json
+import os
+import time
+
+from build_manifest import STATE_DIR, atomic_write, content_digest
+from m3u_parser import iter_m3u_file
+from stream_probe import DEAD, MAX_CONCURRENCY, MAX_PER_HOST, OK, StreamProber
+
+SCORE_FILE = os.path.join(STATE_DIR, "stream_scores.json")
+# 重复频道的来源：源播放列表、合并的基础文件和自定义文件
+DEFAULT_PLAYLISTS = ["*.m3u", "backup/temp-*.m3u", "custom/custom*.m3u"]
+
+# 新样本的权重；旧值的权重 (1 - SAMPLE_WEIGHT) 再按距上次更新的时间衰减
+SAMPLE_WEIGHT = 0.3
+HALF_LIFE = 3 * 86400
+# 超过这个时间没有更新的记录视为没有记录，保存时删除
+MAX_AGE = 30 * 86400
+FAILURE_PENALTY_MS = 8000
+UNKNOWN_COST = 3000
+# 测速率的默认时长（秒）
+DEFAULT_WINDOW = 3
+METRICS = ('ttfb', 'startup', 'kbps')
+
+
+def channel_name(channel):
+    return channel.tvg_name or channel.name
+
+
+def channel_key(channel):
+    """排序分组的键：(group-title, tvg-name)"""
+    return channel.group_title, channel_name(channel)
+
+
+def _blend(old, sample, weight):
+    if sample is None:
+        return old
+    if old is None:
+        return sample
+    return old * weight + sample * (1 - weight)
+
+
+class ScoreTable:
+    """地址 -> {ttfb, startup, kbps, fail, samples, updated}，保存在 SCORE_FILE"""
+
+    def __init__(self, path=SCORE_FILE):
+        self.path = path
+        self.scores = {}
+        self.digest = ""
+        if os.path.exists(path):
+            with open(path, 'rb') as f:
+                content = f.read()
+            try:
+                self.scores = json.loads(content)
+                self.digest = content_digest(content)
+            except ValueError:
+                self.scores = {}
+
+    def __len__(self):
+        return len(self.scores)
+
+    def update(self, url, record, now=None):
+        """用 stream_probe 的一条状态记录更新 url 的评分；skipped 的记录不计入"""
+        if record['status'] not in (OK, DEAD):
+            return
+        now = time.time() if now is None else now
+        entry = self.scores.get(url)
+        if entry is None:
+            weight = 0
+            entry = self.scores[url] = {'ttfb': None, 'startup': None, 'kbps': None, 'fail': None, 'samples': 0}
+        else:
+            weight = (1 - SAMPLE_WEIGHT) * 0.5 ** (max(now - entry['updated'], 0) / HALF_LIFE)
+        if record['status'] == OK:
+            for metric in METRICS:
+                value = _blend(entry[metric], record.get(metric), weight)
+                entry[metric] = None if value is None else round(value, 1)
+        entry['fail'] = round(_blend(entry['fail'], 0.0 if record['status'] == OK else 1.0, weight), 3)
+        entry['samples'] += 1
+        entry['updated'] = int(now)
+
+    def cost(self, url, now=None):
+        """起播代价（毫秒），越小越好"""
+        entry = self.scores.get(url)
+        now = time.time() if now is None else now
+        if entry is None or now - entry['updated'] >= MAX_AGE:
+            return UNKNOWN_COST
+        fail = entry['fail'] or 0.0
+        startup = UNKNOWN_COST if entry['startup'] is None else entry['startup']
+        return startup * (1 - fail) + FAILURE_PENALTY_MS * fail
+
+    def sort_key(self, url, now=None):
+        entry = self.scores.get(url) or {}
+        return self.cost(url, now), -(entry.get('kbps') or 0)
+
+    def rank(self, channels, now=None):
+        """
+        返回重新排列后的频道列表：每组 (group-title, tvg-name) 相同的频道按代价排序后
+        放回这组频道原来的位置；没有评分时原样返回
+        """
+        channels = list(channels)
+        if not self.scores:
+            return channels
+        positions = {}
+        for position, channel in enumerate(channels):
+            positions.setdefault(channel_key(channel), []).append(position)
+        ranked = list(channels)
+        for group in positions.values():
+            if len(group) < 2:
+                continue
+            # sorted 是稳定的，代价相同时保持原来的顺序
+            order = sorted(group, key=lambda position: self.sort_key(channels[position].url, now))
+            for position, source in zip(group, order):
+                ranked[position] = channels[source]
+        return ranked
+
+    def save(self, now=None):
+        now = time.time() if now is None else now
+        self.scores = {url: entry for url, entry in sorted(self.scores.items())
+                       if now - entry['updated'] < MAX_AGE}
+        content = json.dumps(self.scores, ensure_ascii=False, indent=1, sort_keys=True) + '\n'
+        atomic_write(self.path, content)
+        self.digest = content_digest(content)
+
+
+def duplicate_sources(patterns=DEFAULT_PLAYLISTS):
+    """{(group-title, tvg-name): [播放地址]}，只包含有两个以上不同地址的频道"""
+    sources = {}
+    for pattern in patterns:
+        for playlist in sorted(glob.glob(pattern)):
+            for ch in iter_m3u_file(playlist):
+                urls = sources.setdefault(channel_key(ch), [])
+                if ch.url not in urls:
+                    urls.append(ch.url)
+    return {name: urls for name, urls in sources.items() if len(urls) > 1}
+
+
+def score(urls, table, prober):
+    """检查 urls 并更新评分表，返回 {地址: 状态记录}"""
+    results = asyncio.run(prober.probe_all(urls))
+    now = time.time()
+    for url, record in results.items():
+        table.update(url, record, now)
+    return results
+
+
+# ==================== 自检 ====================
+
+def self_check():
+    """用本地替身服务器检查评分、衰减和排序，返回失败项列表"""
+    import tempfile
+    from m3u_parser import Channel
+    from stream_probe import TS_PACKET, TS_SYNC
+    from stub_http_server import StubHTTPServer
+
+    failures = []
+    ts = bytes([TS_SYNC]) + bytes(TS_PACKET - 1)
+    with tempfile.TemporaryDirectory() as tmp:
+        table = ScoreTable(os.path.join(tmp, 'scores.json'))
+        fast = StubHTTPServer({'/rtp/239.253.0.1:8000': ts * 40})
+        slow = StubHTTPServer({'/rtp/239.253.0.1:8000': ts * 40}, delay=0.3)
+        with fast, slow:
+            urls = {'fast': fast.url('/rtp/239.253.0.1:8000'), 'slow': slow.url('/rtp/239.253.0.1:8000'),
+                    'dead': fast.url('/rtp/239.253.0.2:8000'), 'unknown': 'http://unknown.invalid/live'}
+            score([urls['fast'], urls['slow'], urls['dead']], table, StreamProber(timeout=3, window=0.1))
+
+        # 4K频道中的 CCTV1 与央视频道中的同名频道不在同一组，位置不变
+        channels = [Channel(f'#EXTINF:-1 tvg-name="{name}" group-title="{group}",{name}', url)
+                    for group, name, url in (
+                        ('央视频道', 'CCTV1', urls['dead']), ('卫视频道', '山东卫视', urls['unknown']),
+                        ('央视频道', 'CCTV1', urls['slow']), ('4K频道', 'CCTV1', urls['dead']),
+                        ('央视频道', 'CCTV1', urls['fast']), ('卫视频道', '山东卫视', urls['slow']),
+                        ('4K频道', 'CCTV1', urls['unknown']))]
+        ranked = [ch.url for ch in table.rank(channels)]
+        expected = [urls['fast'], urls['slow'], urls['slow'], urls['unknown'], urls['dead'], urls['unknown'],
+                    urls['dead']]
+        if ranked != expected:
+            failures.append(f"排序不符: {ranked}")
+
+        # 失败按样本累积为失败率，一次失败不会直接变成 FAILURE_PENALTY_MS
+        now = time.time()
+        table.update(urls['fast'], {'status': DEAD}, now)
+        once = table.cost(urls['fast'], now)
+        for _ in range(5):
+            table.update(urls['fast'], {'status': DEAD}, now)
+        if not table.cost(urls['slow'], now) < table.cost(urls['fast'], now) or once >= FAILURE_PENALTY_MS:
+            failures.append(f"失败率未按样本累积: 一次 {once:.0f}，多次 {table.cost(urls['fast'], now):.0f}")
+        # 三个半衰期后旧值的权重只剩 1/8 左右，一次成功即可基本恢复
+        table.update(urls['fast'], {'status': OK, 'ttfb': 1, 'startup': 5, 'kbps': None}, now + 3 * HALF_LIFE)
+        if table.scores[urls['fast']]['fail'] > 0.15:
+            failures.append(f"旧记录未随时间衰减: 失败率 {table.scores[urls['fast']]['fail']}")
+
+        table.save(now)
+        reloaded = ScoreTable(table.path)
+        if reloaded.scores != table.scores or not reloaded.digest:
+            failures.append("评分表保存后读取不一致")
+        if ScoreTable(os.path.join(tmp, 'none.json')).rank(channels) != channels:
+            failures.append("没有评分时不应改变顺序")
+        for url, entry in table.scores.items():
+            print(f"  代价 {table.cost(url, now):7.0f}  {entry}  {url}")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="为重复频道的播放地址评分")
+    parser.add_argument('playlists', nargs='*', default=DEFAULT_PLAYLISTS, help="播放列表或通配符")
+    parser.add_argument('--window', type=float, default=DEFAULT_WINDOW, help="测速率的时长（秒），0 表示不测")
+    parser.add_argument('--skip-private', action='store_true', help="跳过内网地址")
+    parser.add_argument('--concurrency', type=int, default=MAX_CONCURRENCY, help="全局并发上限")
+    parser.add_argument('--per-host', type=int, default=MAX_PER_HOST, help="每个主机的并发上限")
+    parser.add_argument('--self-check', action='store_true', help="用本地替身服务器自检")
+    args = parser.parse_args()
+
+    if args.self_check:
+        failures = self_check()
+        for failure in failures:
+            print(f"失败: {failure}")
+        print("自检通过" if not failures else f"{len(failures)} 项失败")
+        return 1 if failures else 0
+
+    sources = duplicate_sources(args.playlists)
+    urls = list(dict.fromkeys(url for urls in sources.values() for url in urls))
+    table = ScoreTable()
+    prober = StreamProber(args.concurrency, args.per_host, skip_private=args.skip_private, window=args.window)
+    start = time.perf_counter()
+    results = score(urls, table, prober)
+    table.save()
+    print(f"{len(sources)} 个频道有多个地址，检查 {len(urls)} 个地址，耗时 {time.perf_counter() - start:.1f} 秒")
+    for (group, name), candidates in sources.items():
+        best = min(candidates, key=table.sort_key)
+        record = results[best]
+        print(f"  - {group or '(无分组)'} / {name}: {best} "
+              f"(代价 {table.cost(best):.0f} ms, {record['status']} {record['detail']})")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,295 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+本地 HTTP 替身服务器
+
+在 127.0.0.1 上模拟上游源：按路径返回内存中的内容，支持 ETag /
+Last-Modified 以及 If-None-Match / If-Modified-Since 条件请求，
+并记录每个请求的状态码和传输的字节数，便于在不访问外网的情况下
+检查 http_cache、fetch_sources 和各处理脚本的行为。
+还可以为某个路径预设若干次失败响应、给每个请求加上固定延迟，
+并统计同时处理的请求数峰值，用于检查重试、回退和并发限制。
+
+用法:
+  python scripts/stub_http_server.py              运行自检
+  python scripts/stub_http_server.py --serve DIR  把目录下的文件作为源提供
+"""
+
+import argparse
+import hashlib
+import os
+import sys
+import tempfile
+import threading
+import time
+from email.utils import formatdate, parsedate_to_datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import http_cache
+from http_cache import Source, conditional_get, fetch_source, load_state, save_state
+
+
+class StubHTTPServer:
+    """在后台线程中运行的替身服务器，可用作上下文管理器"""
+
+    def __init__(self, routes=None, port=0, delay=0):
+        self.routes = {}
+        self.failures = {}
+        self.delay = delay
+        self.log = []
+        self.bytes_sent = 0
+        self.active = 0
+        self.peak = 0
+        self._lock = threading.Lock()
+        for path, body in (routes or {}).items():
+            self.set(path, body)
+        self._server = ThreadingHTTPServer(('127.0.0.1', port), self._make_handler())
+        self._thread = None
+
+    def set(self, path, body, mtime=None):
+        """设置（或更新）某个路径的内容"""
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+        etag = '"' + hashlib.md5(body).hexdigest()[:16] + '"'
+        mtime = int(time.time() if mtime is None else mtime)
+        with self._lock:
+            self.routes[path] = (body, etag, mtime)
+
+    def fail(self, path, statuses):
+        """让 path 接下来的若干次请求依次返回 statuses 中的状态码"""
+        with self._lock:
+            self.failures.setdefault(path, []).extend(statuses)
+
+    def url(self, path):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}{path}"
+
+    def statuses(self):
+        return [status for _, _, status, _ in self.log]
+
+    def serve_forever(self):
+        """在当前线程中运行，直到被中断"""
+        try:
+            self._server.serve_forever()
+        finally:
+            self._server.server_close()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _record(self, method, path, status, size):
+        with self._lock:
+            self.log.append((method, path, status, size))
+            self.bytes_sent += size
+
+    def _make_handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            # 允许 keep-alive，检查连接池是否生效
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                with stub._lock:
+                    stub.active += 1
+                    stub.peak = max(stub.peak, stub.active)
+                try:
+                    if stub.delay:
+                        time.sleep(stub.delay)
+                    self._handle()
+                finally:
+                    with stub._lock:
+                        stub.active -= 1
+
+            def _handle(self):
+                with stub._lock:
+                    route = stub.routes.get(self.path)
+                    queued = stub.failures.get(self.path)
+                    failure = queued.pop(0) if queued else None
+                if failure is not None:
+                    self._reply(failure, b"stub failure")
+                    return
+                if route is None:
+                    self._reply(404, b"not found")
+                    return
+                body, etag, mtime = route
+                headers = {
+                    'ETag': etag,
+                    'Last-Modified': formatdate(mtime, usegmt=True),
+                    'Content-Type': 'text/plain; charset=utf-8',
+                }
+                if self._not_modified(etag, mtime):
+                    self._reply(304, b"", headers)
+                else:
+                    self._reply(200, body, headers)
+
+            def _not_modified(self, etag, mtime):
+                # 同时带两个条件时以 If-None-Match 为准 (RFC 7232)
+                if_none_match = self.headers.get('If-None-Match')
+                if if_none_match is not None:
+                    return etag in [tag.strip() for tag in if_none_match.split(',')]
+                if_modified_since = self.headers.get('If-Modified-Since')
+                if if_modified_since:
+                    try:
+                        return parsedate_to_datetime(if_modified_since).timestamp() >= mtime
+                    except (TypeError, ValueError):
+                        return False
+                return False
+
+            def _reply(self, status, body, headers=None):
+                self.send_response(status)
+                for key, value in (headers or {}).items():
+                    self.send_header(key, value)
+                if status != 304:
+                    self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                if body:
+                    self.wfile.write(body)
+                stub._record(self.command, self.path, status, len(body))
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+def self_check():
+    """用替身服务器检查条件请求、重试回退、并发限制和处理脚本的短路行为，返回失败项列表"""
+    from process_unicast import M3UProcessor
+
+    failures = []
+    playlist = '#EXTM3U\n#EXTINF:-1 tvg-name="CCTV1" group-title="央视频道",CCTV1\nhttp://example/1\n'
+    with StubHTTPServer({'/unicast.m3u': playlist}) as server, tempfile.TemporaryDirectory() as tmp:
+        state_file = os.path.join(tmp, '.data', 'unicast_source.json')
+        url = server.url('/unicast.m3u')
+
+        first = conditional_get(url, state_file)
+        if not (first.status == 200 and first.changed):
+            failures.append("首次请求应返回 200 并视为变化")
+        save_state(state_file, first)
+
+        second = conditional_get(url, state_file)
+        if not second.not_modified or server.log[-1][3] != 0:
+            failures.append("未变化时应返回 304 且不传输正文")
+        if second.text != playlist:
+            failures.append("304 时应从副本读出上次的内容")
+        if second.digest != first.digest:
+            failures.append("304 时应沿用上次记录的摘要")
+
+        server.set('/unicast.m3u', playlist + '#EXTINF:-1 tvg-name="CCTV2",CCTV2\nhttp://example/2\n')
+        third = conditional_get(url, state_file)
+        if not (third.status == 200 and third.changed):
+            failures.append("内容变化后应返回 200 并视为变化")
+
+        # 处理脚本：第一次完整处理，第二次命中 304 直接跳过、不写输出
+        output = os.path.join(tmp, 'backup', 'temp-unicast.m3u')
+        processor_state = os.path.join(tmp, '.data', 'processor.json')
+        M3UProcessor(url, output, processor_state).process()
+        if not os.path.exists(output) or load_state(processor_state).get('digest') != third.digest:
+            failures.append("处理脚本首次运行应生成输出并保存状态")
+        os.remove(output)
+        M3UProcessor(url, output, processor_state).process()
+        if os.path.exists(output) or server.statuses()[-1] != 304:
+            failures.append("源未变化时处理脚本应在 304 后直接跳过")
+
+        print(f"\n请求记录: {server.statuses()}，正文共 {server.bytes_sent} 字节")
+
+    failures += check_retry_and_fallback(playlist)
+    failures += check_concurrency(playlist)
+    return failures
+
+
+def check_retry_and_fallback(playlist):
+    """临时错误会重试；重试耗尽时退回副本；没有副本时抛出异常"""
+    failures = []
+    http_cache.BACKOFF_BASE = 0.01
+    with StubHTTPServer({'/flaky.m3u': playlist}) as server, tempfile.TemporaryDirectory() as tmp:
+        source = Source('flaky', server.url('/flaky.m3u'), os.path.join(tmp, 'flaky.json'))
+
+        server.fail('/flaky.m3u', [503, 502])
+        result = fetch_source(source)
+        if result.status != 200 or result.attempts != 3:
+            failures.append("503/502 之后应重试成功")
+        save_state(source.state_file, result)
+
+        server.fail('/flaky.m3u', [503] * (http_cache.RETRIES + 1))
+        fallback = fetch_source(source)
+        if not fallback.fallback or fallback.text != playlist or fallback.changed:
+            failures.append("重试耗尽时应退回最后一份可用的副本")
+
+        server.fail('/flaky.m3u', [404])
+        missing = Source('missing', source.url, os.path.join(tmp, 'missing.json'))
+        try:
+            fetch_source(missing)
+            failures.append("没有副本时下载失败应抛出异常")
+        except Exception:
+            pass
+        if server.statuses().count(404) != 1:
+            failures.append("404 不应重试")
+    return failures
+
+
+def check_concurrency(playlist, count=6, delay=0.2):
+    """并发下载同一主机的多个源，同时进行的请求数不超过 MAX_PER_HOST"""
+    from fetch_sources import fetch_all
+
+    failures = []
+    routes = {f'/source{i}.m3u': playlist for i in range(count)}
+    with StubHTTPServer(routes, delay=delay) as server, tempfile.TemporaryDirectory() as tmp:
+        sources = [Source(path, server.url(path), os.path.join(tmp, f'{i}.json'))
+                   for i, path in enumerate(routes)]
+        start = time.perf_counter()
+        fetched = fetch_all(sources)
+        elapsed = time.perf_counter() - start
+        if any(result is None for result, _, _ in fetched):
+            failures.append("并发下载不应失败")
+        if server.peak > http_cache.MAX_PER_HOST:
+            failures.append(f"同一主机并发数 {server.peak} 超过上限 {http_cache.MAX_PER_HOST}")
+        print(f"并发下载 {count} 个源: {elapsed:.2f} 秒（串行约 {count * delay:.2f} 秒），"
+              f"同时进行的请求峰值 {server.peak}")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地 HTTP 替身服务器")
+    parser.add_argument('--serve', metavar='DIR', help="提供目录下的文件，不运行自检")
+    parser.add_argument('--port', type=int, default=8765)
+    args = parser.parse_args()
+
+    if args.serve:
+        server = StubHTTPServer(port=args.port)
+        for name in sorted(os.listdir(args.serve)):
+            path = os.path.join(args.serve, name)
+            if os.path.isfile(path):
+                with open(path, 'rb') as f:
+                    server.set('/' + name, f.read(), mtime=os.path.getmtime(path))
+                print(server.url('/' + name))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        return 0
+
+    failures = self_check()
+    if failures:
+        for failure in failures:
+            print(f"失败: {failure}")
+        return 1
+    print("自检通过")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -3,29 +3,70 @@
 """
 根据源文件更新本地文件中的 catchup-source IP 和路径
 支持双向检测：源文件变化 或 本地文件变化 都会触发更新
+
+两个文件各解析一次，按 tvg-name 连接（完全相同优先，其次规范化后的名字），
+只替换 catchup-source 中 /rtsp/ 之后的 rsc 路径；差异写入 DIFF_FILE，
+并报告只在一侧出现的频道
 """
 
-import re
-import requests
 import hashlib
+import json
 import os
 
+from build_manifest import write_if_changed
+from epg_alias import normalize_name
+from http_cache import Source, fetch_source, save_state, set_output
+from m3u_parser import tokenize_extinf
+
 # 配置
 SOURCE_URL = "https://github.com/plsy1/iptv/raw/refs/heads/main/unicast/unicast-ku9.m3u"
 LOCAL_FILE = ".github/expand/multicast-origin.m3u"
 OUTPUT_FILE = ".github/expand/multicast-merge.m3u"
 HASH_FILE = ".data/catchup_source_hash.txt"
+SOURCE_STATE_FILE = ".data/catchup_source.json"
+# 最近一次更新的差异：{"updated": [{tvg-name, source, old, new}], "unchanged": 数量,
+#                     "local_only": [tvg-name], "source_only": [tvg-name]}
+DIFF_FILE = ".data/catchup_diff.json"
+HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
+}
+
+SOURCE = Source('catchup', SOURCE_URL, SOURCE_STATE_FILE, headers=HEADERS)
+
 
+def download_source(conditional=True):
+    """
+    下载源文件，返回 http_cache.FetchResult
+    conditional=True 时带条件请求，源未变化时服务器返回 304、不传输正文
+    """
+    print(f"正在下载源文件: {SOURCE.url}")
+    return fetch_source(SOURCE, conditional=conditional)
 
-def download_source(url):
-    """下载源文件"""
-    print(f"正在下载源文件: {url}")
-    headers = {
-        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
-    }
-    response = requests.get(url, headers=headers, timeout=30)
-    response.raise_for_status()
-    return response.text
+
+def source_rsc(catchup_source):
+    """源文件 catchup-source（rtsp://ip:port/path/xxx.rsc?...）中的 "ip:port/path/xxx.rsc"，不符合时返回 None"""
+    if not catchup_source.startswith('rtsp://'):
+        return None
+    path = catchup_source[len('rtsp://'):].split('?', 1)[0]
+    end = path.find('.rsc')
+    return path[:end + len('.rsc')] if end > 0 else None
+
+
+def split_local_rsc(catchup_source):
+    """
+    本地文件 catchup-source（http://代理/rtsp/ip:port/path/xxx.rsc?...）拆成 (前缀, rsc 路径, 查询部分)
+    不符合时返回 None
+    """
+    if not catchup_source.startswith('http://'):
+        return None
+    slash = catchup_source.find('/', len('http://'))
+    if slash < 0 or not catchup_source.startswith('/rtsp/', slash):
+        return None
+    head_end = slash + len('/rtsp/')
+    path, sep, query = catchup_source[head_end:].partition('?')
+    if not sep or not path.endswith('.rsc'):
+        return None
+    return catchup_source[:head_end], path, sep + query
 
 
 def parse_source_m3u(content):
@@ -34,66 +75,70 @@ def parse_source_m3u(content):
     返回: {tvg_name: "ip:port/path/to/channel.rsc"}
     """
     source_map = {}
-    lines = content.strip().split('\n')
-    
-    for line in lines:
-        if line.startswith('#EXTINF'):
-            # 提取 tvg-name
-            tvg_name_match = re.search(r'tvg-name="([^"]+)"', line)
-            if not tvg_name_match:
-                continue
-            tvg_name = tvg_name_match.group(1)
-            
-            # 提取 catchup-source 中的关键部分
-            catchup_match = re.search(r'catchup-source="rtsp://([^"?]+)', line)
-            if catchup_match:
-                full_path = catchup_match.group(1)
-                rsc_match = re.match(r'(.+?\.rsc)', full_path)
-                if rsc_match:
-                    source_map[tvg_name] = rsc_match.group(1)
-                    print(f"  源文件 [{tvg_name}]: {rsc_match.group(1)}")
-    
-    print(f"\n源文件共解析到 {len(source_map)} 个频道的 catchup-source")
+    for line in content.split('\n'):
+        # 先用字符串判断过滤，只解析带 catchup-source 的 EXTINF 行
+        if not line.startswith('#EXTINF') or 'catchup-source=' not in line:
+            continue
+        attrs, _, _ = tokenize_extinf(line)
+        tvg_name = attrs.get('tvg-name')
+        rsc = source_rsc(attrs.get('catchup-source', ''))
+        if tvg_name and rsc:
+            source_map[tvg_name] = rsc
+
+    print(f"源文件共解析到 {len(source_map)} 个频道的 catchup-source")
     return source_map
 
 
 def update_local_file(local_content, source_map):
     """
-    更新本地文件中的 catchup-source
+    按 tvg-name 把本地文件和源文件连接起来，只替换 catchup-source 中的 rsc 路径
+    tvg-name 完全相同的优先，其次按 epg_alias.normalize_name 规范化后的名字匹配
+    返回 (更新后的内容, 差异)；差异的格式见 DIFF_FILE
     """
+    # 规范化的名字 -> 源文件中的 tvg-name
+    normalized = {normalize_name(name): name for name in source_map}
+    diff = {"updated": [], "unchanged": 0, "local_only": [], "source_only": []}
+    matched = set()
+
     lines = local_content.strip().split('\n')
-    updated_lines = []
-    update_count = 0
-    
-    for line in lines:
-        if line.startswith('#EXTINF') and 'catchup-source=' in line:
-            tvg_name_match = re.search(r'tvg-name="([^"]+)"', line)
-            if tvg_name_match:
-                tvg_name = tvg_name_match.group(1)
-                
-                if tvg_name in source_map:
-                    new_path = source_map[tvg_name]
-                    pattern = r'(catchup-source="http://[^/]+/rtsp/)([^"?]+\.rsc)(\?[^"]*")'
-                    match = re.search(pattern, line)
-                    
-                    if match:
-                        old_path = match.group(2)
-                        if old_path != new_path:
-                            new_line = re.sub(
-                                pattern,
-                                rf'\g<1>{new_path}\g<3>',
-                                line
-                            )
-                            print(f"  更新 [{tvg_name}]:")
-                            print(f"    旧: {old_path}")
-                            print(f"    新: {new_path}")
-                            line = new_line
-                            update_count += 1
-        
-        updated_lines.append(line)
-    
-    print(f"\n共更新 {update_count} 个频道的 catchup-source")
-    return '\n'.join(updated_lines)
+    for number, line in enumerate(lines):
+        if not line.startswith('#EXTINF') or 'catchup-source=' not in line:
+            continue
+        attrs, _, _ = tokenize_extinf(line)
+        tvg_name = attrs.get('tvg-name')
+        catchup_source = attrs.get('catchup-source', '')
+        parts = split_local_rsc(catchup_source)
+        if not tvg_name or parts is None:
+            continue
+
+        source_name = tvg_name if tvg_name in source_map else normalized.get(normalize_name(tvg_name))
+        if source_name is None:
+            diff["local_only"].append(tvg_name)
+            continue
+        matched.add(source_name)
+
+        head, old_path, query = parts
+        new_path = source_map[source_name]
+        if old_path == new_path:
+            diff["unchanged"] += 1
+            continue
+        lines[number] = line.replace(f'catchup-source="{catchup_source}"',
+                                     f'catchup-source="{head}{new_path}{query}"', 1)
+        diff["updated"].append({"tvg-name": tvg_name, "source": source_name, "old": old_path, "new": new_path})
+
+    diff["source_only"] = [name for name in source_map if name not in matched]
+    return '\n'.join(lines), diff
+
+
+def print_diff(diff):
+    print(f"共更新 {len(diff['updated'])} 个频道的 catchup-source，未变化 {diff['unchanged']} 个")
+    for entry in diff["updated"]:
+        matched = "" if entry["source"] == entry["tvg-name"] else f" (源文件: {entry['source']})"
+        print(f"  更新 [{entry['tvg-name']}]{matched}: {entry['old']} -> {entry['new']}")
+    if diff["local_only"]:
+        print(f"源文件中没有的本地频道 ({len(diff['local_only'])}): {', '.join(diff['local_only'])}")
+    if diff["source_only"]:
+        print(f"本地文件中没有的源文件频道 ({len(diff['source_only'])}): {', '.join(diff['source_only'])}")
 
 
 def get_content_hash(content):
@@ -124,7 +169,11 @@ def save_hash(hash_value):
         f.write(hash_value)
 
 
-def main():
+def main(source=None, force=None):
+    """
+    source 为 fetch_sources 预先下载好的 FetchResult 时不再重复下载；
+    force 省略时由环境变量 FORCE_UPDATE 决定
+    """
     print("=" * 60)
     print("开始更新 catchup-source")
     print("=" * 60)
@@ -136,23 +185,24 @@ def main():
         return False
     
     # 下载源文件
-    try:
-        source_content = download_source(SOURCE_URL)
-    except Exception as e:
-        print(f"下载源文件失败: {e}")
-        return False
+    if source is None:
+        try:
+            source = download_source()
+        except Exception as e:
+            print(f"下载源文件失败: {e}")
+            return False
     
     # 读取本地文件
     with open(LOCAL_FILE, 'r', encoding='utf-8') as f:
         local_content = f.read()
     
-    # 计算组合哈希（源文件 + 本地文件）
-    source_hash = get_content_hash(source_content)
+    # 计算组合哈希（源文件 + 本地文件）；304 时源文件哈希取上次记录的摘要
+    source_hash = source.digest
     local_hash = get_content_hash(local_content)
     combined_hash = get_content_hash(source_hash + local_hash)
     
     old_hash = read_hash()
-    force_update = os.environ.get('FORCE_UPDATE', 'false').lower() == 'true'
+    force_update = force if force is not None else os.environ.get('FORCE_UPDATE', 'false').lower() == 'true'
     
     print(f"\n源文件哈希: {source_hash[:16]}...")
     print(f"本地文件哈希: {local_hash[:16]}...")
@@ -165,13 +215,25 @@ def main():
         if not os.path.exists(OUTPUT_FILE):
             print(f"输出文件不存在，生成一份...")
         else:
+            if not source.not_modified:
+                # 记录验证器，下次即可直接命中 304
+                save_state(SOURCE_STATE_FILE, source)
             return False
-    
+
     if force_update:
         print("\n强制更新模式")
     else:
         print("\n检测到变化，开始更新...")
     
+    # 源文件未变化但本地文件变了（或需要补生成输出），没有副本时需要重新下载完整内容
+    if source.content is None:
+        try:
+            source = download_source(conditional=False)
+        except Exception as e:
+            print(f"下载源文件失败: {e}")
+            return False
+    source_content = source.text
+    
     # 解析源文件
     print("\n--- 解析源文件 ---")
     source_map = parse_source_m3u(source_content)
@@ -182,7 +244,9 @@ def main():
     
     # 更新本地文件
     print("\n--- 更新 catchup-source ---")
-    updated_content = update_local_file(local_content, source_map)
+    updated_content, diff = update_local_file(local_content, source_map)
+    print_diff(diff)
+    write_if_changed(DIFF_FILE, json.dumps(diff, ensure_ascii=False, indent=1) + '\n')
     
     # 确保输出目录存在
     output_dir = os.path.dirname(OUTPUT_FILE)
@@ -204,8 +268,9 @@ def main():
         print("警告: 文件写入失败!")
         return False
     
-    # 保存哈希
+    # 保存哈希和源文件的条件请求状态
     save_hash(combined_hash)
+    save_state(SOURCE_STATE_FILE, source)
     
     print("\n" + "=" * 60)
     print("更新完成!")
@@ -217,16 +282,12 @@ def main():
     return True
 
 
-def set_output(name, value):
-    """设置 GitHub Actions 输出变量"""
-    github_output = os.environ.get('GITHUB_OUTPUT')
-    if github_output:
-        with open(github_output, 'a') as f:
-            f.write(f"{name}={value}\n")
-    print(f"设置输出: {name}={value}")
+def run(result=None, force=None):
+    """供 fetch_sources 传入已下载的结果；没有更新不算失败"""
+    if not main(result, force):
+        set_output("updated", "false")
+    return True
 
 
 if __name__ == "__main__":
-    success = main()
-    if not success:
-        set_output("updated", "false")
+    run()
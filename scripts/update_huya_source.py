@@ -1,63 +1,38 @@
 #!/usr/bin/env python3
-import requests
-import hashlib
 import os
-import re
+
+from http_cache import Source, describe_change, fetch_source, save_state
 
 # ==================== 配置 ====================
 SOURCE_URL = "https://raw.githubusercontent.com/ls125781003/tvboxtg/refs/heads/main/%E9%A5%AD%E5%A4%AA%E7%A1%AC/lives/%E8%99%8E%E7%89%99%E4%B8%80%E8%B5%B7%E7%9C%8B.txt"
 OUTPUT_FILE = "custom/custom1.m3u"
-HASH_FILE = ".data/huya_source_hash.txt"
+STATE_FILE = ".data/huya_source.json"
 # ==============================================
 
-def get_content_hash(content):
-    """计算内容的MD5哈希值"""
-    return hashlib.md5(content.encode('utf-8')).hexdigest()
-
-def get_previous_hash():
-    """获取之前保存的源文件哈希值"""
-    if os.path.exists(HASH_FILE):
-        with open(HASH_FILE, 'r', encoding='utf-8') as f:
-            return f.read().strip()
-    return None
-
-def save_current_hash(content):
-    """保存当前源文件的哈希值"""
-    current_hash = get_content_hash(content)
-    os.makedirs(os.path.dirname(HASH_FILE), exist_ok=True)
-    with open(HASH_FILE, 'w', encoding='utf-8') as f:
-        f.write(current_hash)
-    return current_hash
-
-def has_source_changed(content):
-    """检查源文件是否发生变化"""
-    current_hash = get_content_hash(content)
-    previous_hash = get_previous_hash()
-    
-    if previous_hash is None:
-        print("首次运行，没有之前的哈希记录")
-        return True
-    
-    if current_hash == previous_hash:
-        print("虎牙源文件没有变化，跳过处理")
-        return False
-    else:
-        print(f"虎牙源文件发生变化: 旧哈希 {previous_hash[:8]}... -> 新哈希 {current_hash[:8]}...")
-        return True
+SOURCE = Source('huya', SOURCE_URL, STATE_FILE)
 
-def process_huya_source():
-    """主处理流程"""
+def process_huya_source(result=None, force=False):
+    """
+    主处理流程；result 为预先下载好的 FetchResult 时不再重复下载，
+    force=True 时即使源未变化也重新生成
+    """
     try:
         print(f"开始处理虎牙源文件: {SOURCE_URL}")
         
-        # 1. 下载源文件
-        response = requests.get(SOURCE_URL, timeout=30)
-        response.raise_for_status()
-        content = response.text
+        # 1. 下载源文件（带条件请求，未变化时服务器返回 304）
+        if result is None:
+            result = fetch_source(SOURCE)
         
         # 2. 检查源文件是否发生变化
-        if not has_source_changed(content):
+        if force:
+            print("强制重新生成")
+        elif not describe_change(result):
+            if not result.not_modified:
+                save_state(STATE_FILE, result)
             return True # 无变化，视为成功
+        if result.content is None:
+            result = fetch_source(SOURCE, conditional=False)
+        content = result.text
             
         # 3. 【关键修正】筛选和转换内容
         print("开始筛选和转换频道...")
@@ -94,7 +69,7 @@ def process_huya_source():
         print(f"已成功保存到 {OUTPUT_FILE}")
         
         # 5. 更新哈希记录
-        save_current_hash(content)
+        save_state(STATE_FILE, result)
         
         return True
         
@@ -104,6 +79,10 @@ def process_huya_source():
         traceback.print_exc()
         return False
 
+def run(result=None):
+    """供 fetch_sources 传入已下载的结果，返回是否成功"""
+    return process_huya_source(result)
+
 if __name__ == "__main__":
     success = process_huya_source()
     if not success: